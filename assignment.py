@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+
+# === Адресное распределение заявок ===
+# Заявка уходит одному оператору: из тех, кто на смене, выбирается самый
+# свободный (меньше открытых заявок: назначенных и взятых, пока их не
+# закрыли), при равенстве — кто быстрее отвечает.
+# Если за ASSIGN_TIMEOUT никто не взял заявку, она переходит следующему,
+# а когда свободные операторы кончились — рассылается всем остальным.
+# Нагрузка и время ответа считаются по ходу дела, без пересчёта по заявкам.
+
+ASSIGN_TIMEOUT = 60    # сек на реакцию оператора
+EWMA_ALPHA = 0.3       # вес нового замера во времени ответа
+
+
+class Assigner:
+    def __init__(self, operators, timeout: float = ASSIGN_TIMEOUT, on_timeout=None, on_shift=None):
+        self.operators = [int(op_id) for op_id in operators]
+        self.on_shift = set(self.operators if on_shift is None else on_shift)
+        self.timeout = timeout
+        self.on_timeout = on_timeout  # (task_id) — заявку никто не взял; ставит её передачу в очередь заданий
+
+        self.load = {op_id: 0 for op_id in self.operators}
+        self.response_time = {op_id: 0.0 for op_id in self.operators}
+        # task_id -> (operator_id, время назначения, таймер)
+        self.assigned: dict[str, tuple] = {}
+        # task_id -> operator_id: взятые заявки держат нагрузку до выполнения или отказа
+        self.working: dict[str, int] = {}
+
+    # === Смена ===
+    def set_roster(self, operators, on_shift):
+        # Новый состав: нагрузка и время ответа оставшихся операторов сохраняются
+        self.operators = list(operators)
+        self.on_shift = set(on_shift)
+        for op_id in self.operators:
+            self.load.setdefault(op_id, 0)
+            self.response_time.setdefault(op_id, 0.0)
+
+    # === Выбор оператора ===
+    def pick(self, exclude=()) -> int | None:
+        candidates = [op for op in self.operators if op in self.on_shift and op not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda op: (self.load[op], self.response_time[op]))
+
+    def assign(self, task_id: str, op_id: int, delay: float | None = None):
+        self.release(task_id)
+        self.load[op_id] = self.load.get(op_id, 0) + 1
+        timer = asyncio.get_running_loop().call_later(
+            self.timeout if delay is None else delay, self._expired, task_id
+        )
+        self.assigned[task_id] = (op_id, time.monotonic(), timer)
+
+    def release(self, task_id: str) -> tuple | None:
+        # Заявка больше не ждёт назначенного оператора (взята, передана, закрыта)
+        entry = self.assigned.pop(task_id, None)
+        if entry is None:
+            return None
+        op_id, _, timer = entry
+        timer.cancel()
+        self.load[op_id] = max(0, self.load.get(op_id, 0) - 1)
+        return entry
+
+    def claimed(self, task_id: str, op_id: int):
+        entry = self.release(task_id)
+        if entry and entry[0] == op_id:
+            elapsed = time.monotonic() - entry[1]
+            prev = self.response_time.get(op_id, 0.0)
+            self.response_time[op_id] = elapsed if not prev else prev + EWMA_ALPHA * (elapsed - prev)
+        # Взял — значит занят ею, пока не откроет или не откажется
+        if self.working.get(task_id) != op_id:
+            self.finished(task_id)
+            self.working[task_id] = op_id
+            self.load[op_id] = self.load.get(op_id, 0) + 1
+
+    def finished(self, task_id: str):
+        # Заявка выполнена, отклонена, вернулась в ожидание или закрыта — нагрузку снимаем
+        self.release(task_id)
+        op_id = self.working.pop(task_id, None)
+        if op_id is not None:
+            self.load[op_id] = max(0, self.load.get(op_id, 0) - 1)
+
+    def _expired(self, task_id: str):
+        entry = self.assigned.get(task_id)
+        if entry is None:
+            return
+        self.release(task_id)
+        if self.on_timeout:
+            self.on_timeout(task_id)
+
+    def restore(self, store):
+        # После перезапуска снова заводим таймеры для назначенных заявок
+        # и возвращаем нагрузку за взятые
+        for task_id, task in store.oldest("claimed"):
+            op_id = task.get("operator_id")
+            if op_id is not None:
+                self.claimed(task_id, op_id)
+        now = time.time()
+        for task_id, task in store.oldest("pending"):
+            op_id = task.get("assigned_to")
+            if op_id is not None:
+                left = max(0.0, self.timeout - (now - task.get("assigned_at", now)))
+                self.assign(task_id, op_id, delay=left)
+
+
+def assign_settings() -> dict:
+    return {
+        "mode": os.getenv("ASSIGN_MODE", "broadcast"),  # broadcast — всем, targeted — одному
+        "timeout": float(os.getenv("ASSIGN_TIMEOUT", str(ASSIGN_TIMEOUT))),
+    }
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+
+from fake_telegram import FakeTelegram
+from fake_gate import FakeGate
+import tracing
+
+# === Сквозной бенчмарк: заявка -> «Сделано» -> «Спасибо» ===
+# Поднимает заглушку Bot API, запускает настоящий диспетчер gate_bot_rev2
+# через polling и прогоняет M клиентов при N операторах.
+#
+#   python bench_e2e.py --operators 5 --clients 20 --latency-ms 30 --rate-429 0.02
+#
+# Время до уведомления оператора — от попадания обновления в getUpdates до
+# sendMessage последнему оператору; время до подтверждения клиенту — от
+# нажатия «Сделано» до sendMessage клиенту «Ворота ... открыты».
+# С --gate auto операторов нет: подтверждение считается от нажатия клиента
+# и включает ответ заглушки платы реле (--gate-latency-ms).
+
+OPERATOR_BASE = 1000
+CLIENT_BASE = 5000
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def fmt_ms(values):
+    return "p50 {:7.1f}  p95 {:7.1f}  p99 {:7.1f}  max {:7.1f} мс".format(
+        *(percentile(values, p) * 1000 for p in (0.50, 0.95, 0.99)), max(values, default=0) * 1000
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота ворот")
+    parser.add_argument("--operators", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=10, help="одновременных клиентов в раунде")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="задержка ответа Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--board", action="store_true", help="режим табло у операторов (OPERATOR_MODE=board)")
+    parser.add_argument("--targeted", action="store_true", help="адресное назначение (ASSIGN_MODE=targeted)")
+    parser.add_argument("--unlimited", action="store_true",
+                        help="снять лимиты Telegram в исходящей очереди (чистая скорость бота)")
+    parser.add_argument("--gate", choices=("off", "on_done", "auto"), default="off",
+                        help="управление реле через заглушку платы (GATE_MODE)")
+    parser.add_argument("--gate-latency-ms", type=float, default=20.0, help="время ответа платы реле")
+    parser.add_argument("--trace", default="", help="писать трейсы заявок в файл и показать разбивку по фазам")
+    return parser.parse_args()
+
+
+class Timings:
+    def __init__(self):
+        self.notify_first = []
+        self.notify_last = []
+        self.confirm = []
+        self.thanks = []
+        self.failed = 0
+
+
+def notified_predicate(op, mention):
+    # Заявка появилась у оператора: отдельным сообщением или строкой табло
+    def predicate(method, params):
+        return (method in ("sendMessage", "editMessageText") and params["chat_id"] == str(op)
+                and mention in params["text"] and "reply_markup" in params)
+    return predicate
+
+
+def done_button(message, mention):
+    rows = message["reply_markup"]["inline_keyboard"]
+    lines = message["text"].splitlines()
+    if mention in lines[0]:
+        return rows[0][0]["callback_data"]
+    # Табло: первая строка — заголовок, дальше по строке на заявку
+    for row, line in zip(rows, lines[1:]):
+        if mention in line:
+            return row[0]["callback_data"]
+    raise LookupError(mention)
+
+
+def confirmed_predicate(user_id):
+    return lambda m, p: m == "sendMessage" and p["chat_id"] == str(user_id) and "открыты" in p["text"]
+
+
+async def client_flow(fake, g, idx, timings, timeout, targeted=False):
+    user_id = CLIENT_BASE + idx
+    ops = [OPERATOR_BASE + i for i in range(len(g.gates[0].roster.operators))]
+    mention = f"@user{user_id} "
+
+    if g.gates[0].gate_mode == "auto":
+        # Бот открывает сам: нажатие -> «Ворота ... открыты»
+        confirmed = fake.wait_for(confirmed_predicate(user_id))
+        started = time.monotonic()
+        fake.push_message(user_id, g.gates[0].request_texts[0])
+        confirmed_at, _, client_message = await asyncio.wait_for(confirmed, timeout)
+        timings.confirm.append(confirmed_at - started)
+        await thank_flow(fake, user_id, client_message, timings, timeout)
+        return
+
+    # 1. Клиент нажимает «Прошу открыть въезд»
+    notified = [fake.wait_for(notified_predicate(op, mention)) for op in ops]
+    started = time.monotonic()
+    fake.push_message(user_id, g.gates[0].request_texts[0])
+    # При адресном назначении заявку получает один оператор
+    done, pending = await asyncio.wait(
+        notified, timeout=timeout,
+        return_when=asyncio.FIRST_COMPLETED if targeted else asyncio.ALL_COMPLETED
+    )
+    for future in pending:
+        future.cancel()
+    if not done or (pending and not targeted):
+        raise asyncio.TimeoutError()
+    results = {ops[notified.index(f)]: f.result() for f in done}
+    times = [t for t, _, _ in results.values()]
+    timings.notify_first.append(min(times) - started)
+    timings.notify_last.append(max(times) - started)
+
+    # 2. Оператор нажимает «Сделано» на своей копии
+    op_id = ops[idx % len(ops)] if not targeted else next(iter(results))
+    op_message = results[op_id][2]
+    done_data = done_button(op_message, mention)
+    confirmed = fake.wait_for(confirmed_predicate(user_id))
+    started = time.monotonic()
+    fake.push_callback(op_id, done_data, op_message)
+    confirmed_at, _, client_message = await asyncio.wait_for(confirmed, timeout)
+    timings.confirm.append(confirmed_at - started)
+    await thank_flow(fake, user_id, client_message, timings, timeout)
+
+
+async def thank_flow(fake, user_id, client_message, timings, timeout):
+    # 3. Клиент нажимает «Спасибо»
+    thank_data = client_message["reply_markup"]["inline_keyboard"][0][0]["callback_data"]
+    thanked = fake.wait_for(lambda m, p: m == "sendMessage" and p["chat_id"] == str(user_id)
+                            and "выполнена" in p["text"])
+    started = time.monotonic()
+    fake.push_callback(user_id, thank_data, client_message)
+    thanked_at, _, _ = await asyncio.wait_for(thanked, timeout)
+    timings.thanks.append(thanked_at - started)
+
+
+async def run(args):
+    fake = FakeTelegram(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                        rate_429=args.rate_429)
+    url = await fake.start()
+    fake_gate = FakeGate(latency=args.gate_latency_ms / 1000)
+    gate_url = await fake_gate.start()
+
+    # Бот читает настройки при импорте
+    os.environ.update({
+        "BOT_TOKEN": "123456:bench",
+        "TELEGRAM_API_URL": url,
+        "OPERATORS": ",".join(str(OPERATOR_BASE + i) for i in range(args.operators)),
+        "TASK_STORE": "memory",
+        "CATCHUP": "0",
+        "ROSTER_FILE": "",
+        "JOURNAL_DIR": "",
+        "OPERATOR_MODE": "board" if args.board else "messages",
+        "ASSIGN_MODE": "targeted" if args.targeted else "broadcast",
+        "GATE_URL": gate_url,
+        "GATE_MODE": args.gate,
+    })
+    import gate_bot_rev2 as g
+    gate = g.gates[0]
+    from outbox import TokenBucket
+
+    if args.unlimited:
+        gate.outbox.global_lane.bucket = TokenBucket(1e9, 1e9)
+        gate.outbox.edit_lane.bucket = TokenBucket(1e9, 1e9)
+
+    # Задержки вызовов Bot API со стороны бота
+    api_latency = defaultdict(list)
+
+    async def timing_middleware(make_request, bot, method):
+        started = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        finally:
+            api_latency[method.__api_method__].append(time.monotonic() - started)
+
+    g.session.middleware(timing_middleware)
+
+    g.jobs.start()
+    g.scheduler.start()
+    if args.trace:
+        tracing.tracer.open(args.trace)
+    if gate.controller:
+        gate.controller.start()
+    polling = asyncio.create_task(g.dp.start_polling(gate.bot, handle_signals=False, polling_timeout=5,
+                                                       handle_as_tasks=False))
+    timings = Timings()
+    timeout = 30 + args.clients * args.operators / 10
+    try:
+        for _ in range(args.rounds):
+            flows = [client_flow(fake, g, i, timings, timeout, args.targeted) for i in range(args.clients)]
+            for result in await asyncio.gather(*flows, return_exceptions=True):
+                if isinstance(result, BaseException):
+                    timings.failed += 1
+                    print(f"[LOG] Сценарий не завершён: {result!r}", file=sys.stderr)
+        # Дожидаемся хвоста рассылок (уведомления о «Спасибо» идут через лимиты)
+        deadline = time.monotonic() + timeout
+        while (g.scheduler.pending or g.jobs.pending or gate.outbox.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        await g.dp.stop_polling()
+        await polling
+        await g.scheduler.close()
+        await g.jobs.close()
+        await tracing.tracer.close()
+        await gate.cleaner.close()
+        if gate.controller:
+            await gate.controller.close()
+        await fake_gate.stop()
+        await fake.stop()
+
+    flows_done = args.rounds * args.clients - timings.failed
+    print(f"\nОператоров: {args.operators}, клиентов: {args.clients} x {args.rounds} раундов, "
+          f"задержка API {args.latency_ms}±{args.jitter_ms} мс, 429: {args.rate_429:.0%}"
+          f"{', без лимитов' if args.unlimited else ''}{', табло' if args.board else ''}"
+          f"{', адресно' if args.targeted else ''}{', реле: ' + args.gate if gate.controller else ''}")
+    print(f"Завершено сценариев: {flows_done}, не завершено: {timings.failed}\n")
+    print(f"До первого оператора:     {fmt_ms(timings.notify_first)}")
+    print(f"До последнего оператора:  {fmt_ms(timings.notify_last)}")
+    print(f"До подтверждения клиенту: {fmt_ms(timings.confirm)}")
+    print(f"«Спасибо» -> ответ:       {fmt_ms(timings.thanks)}")
+
+    print("\nВызовы Bot API (задержка со стороны бота):")
+    for method in ("getUpdates", "sendMessage", "editMessageText", "deleteMessage",
+                   "deleteMessages", "answerCallbackQuery"):
+        if api_latency.get(method):
+            print(f"  {method:20} n={len(api_latency[method]):5}  {fmt_ms(api_latency[method])}")
+
+    print("\nВызовов на один сценарий:")
+    for method, count in sorted(fake.calls_by_method.items()):
+        if method not in ("getUpdates", "getMe") and flows_done:
+            print(f"  {method:20} {count / flows_done:6.2f}")
+    print(f"  {'ответов 429':20} {fake.throttled}")
+    print(f"  исходящая очередь: {gate.outbox.stats()}")
+    print(f"  планировщик обновлений: {g.scheduler.stats(top=3)}")
+    if gate.controller:
+        print(f"  контроллер ворот: {gate.controller.stats()}, импульсов на плате: {len(fake_gate.pulses)}")
+    if args.trace:
+        print(f"\nТрейсы ({args.trace}, записано спанов: {tracing.tracer.written}):")
+        tracing.report([args.trace], top=3)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.filters import Command
+from aiogram.types import Update, Message, Chat, User
+
+from gate_config import DEFAULT_DIRECTIONS
+from intents import IntentRouter, intent_is, normalize, REQUEST, DONE, THANKS, DONE_ALIASES, THANKS_ALIASES
+
+# === Бенчмарк разбора текста ===
+# Сколько стоит доставка текстового апдейта до хендлера в диспетчере aiogram:
+#   filters — прежняя схема: цепочка F.text.in_ на каждое действие,
+#             каждый апдейт проверяется фильтрами по очереди;
+#   router  — текст разбирается один раз в middleware (IntentRouter),
+#             хендлеры сравнивают готовое намерение.
+# Хендлеры пустые и Bot API не вызывают — меряется только диспетчеризация.
+#
+#   python bench_router.py --updates 20000
+
+COMMANDS = ("start", "id", "help", "sendstats", "gate", "rules", "my", ("shift_on", "shift_off"))
+SAMPLES = {
+    "кнопка": "Прошу открыть въезд 🚗",
+    "цифра": "2",
+    "синоним": "Спасибо!",
+    "старая кнопка": "Прошу открыть ворота ВЪЕЗД 🚗",
+    "непонятный": "когда откроют?",
+}
+
+
+def make_update(update_id: int, text: str) -> Update:
+    user = User(id=5000 + update_id % 100, is_bot=False, first_name="bench")
+    chat = Chat(id=user.id, type="private")
+    return Update(update_id=update_id,
+                  message=Message(message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text=text))
+
+
+def add_commands(dp: Dispatcher, hits: dict):
+    for command in COMMANDS:
+        names = command if isinstance(command, tuple) else (command,)
+        dp.message.register(counter(hits, names[0]), Command(*names))
+
+
+def counter(hits: dict, name: str):
+    async def handler(message):
+        hits[name] = hits.get(name, 0) + 1
+    return handler
+
+
+def filters_dispatcher(hits: dict) -> Dispatcher:
+    dp = Dispatcher()
+    add_commands(dp, hits)
+    requests = [*DEFAULT_DIRECTIONS, "Прошу открыть ворота ВЪЕЗД 🚗", "🚗 Прошу открыть ворота ВЫЕЗД", "1", "2"]
+    dp.message.register(counter(hits, REQUEST), F.text.in_(requests))
+    dp.message.register(counter(hits, DONE), F.text.in_(DONE_ALIASES))
+    dp.message.register(counter(hits, THANKS), F.text.in_(THANKS_ALIASES))
+    dp.message.register(counter(hits, "unknown"), F.text)
+    return dp
+
+
+def router_dispatcher(hits: dict) -> Dispatcher:
+    dp = Dispatcher()
+    router = IntentRouter(DEFAULT_DIRECTIONS)
+
+    async def intent_middleware(handler, event, data):
+        data["intent"] = router.resolve(event.text)
+        return await handler(event, data)
+    dp.message.outer_middleware(intent_middleware)
+    add_commands(dp, hits)
+    dp.message.register(counter(hits, REQUEST), intent_is(REQUEST))
+    dp.message.register(counter(hits, DONE), intent_is(DONE))
+    dp.message.register(counter(hits, THANKS), intent_is(THANKS))
+    dp.message.register(counter(hits, "unknown"), F.text)
+    return dp
+
+
+async def measure(dp: Dispatcher, bot: Bot, text: str, n: int) -> float:
+    updates = [make_update(i, text) for i in range(n)]
+    await dp.feed_update(bot, updates[0])  # прогрев
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def measure_resolve(router: IntentRouter, text: str, n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        router.resolve(text)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def run(args):
+    bot = Bot(token="42:BENCH")  # сеть не используется
+    router = IntentRouter(DEFAULT_DIRECTIONS)
+    hits_old, hits_new = {}, {}
+    old, new = filters_dispatcher(hits_old), router_dispatcher(hits_new)
+
+    print(f"{'текст':<16}{'намерение':<12}{'filters, мкс':>14}{'router, мкс':>14}{'resolve, мкс':>14}")
+    for label, text in SAMPLES.items():
+        intent = router.resolve(text)
+        t_old = await measure(old, bot, text, args.updates)
+        t_new = await measure(new, bot, text, args.updates)
+        t_resolve = measure_resolve(router, text, args.updates * 10)
+        print(f"{label:<16}{intent.action if intent else '—':<12}{t_old:>14.1f}{t_new:>14.1f}{t_resolve:>14.2f}")
+    print(f"нормализованных ключей в таблице: {len(router.table)}, пример: {normalize(SAMPLES['синоним'])!r}")
+    print(f"filters: {hits_old}")
+    print(f"router:  {hits_new}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора текста в намерение")
+    parser.add_argument("--updates", type=int, default=10000, help="апдейтов на каждый текст")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+import uuid
+
+from callbacks import CallbackCodec, task_ref
+from task_store import MemoryTaskStore, _index_add
+
+# === Бенчмарк записи заявки и callback_data ===
+# N открытых заявок в двух представлениях:
+#   dict   — прежнее: заявка — dict, id — uuid4-строка, кнопки "done:<uuid>",
+#            разбор — split(":");
+#   record — Task на __slots__, целый id из next_id(), кнопки "d<base36><подпись>",
+#            разбор — CallbackCodec.decode с проверкой подписи.
+# Поля у заявок одинаковые (как после рассылки операторам), индексы хранилища
+# тоже: разница — только в записи и id.
+#
+#   python bench_tasks.py --tasks 100000
+
+OPERATORS = (1000, 1001, 1002)
+DIRECTIONS = ("въезд", "выезд")
+
+
+def fields(n: int) -> dict:
+    user_id = 5000 + n
+    return {
+        "user_id": user_id,
+        "user_name": f"user{user_id}",
+        "direction": DIRECTIONS[n % 2],
+        "user_msg_id": n + 1,
+        "operator_msgs": [[op, n + 1] for op in OPERATORS],
+        "trace_id": uuid.uuid4().hex,
+        "created_at": time.time(),
+        "state": "pending",
+        "state_at": time.time(),
+    }
+
+
+class DictStore:
+    # Прежний MemoryTaskStore: те же индексы, заявка — dict, id — uuid
+    def __init__(self):
+        self.tasks = {}
+        self.by_user = {}
+        self.by_state = {}
+
+    def create(self, task_id, task: dict):
+        self.tasks[task_id] = task
+        _index_add(self.by_user, task["user_id"], task_id)
+        _index_add(self.by_state, task["state"], task_id)
+
+
+def build(kind: str, n: int):
+    if kind == "dict":
+        store = DictStore()
+        for i in range(n):
+            store.create(str(uuid.uuid4()), fields(i))
+    else:
+        store = MemoryTaskStore()
+
+        async def fill():
+            for i in range(n):
+                await store.create(await store.next_id(), fields(i))
+        asyncio.run(fill())
+    return store
+
+
+def measure_memory(kind: str, n: int) -> float:
+    # Байт на открытую заявку: запись, id, поля и место в индексах
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build(kind, n)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del store
+    return used / n
+
+
+def best(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        func()
+        times.append(time.perf_counter_ns() - started)
+    return min(times)
+
+
+def measure_callbacks(kind: str, n: int, repeat: int) -> dict:
+    # Нс на кнопку: кодирование, ключ планировщика, разбор и поиск заявки
+    store = build(kind, n)
+    ids = list(store.tasks)
+    get = store.tasks.get
+    if kind == "dict":
+        encode = lambda: [f"done:{task_id}" for task_id in ids]  # noqa: E731
+        datas = encode()
+
+        def ref():
+            for data in datas:
+                data.split(":", 1)[1]
+
+        def parse():
+            for data in datas:
+                action, task_id = data.split(":")
+                get(task_id)
+    else:
+        codec = CallbackCodec("123456:bench", store.key_salt)
+        encode = lambda: [codec.encode("done", task_id) for task_id in ids]  # noqa: E731
+        datas = encode()
+        decode = codec.decode
+
+        def ref():
+            for data in datas:
+                task_ref(data)
+
+        def parse():
+            for data in datas:
+                action, task_id = decode(data)
+                get(task_id)
+    found = sum(1 for data in datas if (data.split(":")[1] if kind == "dict" else codec.decode(data)[1]) in store.tasks)
+    assert found == n, f"{kind}: разобрано {found} из {n}"
+    return {
+        "encode": best(encode, repeat) / n,
+        "ref": best(ref, repeat) / n,
+        "parse": best(parse, repeat) / n,
+        "length": sum(map(len, datas)) / n,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на заявку и разбор callback_data: dict+uuid против Task+int")
+    parser.add_argument("--tasks", type=int, default=100_000, help="открытых заявок")
+    parser.add_argument("--repeat", type=int, default=5, help="прогонов разбора, берётся лучший")
+    args = parser.parse_args()
+
+    print(f"Открытых заявок: {args.tasks}\n")
+    print(f"{'':<8}{'Б/заявку':>10}{'data, симв.':>13}{'кодир., нс':>12}{'ключ, нс':>10}{'разбор, нс':>12}")
+    results = {}
+    for kind in ("dict", "record"):
+        memory = measure_memory(kind, args.tasks)
+        calls = measure_callbacks(kind, args.tasks, args.repeat)
+        results[kind] = memory, calls
+        print(f"{kind:<8}{memory:>10.0f}{calls['length']:>13.1f}{calls['encode']:>12.0f}"
+              f"{calls['ref']:>10.0f}{calls['parse']:>12.0f}")
+    saved = results["dict"][0] - results["record"][0]
+    print(f"\nЭкономия: {saved:.0f} Б на заявку, {saved * args.tasks / 2 ** 20:.1f} МБ на {args.tasks} заявок")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe
+from aiogram.types import Update, Message, CallbackQuery, Chat, User
+
+# === Стоимость одного обновления: CPU и память по типам ===
+# Синтетические Update идут через настоящий диспетчер gate_bot_rev2 (все
+# middleware, планировщик, хендлеры, фоновые задания), а Bot API заменён
+# MockSession: ответ собирается и разбирается так же, как настоящий, но без
+# сети и лимитов. После каждого обновления ждём, пока планировщик и фоновые
+# задания опустеют, — в цену обновления входит всё, что оно запустило
+# (кроме отложенного удаления сообщений).
+#
+#   python bench_updates.py --iterations 2000
+#   python bench_updates.py --profile cprofile --seconds 10   # тот же профиль, что /profile
+#
+# Первый проход меряет CPU (process_time) без tracemalloc, второй — память:
+# «пик» — сколько памяти понадобилось на обновление сверх начального,
+# «осталось» — сколько не освободилось после него (заявка, очереди, кэши).
+
+OPERATOR_BASE = 1000
+CLIENT_BASE = 5000
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "GateBot", "username": "gate_bot"}
+TYPES = ("request", "done", "thank", "help", "unknown")
+
+
+class MockSession(BaseSession):
+    # Bot API без сети: JSON ответа разбирается штатным check_response
+    def __init__(self):
+        super().__init__()
+        self.message_ids = itertools.count(1)
+        self.calls: Counter = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[method.__api_method__] += 1
+        result = self.result(method)
+        return self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result})).result
+
+    def result(self, method):
+        if isinstance(method, GetMe):
+            return BOT_USER
+        chat_id = getattr(method, "chat_id", None)
+        text = getattr(method, "text", None)
+        if method.__api_method__ in ("sendMessage", "editMessageText") and chat_id is not None:
+            return {"message_id": getattr(method, "message_id", None) or next(self.message_ids),
+                    "date": int(time.time()), "chat": {"id": int(chat_id), "type": "private"},
+                    "from": BOT_USER, "text": text}
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class Driver:
+    def __init__(self, g, operators: int):
+        self.g = g
+        self.gate = g.gates[0]
+        self.bot = self.gate.bot
+        self.operators = operators
+        self.update_ids = itertools.count(1)
+        self.clients = itertools.count(CLIENT_BASE)
+        self.operator_msg_id = itertools.count(1)
+
+    def message(self, user_id: int, text: str) -> Update:
+        user = User(id=user_id, is_bot=False, first_name=f"user{user_id}", username=f"user{user_id}")
+        chat = Chat(id=user_id, type="private")
+        update_id = next(self.update_ids)
+        return Update(update_id=update_id, message=Message(message_id=update_id, date=datetime.now(),
+                                                           chat=chat, from_user=user, text=text))
+
+    def callback(self, user_id: int, data: str) -> Update:
+        user = User(id=user_id, is_bot=False, first_name=f"user{user_id}", username=f"user{user_id}")
+        message = Message(message_id=next(self.operator_msg_id), date=datetime.now(),
+                          chat=Chat(id=user_id, type="private"), text="…")
+        update_id = next(self.update_ids)
+        return Update(update_id=update_id, callback_query=CallbackQuery(
+            id=str(update_id), from_user=user, chat_instance="bench", message=message, data=data))
+
+    async def feed(self, update: Update):
+        await self.g.dp.feed_update(self.bot, update)
+        await self.g.scheduler.wait_idle()
+        await self.g.jobs.wait_idle()
+
+    async def scenario(self, measure):
+        # Заявка -> «Сделано» -> «Спасибо» и два сообщения без заявки; у каждого
+        # прогона свой клиент (иначе сработает ограничение частоты запросов)
+        user_id = next(self.clients)
+        operator_id = OPERATOR_BASE + user_id % self.operators
+        await measure("request", self.message(user_id, "1"))
+        task_id = self.gate.tasks.latest_for_user(user_id)
+        callbacks = self.gate.callbacks
+        await measure("done", self.callback(operator_id, callbacks.encode("done", task_id)))
+        await measure("thank", self.callback(user_id, callbacks.encode("thank", task_id)))
+        await measure("help", self.message(user_id, "/help"))
+        await measure("unknown", self.message(user_id, "когда откроют?"))
+
+
+async def measure_cpu(driver: Driver, iterations: int) -> dict:
+    cpu = defaultdict(int)
+    wall = defaultdict(int)
+    count = Counter()
+
+    async def measure(kind, update):
+        started_cpu = time.process_time_ns()
+        started = time.perf_counter_ns()
+        await driver.feed(update)
+        cpu[kind] += time.process_time_ns() - started_cpu
+        wall[kind] += time.perf_counter_ns() - started
+        count[kind] += 1
+
+    for _ in range(iterations):
+        await driver.scenario(measure)
+    return {kind: (cpu[kind] / count[kind] / 1000, wall[kind] / count[kind] / 1000) for kind in count}
+
+
+async def measure_memory(driver: Driver, iterations: int) -> dict:
+    peak = defaultdict(int)
+    retained = defaultdict(int)
+    count = Counter()
+
+    async def measure(kind, update):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await driver.feed(update)
+        current, top = tracemalloc.get_traced_memory()
+        peak[kind] += top - before
+        retained[kind] += current - before
+        count[kind] += 1
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            await driver.scenario(measure)
+    finally:
+        tracemalloc.stop()
+    return {kind: (peak[kind] / count[kind], retained[kind] / count[kind]) for kind in count}
+
+
+def setup_bot(operators: int):
+    # Бот читает настройки при импорте
+    os.environ.update({
+        "BOT_TOKEN": "123456:bench",
+        "OPERATORS": ",".join(str(OPERATOR_BASE + i) for i in range(operators)),
+        "ADMIN_ID": str(OPERATOR_BASE),
+        "TASK_STORE": "memory",
+        "CATCHUP": "0",
+        "ROSTER_FILE": "",
+        "JOURNAL_DIR": "",
+        "GATE_URL": "",
+        "OPERATOR_MODE": "messages",
+        "ASSIGN_MODE": "broadcast",
+        "CLEANUP_DELAY": "3600",  # удаление сообщений не меряем
+    })
+    os.environ.pop("TELEGRAM_API_URL", None)
+    import gate_bot_rev2 as g
+    from outbox import TokenBucket
+    session = MockSession()
+    for gate in g.gates:
+        gate.bot.session = session
+        gate.outbox.global_lane.bucket = TokenBucket(1e9, 1e9)
+        gate.outbox.edit_lane.bucket = TokenBucket(1e9, 1e9)
+    return g, session
+
+
+async def run(args):
+    g, session = setup_bot(args.operators)
+    g.jobs.start()
+    g.scheduler.start()
+    driver = Driver(g, args.operators)
+    try:
+        for _ in range(min(50, args.iterations)):  # прогрев: импорты, кэши pydantic
+            await driver.scenario(driver_feed(driver))
+
+        if args.profile:
+            g.profiler.attach(g.dp, g.Gate)
+            g.profiler.start(args.seconds, args.profile)
+            rounds = 0
+            while g.profiler.running:
+                await driver.scenario(driver_feed(driver))
+                rounds += 1
+            print(f"Сценариев за окно: {rounds}")
+            return
+
+        cpu = await measure_cpu(driver, args.iterations)
+        memory = await measure_memory(driver, args.iterations)
+    finally:
+        await g.scheduler.close()
+        await g.jobs.close()
+        await g.gates[0].cleaner.close()
+
+    print(f"Обновлений каждого типа: {args.iterations}, операторов: {args.operators}\n")
+    print(f"{'тип':<10}{'CPU, мкс':>10}{'время, мкс':>12}{'пик, КБ':>10}{'осталось, Б':>13}")
+    for kind in TYPES:
+        cpu_us, wall_us = cpu[kind]
+        peak, retained = memory[kind]
+        print(f"{kind:<10}{cpu_us:>10.0f}{wall_us:>12.0f}{peak / 1024:>10.1f}{retained:>13.0f}")
+    calls = sum(session.calls.values())
+    print(f"\nВызовов Bot API на сценарий: {calls / (2 * args.iterations + min(50, args.iterations)):.1f} "
+          f"({dict(session.calls)})")
+
+
+def driver_feed(driver: Driver):
+    async def feed(kind, update):
+        await driver.feed(update)
+    return feed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU и память на одно обновление по типам")
+    parser.add_argument("--iterations", type=int, default=1000, help="сценариев (по обновлению каждого типа)")
+    parser.add_argument("--operators", type=int, default=3)
+    parser.add_argument("--profile", choices=("sample", "cprofile"), default="",
+                        help="вместо замеров — окно профилировщика под нагрузкой сценариев")
+    parser.add_argument("--seconds", type=float, default=10, help="длина окна для --profile")
+    asyncio.run(run(parser.parse_args()))
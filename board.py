@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from outbox import URGENT
+
+# === Табло заявок для операторов ===
+# Вместо отдельного сообщения на каждую заявку у каждого оператора одно
+# закреплённое сообщение со списком ожидающих заявок и кнопками к каждой.
+# Изменения копятся DEBOUNCE секунд и уходят одним editMessageText на
+# оператора: 20 заявок за секунду — это одна правка, а не 20 сообщений.
+# Правки приходят без уведомления, поэтому, когда табло было пустым и в нём
+# появилась заявка, оператору отправляется новое табло (со звуком).
+
+BOARD_DEBOUNCE = 0.5   # сек
+BOARD_MAX_ROWS = 20    # больше строк не показываем (лимит кнопок и длины текста)
+
+
+class QueueBoard:
+    def __init__(self, bot: Bot, outbox, store, operators, callbacks, debounce: float = BOARD_DEBOUNCE):
+        self.bot = bot
+        self.outbox = outbox
+        self.store = store
+        self.callbacks = callbacks  # CallbackCodec: callback_data кнопок
+        self.operators = [int(op_id) for op_id in operators]
+        self.debounce = debounce
+
+        self.messages: dict[int, int] = {}  # operator_id -> message_id табло
+        self.last_text: dict[int, str] = {}
+        self.was_empty = True
+        self.renotify = False
+        self.scheduled: asyncio.TimerHandle | None = None
+        self.flushing: asyncio.Task | None = None
+
+        self.edits = 0
+        self.sends = 0
+
+    def set_operators(self, operators):
+        # Новый состав смены: ушедшим табло больше не обновляем
+        self.operators = [int(op_id) for op_id in operators]
+        for op_id in [op for op in self.messages if op not in self.operators]:
+            del self.messages[op_id]
+            self.last_text.pop(op_id, None)
+        self.mark_dirty()
+
+    # === Планирование ===
+    def mark_dirty(self, renotify: bool = False):
+        # Можно звать сколько угодно раз подряд — обновление будет одно
+        self.renotify = self.renotify or renotify
+        if self.scheduled is None:
+            loop = asyncio.get_running_loop()
+            self.scheduled = loop.call_later(self.debounce, self._start_flush)
+
+    def _start_flush(self):
+        self.scheduled = None
+        if self.flushing and not self.flushing.done():
+            # Предыдущее обновление ещё идёт — попробуем после него
+            self.flushing.add_done_callback(lambda _: self.mark_dirty())
+            return
+        self.flushing = asyncio.create_task(self.flush())
+
+    # === Отрисовка ===
+    def render(self):
+        pending = list(self.store.oldest("pending"))
+        if not pending:
+            return "[ОПЕРАТОР] 📋 Заявок нет.", None, 0
+        now = time.time()
+        lines = [f"[ОПЕРАТОР] 📋 Ожидают: {len(pending)}"]
+        rows = []
+        for n, (task_id, task) in enumerate(pending[:BOARD_MAX_ROWS], 1):
+            waited = int((now - task["created_at"]) // 60)
+            repeats = f", нажал ещё {task['repeats']} раз" if task.get("repeats") else ""
+            lines.append(f"{n}. @{task['user_name']} — {task['direction']} ({waited} мин{repeats})")
+            rows.append([
+                InlineKeyboardButton(text=f"✅ {n}. {task['direction']}", callback_data=self.callbacks.encode("done", task_id)),
+                InlineKeyboardButton(text=f"❌ {n}", callback_data=self.callbacks.encode("ignore", task_id)),
+            ])
+        if len(pending) > BOARD_MAX_ROWS:
+            lines.append(f"… и ещё {len(pending) - BOARD_MAX_ROWS}")
+        return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=rows), len(pending)
+
+    # === Отправка ===
+    async def flush(self):
+        text, kb, count = self.render()
+        fresh = self.renotify or (self.was_empty and count > 0)
+        self.was_empty = count == 0
+        self.renotify = False
+        await asyncio.gather(*(self._update(op_id, text, kb, fresh) for op_id in self.operators))
+
+    async def _update(self, op_id: int, text: str, kb, fresh: bool):
+        msg_id = self.messages.get(op_id)
+        if msg_id is None and kb is None:
+            return  # пустое табло впервые не отправляем
+        if msg_id and not fresh:
+            if self.last_text.get(op_id) == text:
+                return
+            if await self.outbox.call(op_id, self._edit, op_id, msg_id, text, kb, priority=URGENT):
+                self.last_text[op_id] = text
+                return
+            # Табло удалили вручную (или правка не прошла) — отправим новое
+        sent = await self.outbox.send(op_id, text, URGENT, reply_markup=kb)
+        if sent is None:
+            return
+        self.sends += 1
+        self.messages[op_id] = sent.message_id
+        self.last_text[op_id] = text
+        await self.outbox.call(op_id, self.bot.pin_chat_message, chat_id=op_id,
+                               message_id=sent.message_id, disable_notification=True)
+        if msg_id:
+            await self.outbox.call(op_id, self.bot.delete_message, chat_id=op_id, message_id=msg_id)
+
+    async def _edit(self, op_id: int, msg_id: int, text: str, kb) -> bool:
+        try:
+            await self.bot.edit_message_text(text=text, chat_id=op_id, message_id=msg_id, reply_markup=kb)
+            self.edits += 1
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                raise
+        return True
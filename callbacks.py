@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+from binascii import b2a_base64
+
+# === callback_data кнопок заявки ===
+# Было "done:<uuid>" — 41 символ и split(":") на каждое нажатие. Теперь
+# одна буква действия, id заявки в base36 и подпись:
+#
+#   d1z3kQm9vXa  — «Сделано» по заявке 71 ("1z"), 8 символов подписи
+#
+# id заявок идут подряд, и без подписи любой клиент мог бы подставить
+# чужой номер в «Спасибо» (её вправе нажать кто угодно). Подпись — 6 байт
+# BLAKE2s с ключом от токена бота (и солью хранилища, см. task_store), в
+# base64: подделать кнопку, не зная токена, нельзя, а кнопки другого бота
+# или от прошлого запуска с хранилищем в памяти не проходят проверку.
+# Старые "done:<uuid>" с кнопок до обновления по-прежнему принимаются.
+
+ACTIONS = {"done": "d", "ignore": "i", "thank": "t"}
+CODES = {code: action for action, code in ACTIONS.items()}
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+SIGNATURE_BYTES = 6
+SIGNATURE_CHARS = 8   # base64 от 6 байт, без "="
+LEGACY_ID_LENGTH = 36  # uuid4
+
+
+def base36(n: int) -> str:
+    # Обратное — int(s, 36), оно на C
+    if n < 36:
+        return DIGITS[n]
+    digits = []
+    while n:
+        n, rest = divmod(n, 36)
+        digits.append(DIGITS[rest])
+    return "".join(reversed(digits))
+
+
+def task_ref(data: str | None) -> str | None:
+    # Заявка из callback_data как есть, без проверки подписи и разбора id —
+    # ключ очереди в планировщике; None — кнопка не заявки
+    if not data:
+        return None
+    if ":" in data:
+        return data.partition(":")[2]
+    return data[1:-SIGNATURE_CHARS] if data[0] in CODES and len(data) > SIGNATURE_CHARS + 1 else None
+
+
+class CallbackCodec:
+    def __init__(self, secret: str, salt: bytes = b""):
+        key = hashlib.blake2s(secret.encode() + salt).digest()
+        # Хэш с ключом готовим один раз; на каждую подпись — только copy()
+        self.keyed = hashlib.blake2s(key=key, digest_size=SIGNATURE_BYTES)
+
+    def sign(self, body: str) -> str:
+        h = self.keyed.copy()
+        h.update(body.encode())
+        return b2a_base64(h.digest(), newline=False).decode()
+
+    def encode(self, action: str, task_id) -> str:
+        if isinstance(task_id, str):
+            return f"{action}:{task_id}"  # заявка со старым uuid
+        body = ACTIONS[action] + base36(task_id)
+        return body + self.sign(body)
+
+    def decode(self, data: str | None) -> tuple[str, int | str] | None:
+        # (действие, id заявки) или None, если кнопка не наша
+        if not data:
+            return None
+        if ":" in data:
+            action, _, task_id = data.partition(":")
+            if action in ACTIONS and len(task_id) == LEGACY_ID_LENGTH:
+                return action, task_id
+            return None
+        action = CODES.get(data[0])
+        body = data[:-SIGNATURE_CHARS]
+        if action is None or len(body) < 2 or not hmac.compare_digest(data[-SIGNATURE_CHARS:], self.sign(body)):
+            return None
+        return action, int(body[1:], 36)
+
+
+def callback_is(*actions: str):
+    # Фильтр хендлера: data разбирается и проверяется один раз, хендлер
+    # получает готовые action и task_id.
+    # Асинхронный намеренно: синхронные фильтры aiogram выполняет через to_thread
+    async def check(callback, gate) -> dict | bool:
+        parsed = gate.callbacks.decode(callback.data)
+        if parsed is None or parsed[0] not in actions:
+            return False
+        return {"action": parsed[0], "task_id": parsed[1]}
+    return check
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+# === Надёжный старт без потери обновлений ===
+# Вместо skip_updates=True бот помнит, какие обновления уже обработаны
+# (offset.json), а при запуске дочитывает всё, что накопилось, пачками.
+# Старые сообщения отбрасываются, повторные одинаковые запросы одного
+# клиента схлопываются в один.
+
+CATCHUP_BATCH = 100        # максимум, который отдаёт getUpdates за раз
+CATCHUP_MAX_AGE = 600      # сек; более старые сообщения не обрабатываем
+OFFSET_FLUSH_INTERVAL = 1  # сек, как часто записываем offset.json
+
+
+class OffsetStore:
+    # offset — все обновления с update_id <= offset обработаны.
+    # done — обработанные id выше offset (обновления идут параллельно
+    # и завершаются не по порядку).
+    # Файл переписывается не на каждое обновление, а раз в flush_interval
+    # и при остановке, в отдельном потоке: после падения повторно придут
+    # не больше чем обновления за последний интервал.
+
+    def __init__(self, path: str, flush_interval: float = OFFSET_FLUSH_INTERVAL):
+        self.path = path
+        self.offset = 0
+        self.done: set[int] = set()
+        self.in_flight: set[int] = set()
+        self.flush_interval = flush_interval
+        self.dirty = False
+        self.write_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.writer: asyncio.Task | None = None
+        self.closing = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[LOG] Не удалось прочитать {self.path}: {e}")
+            return
+        self.offset = data.get("offset", 0)
+        self.done = set(data.get("done", ()))
+
+    def _save(self, data: dict):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    async def flush(self):
+        # Снимок берём в цикле событий, пишем в потоке; записи не пересекаются
+        async with self.write_lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            data = {"offset": self.offset, "done": sorted(self.done)}
+            try:
+                await asyncio.to_thread(self._save, data)
+            except OSError as e:
+                print(f"[LOG] Не удалось записать {self.path}: {e}")
+                self.dirty = True
+
+    async def _writer_loop(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._writer_loop())
+
+    async def close(self):
+        # Даём писателю закончить текущую запись, затем сохраняем последнее
+        self.closing = True
+        self.wakeup.set()
+        if self.writer:
+            await self.writer
+            self.writer = None
+        await self.flush()
+
+    def seen(self, update_id: int) -> bool:
+        return update_id <= self.offset or update_id in self.done or update_id in self.in_flight
+
+    def begin(self, update_id: int):
+        self.in_flight.add(update_id)
+
+    def finish(self, update_id: int):
+        self.in_flight.discard(update_id)
+        self.done.add(update_id)
+        # Сдвигаем offset, пока за ним нет дыр из ещё не завершённых обновлений
+        limit = min(self.in_flight) if self.in_flight else None
+        while self.offset + 1 in self.done and (limit is None or self.offset + 1 < limit):
+            self.offset += 1
+            self.done.discard(self.offset)
+        if not self.in_flight and self.done:
+            # Обновления до max(done) могли не дойти до нас совсем (отфильтрованы
+            # Telegram по allowed_updates) — раз ничего не обрабатывается, их нет
+            self.offset = max(self.offset, max(self.done))
+            self.done.clear()
+        self.dirty = True
+
+    def advance(self, update_id: int):
+        if update_id > self.offset and not self.in_flight:
+            self.offset = update_id
+            self.done = {i for i in self.done if i > update_id}
+            self.dirty = True
+
+
+def _message_age(update: Update, now: float) -> float:
+    message = update.message or update.edited_message
+    if message is None:
+        return 0.0
+    return now - message.date.timestamp()
+
+
+async def drain_backlog(bot: Bot, dp: Dispatcher, offsets: OffsetStore,
+                        collapse_key: Callable[[Update], Any] | None = None,
+                        max_age: float = CATCHUP_MAX_AGE, batch_size: int = CATCHUP_BATCH,
+                        settle: Callable[[], Awaitable[Any]] | None = None) -> int:
+    # Дочитывает накопившиеся обновления до запуска polling.
+    # Каждая пачка обрабатывается до запроса следующей: getUpdates с новым
+    # offset подтверждает Telegram предыдущие, и при падении посередине
+    # необработанное не потеряется. Если feed_update только ставит обновление
+    # в очередь (планировщик), settle дожидается, пока очередь разберут.
+    allowed = dp.resolve_used_update_types()
+    seen_keys = set()
+    processed = 0
+    while True:
+        updates = await bot.get_updates(
+            offset=offsets.offset + 1, limit=batch_size, timeout=0, allowed_updates=allowed
+        )
+        if not updates:
+            break
+        now = time.time()
+
+        # Из одинаковых запросов в пачке оставляем последний
+        latest = {}
+        if collapse_key:
+            for update in updates:
+                key = collapse_key(update)
+                if key is not None:
+                    latest[key] = update.update_id
+
+        for update in updates:
+            if offsets.seen(update.update_id):
+                continue
+            key = collapse_key(update) if collapse_key else None
+            stale = _message_age(update, now) > max_age
+            duplicate = key is not None and (latest[key] != update.update_id or key in seen_keys)
+            if stale or duplicate:
+                offsets.begin(update.update_id)
+                offsets.finish(update.update_id)
+                continue
+            if key is not None:
+                seen_keys.add(key)
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                print(f"[LOG] Ошибка обработки обновления {update.update_id}: {e}")
+            processed += 1
+        if settle:
+            await settle()
+        # Пачка разобрана целиком (в том числе обработанные до перезапуска) —
+        # следующий getUpdates подтвердит её в Telegram
+        offsets.advance(updates[-1].update_id)
+        await offsets.flush()
+    print(f"[LOG] Дочитано накопившихся обновлений: {processed}")
+    return processed
+
+
+def catchup_settings() -> dict:
+    return {
+        "enabled": os.getenv("CATCHUP", "0") == "1",
+        "offset_file": os.getenv("OFFSET_FILE", "offset.json"),
+        "max_age": float(os.getenv("CATCHUP_MAX_AGE", str(CATCHUP_MAX_AGE))),
+    }
@@ -0,0 +1,97 @@
+import asyncio
+import os
+
+from aiogram import Bot
+
+import metrics
+
+# === Уборка сообщений закрытых заявок ===
+# Вместо deleteMessage на каждое сообщение id копятся по чатам и удаляются
+# пачками через deleteMessages (до 100 id за вызов, одиночный id — тоже им).
+# Чат убирается через CLEANUP_DELAY секунд после первого id в нём: в пачку
+# попадают сообщения всех заявок этого чата, закрытых за это время (у
+# оператора — копии каждой заявки), а в час пик обработка апдейтов не ждёт удалений. Удаления не
+# тратят лимит сообщений чата (см. outbox.py).
+
+CLEANUP_DELAY = 5.0       # сек
+DELETE_BATCH = 100        # лимит deleteMessages
+
+deleted_total = metrics.registry.counter("gate_messages_deleted_total", "Удалённые сообщения бота", ("gate",))
+
+
+class MessageCleaner:
+    def __init__(self, bot: Bot, outbox, delay: float = CLEANUP_DELAY, name: str = ""):
+        self.bot = bot
+        self.name = name  # метка ворот в метриках
+        self.outbox = outbox
+        self.delay = delay
+
+        self.pending: dict[int, list[int]] = {}  # chat_id -> id сообщений
+        self.due: dict[int, float] = {}  # chat_id -> когда убирать; в порядке возрастания
+        self.scheduled: asyncio.TimerHandle | None = None
+        self.flushing: set[asyncio.Task] = set()
+
+        self.deleted = 0
+        self.calls = 0
+
+    def schedule(self, messages):
+        # messages: пары (chat_id, message_id); пустые id пропускаются
+        loop = asyncio.get_running_loop()
+        for chat_id, msg_id in messages:
+            if msg_id:
+                chat_id = int(chat_id)
+                ids = self.pending.get(chat_id)
+                if ids is None:
+                    ids = self.pending[chat_id] = []
+                    self.due[chat_id] = loop.time() + self.delay
+                ids.append(msg_id)
+        self._arm()
+
+    def _arm(self):
+        if self.due and self.scheduled is None:
+            loop = asyncio.get_running_loop()
+            self.scheduled = loop.call_at(next(iter(self.due.values())), self._start_flush)
+
+    def _start_flush(self):
+        self.scheduled = None
+        task = asyncio.create_task(self.flush(asyncio.get_running_loop().time()))
+        self.flushing.add(task)
+        task.add_done_callback(self.flushing.discard)
+        self._arm()
+
+    async def flush(self, now: float | None = None):
+        # Чаты, чей срок наступил к now (None — все)
+        pending = {}
+        while self.due:
+            chat_id, due = next(iter(self.due.items()))
+            if now is not None and due > now:
+                break
+            del self.due[chat_id]
+            pending[chat_id] = self.pending.pop(chat_id)
+        calls = []
+        for chat_id, ids in pending.items():
+            ids = list(dict.fromkeys(ids))  # без повторов, порядок сохраняем
+            for i in range(0, len(ids), DELETE_BATCH):
+                calls.append(self._delete(chat_id, ids[i:i + DELETE_BATCH]))
+        await asyncio.gather(*calls)
+
+    async def _delete(self, chat_id: int, ids: list[int]):
+        # Ошибки (сообщение старше 48 ч, уже удалено) outbox только логирует
+        self.calls += 1
+        ok = await self.outbox.call(chat_id, self.bot.delete_messages, chat_id=chat_id, message_ids=ids)
+        if ok:
+            self.deleted += len(ids)
+            deleted_total.inc(self.name, value=len(ids))
+
+    async def close(self):
+        if self.scheduled:
+            self.scheduled.cancel()
+            self.scheduled = None
+        if self.flushing:
+            await asyncio.gather(*self.flushing, return_exceptions=True)
+        if self.pending:
+            await self.flush()
+
+
+def cleanup_settings() -> dict:
+    return {"delay": float(os.getenv("CLEANUP_DELAY", str(CLEANUP_DELAY)))}
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+import sys
+
+from aiogram.types import Update
+
+# === Кластерный режим: несколько процессов-обработчиков ===
+# Главный процесс только читает getUpdates у всех ботов и раздаёт апдейты
+# процессам-обработчикам по хешу чата: все апдейты одного чата попадают
+# в один процесс и идут в нём по порядку (в том числе ограничение частоты
+# нажатий клиента). Заявки лежат в общем хранилище (TASK_STORE=shared),
+# поэтому «Сделано» у оператора, чей чат обслуживает другой процесс,
+# закрывает ту же заявку; кто взял её первым, решает compare-and-set в базе.
+#
+# CLUSTER_WORKERS=4 TASK_STORE=shared TASK_DB=tasks.db python gate_bot_rev2.py
+#
+# Апдейт считается доставленным, когда он передан обработчику: если процесс
+# упадёт, его необработанные апдейты теряются (как и при обычном polling).
+# Табло и адресное распределение держат состояние в памяти процесса и в
+# кластере не поддерживаются. Просроченные заявки убирает только процесс 0.
+
+QUEUE_SIZE = 1000      # апдейтов в очереди одного обработчика
+POLLING_TIMEOUT = 10   # сек, long polling главного процесса
+
+
+def update_chat_id(update: Update) -> int:
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id  # callback_query и т.п. — личный чат пользователя с ботом
+    return update.update_id
+
+
+def partition(update: Update, workers: int) -> int:
+    return update_chat_id(update) % workers
+
+
+def check_cluster(app):
+    from task_store import SharedTaskStore
+    for gate in app.gates:
+        if not isinstance(gate.tasks, SharedTaskStore):
+            raise SystemExit(f"{gate.name}: кластерный режим требует TASK_STORE=shared")
+        if gate.board or gate.assigner:
+            raise SystemExit(f"{gate.name}: табло и адресное распределение в кластере не поддерживаются")
+        if gate.offsets:
+            raise SystemExit(f"{gate.name}: CATCHUP в кластере не поддерживается")
+
+
+# === Главный процесс ===
+async def _poll(app, gate, queues: list, stop: asyncio.Event, allowed_updates: list):
+    offset = None
+    while not stop.is_set():
+        try:
+            updates = await gate.bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT,
+                                                 allowed_updates=allowed_updates)
+        except Exception as e:
+            print(f"[LOG] {gate.name}: ошибка getUpdates ({e}), повтор через 1 с")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            item = (gate.bot.id, update.model_dump_json(by_alias=True, exclude_none=True))
+            target = queues[partition(update, len(queues))]
+            try:
+                target.put_nowait(item)
+            except queue_module.Full:
+                # Обработчик не успевает — ждём его, а вместе с ним замедляем и getUpdates
+                await asyncio.to_thread(target.put, item)
+            offset = update.update_id + 1
+
+
+async def run_master(app, workers: int):
+    check_cluster(app)
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        context.Process(target=worker_main, args=(index, queue), name=f"gate-worker-{index}")
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    print(f"🚀 Кластер запущен: обработчиков {workers}, ворот {len(app.gates)}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    allowed_updates = app.dp.resolve_used_update_types()
+    pollers = [asyncio.create_task(_poll(app, gate, queues, stop, allowed_updates)) for gate in app.gates]
+    try:
+        await stop.wait()
+    finally:
+        for poller in pollers:
+            poller.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            await asyncio.to_thread(process.join)
+        await app.session.close()
+        print("[LOG] Кластер остановлен")
+
+
+# === Процесс-обработчик ===
+def worker_main(index: int, queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # останавливает главный процесс
+    os.environ["CLUSTER_WORKER"] = str(index)
+    asyncio.run(_worker(index, queue))
+
+
+async def _worker(index: int, queue):
+    import metrics
+    import tracing
+    # При запуске через python gate_bot_rev2.py модуль уже загружен как __mp_main__;
+    # второй импорт завёл бы второй набор ворот и повторные метрики
+    app = sys.modules.get("__mp_main__")
+    if not hasattr(app, "gates"):
+        import gate_bot_rev2 as app
+
+    for gate in app.gates:
+        await gate.start(sweep=index == 0)
+    app.jobs.start()
+    app.scheduler.start()
+    tracing.tracer.open(**tracing.tracing_settings())  # свой файл у каждого процесса
+    await app.journal.open()  # и свой каталог журнала; /stats дочитывает каталоги соседей
+    app.profiler.attach(app.dp, app.Gate)
+    app.profiler.install_signal(**app.profile_signal_settings())  # kill -USR1 <pid обработчика>
+    metrics_runner = None
+    if app.METRICS_PORT:
+        metrics_runner = await metrics.start_metrics_server("0.0.0.0", app.METRICS_PORT + index)
+    print(f"[LOG] Обработчик {index} запущен (pid {os.getpid()})")
+
+    try:
+        while True:
+            item = await asyncio.to_thread(queue.get)
+            if item is None:
+                break
+            bot_id, raw = item
+            gate = app.gates_by_bot[bot_id]
+            # Возвращается, как только апдейт встал в очередь планировщика;
+            # пока она полна — ждёт, и очередь процесса копится до QUEUE_SIZE
+            await app.dp.feed_raw_update(gate.bot, json.loads(raw))
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await app.scheduler.close()
+        await app.jobs.close()
+        await app.journal.close()
+        await tracing.tracer.close()
+        for gate in app.gates:
+            await gate.close()
+        await app.session.close()
+        print(f"[LOG] Обработчик {index} остановлен")
+
+
+def cluster_settings() -> dict:
+    return {"workers": int(os.getenv("CLUSTER_WORKERS", "0"))}
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import random
+import time
+
+# === Заглушка платы реле для проверки без железа ===
+# Говорит на том же строчном протоколе, что и gate_controller.py.
+# Запуск отдельно: python fake_gate.py --port 7000, затем
+# GATE_URL=tcp://127.0.0.1:7000 GATE_MODE=auto python gate_bot_rev2.py
+
+
+class FakeGate:
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, fail_rate: float = 0.0,
+                 drop_rate: float = 0.0, seed: int = 0):
+        self.latency = latency        # сек, «время срабатывания» платы
+        self.jitter = jitter
+        self.fail_rate = fail_rate    # доля команд с ответом ERR
+        self.drop_rate = drop_rate    # доля команд без ответа
+        self.random = random.Random(seed)
+
+        self.pulses: list[tuple[float, int, int]] = []  # (время, реле, мс)
+        self.commands = 0
+        self.server: asyncio.AbstractServer | None = None
+        self.port = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return f"tcp://{host}:{self.port}"
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                parts = line.decode().split()
+                if len(parts) < 2:
+                    continue
+                self.commands += 1
+                asyncio.create_task(self.reply(writer, parts[0], parts[1], parts[2:]))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def reply(self, writer: asyncio.StreamWriter, seq: str, command: str, args: list):
+        await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        if self.random.random() < self.drop_rate:
+            return
+        if command == "PING":
+            answer = "PONG"
+        elif command == "OPEN" and args:
+            if self.random.random() < self.fail_rate:
+                answer = "ERR relay"
+            else:
+                self.pulses.append((time.time(), int(args[0]), int(args[1]) if len(args) > 1 else 0))
+                answer = "OK"
+        else:
+            answer = "ERR command"
+        if not writer.is_closing():
+            writer.write(f"{seq} {answer}\n".encode())
+
+
+async def serve(args):
+    gate = FakeGate(args.latency_ms / 1000, args.jitter_ms / 1000, args.fail_rate, args.drop_rate)
+    url = await gate.start(args.host, args.port)
+    print(f"[LOG] Заглушка платы реле: {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await gate.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка платы реле ворот")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
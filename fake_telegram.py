@@ -0,0 +1,185 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+# === Локальная заглушка Telegram Bot API для нагрузочных тестов ===
+# Понимает методы, которыми пользуется бот: getMe, getUpdates (long polling),
+# sendMessage, editMessageText, deleteMessage(s), answerCallbackQuery и т.д.
+# Умеет добавлять задержку и отвечать 429 с заданной вероятностью.
+# Бот подключается к ней через TELEGRAM_API_URL=http://127.0.0.1:<port>.
+
+BOT_USER = {"id": 999, "is_bot": True, "first_name": "GateBot", "username": "gate_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 rate_429: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.latency = latency        # сек, базовая задержка ответа
+        self.jitter = jitter          # сек, случайная добавка к задержке
+        self.rate_429 = rate_429      # доля запросов, на которые отвечаем 429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.updates: list[dict] = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.new_update = asyncio.Event()
+
+        # Журнал исходящих вызовов бота: (время, метод, параметры)
+        self.calls: list[tuple[float, str, dict]] = []
+        self.calls_by_method = defaultdict(int)
+        self.throttled = 0
+        self.listeners: list[tuple] = []
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner: web.AppRunner | None = None
+        self.port = None
+
+    # === Запуск ===
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    # === Входящие обновления (то, что «пишут» пользователи) ===
+    def push(self, update: dict) -> int:
+        update_id = next(self.update_ids)
+        update["update_id"] = update_id
+        self.updates.append(update)
+        self.new_update.set()
+        return update_id
+
+    def push_message(self, user_id: int, text: str, username: str | None = None) -> int:
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}",
+                "username": username or f"user{user_id}"}
+        return self.push({"message": {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        }})
+
+    def push_callback(self, user_id: int, data: str, message: dict, username: str | None = None) -> int:
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}",
+                "username": username or f"user{user_id}"}
+        return self.push({"callback_query": {
+            "id": str(next(self.message_ids)),
+            "from": user,
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        }})
+
+    # === Ожидание исходящих вызовов ===
+    def wait_for(self, predicate) -> asyncio.Future:
+        # predicate(method, params) -> bool; будущее получает (время, параметры, результат)
+        future = asyncio.get_running_loop().create_future()
+        self.listeners.append((predicate, future))
+        return future
+
+    def _notify(self, now: float, method: str, params: dict, result):
+        remaining = []
+        for predicate, future in self.listeners:
+            if future.done():
+                continue
+            if predicate(method, params):
+                future.set_result((now, params, result))
+            else:
+                remaining.append((predicate, future))
+        self.listeners = remaining
+
+    # === Обработка запросов бота ===
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        for key in ("reply_markup", "message_ids", "allowed_updates"):
+            if isinstance(params.get(key), str):
+                params[key] = json.loads(params[key])
+
+        if method == "getUpdates":
+            return await self._get_updates(params)
+
+        delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rate_429 and self.random.random() < self.rate_429:
+            self.throttled += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        now = time.monotonic()
+        self.calls.append((now, method, params))
+        self.calls_by_method[method] += 1
+        result = self._result(method, params)
+        self._notify(now, method, params, result)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> web.Response:
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 0) or 0)
+        self.calls_by_method["getUpdates"] += 1
+        # Подтверждённые обновления забываем, как это делает Telegram
+        if offset:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        deadline = time.monotonic() + timeout
+        while not self.updates and time.monotonic() < deadline:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+        return web.json_response({"ok": True, "result": self.updates[:limit]})
+
+    def _message(self, chat_id, text, reply_markup=None, message_id=None) -> dict:
+        message = {
+            "message_id": message_id or next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+        if reply_markup and "inline_keyboard" in reply_markup:
+            message["reply_markup"] = reply_markup
+        return message
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "sendMessage":
+            return self._message(params["chat_id"], params.get("text", ""), params.get("reply_markup"))
+        if method == "editMessageText":
+            return self._message(params["chat_id"], params.get("text", ""), params.get("reply_markup"),
+                                 message_id=int(params["message_id"]))
+        # deleteMessage(s), answerCallbackQuery, pinChatMessage, deleteWebhook, setWebhook, ...
+        return True
+
+
+# === Ручной запуск: python fake_telegram.py [port] ===
+if __name__ == "__main__":
+    import sys
+
+    async def serve():
+        fake = FakeTelegram()
+        url = await fake.start(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8081)
+        print(f"[LOG] Заглушка Bot API: {url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
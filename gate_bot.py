@@ -6,15 +6,18 @@ from aiogram.filters import Command
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from dotenv import load_dotenv
 
+from outbox import Outbox
+
 # === Загрузка переменных окружения ===
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-OPERATORS = os.getenv("OPERATORS", "").split(",") if os.getenv("OPERATORS") else []
+OPERATORS = [int(op) for op in os.getenv("OPERATORS", "").split(",")] if os.getenv("OPERATORS") else []
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 
 # === Создание бота и диспетчера ===
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()  # dispatcher пустой, передадим bot в start_polling
+outbox = Outbox(bot)  # параллельная рассылка с учётом лимитов Telegram
 
 tasks = {}
 
@@ -53,6 +56,21 @@ async def cmd_help(message: types.Message):
     )
     await message.answer(text)
 
+# === Команда /sendstats (только для администратора) ===
+@dp.message(Command("sendstats"))
+async def cmd_sendstats(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    st = outbox.stats()
+    await message.answer(
+        f"Отправлено: {st['sent']}\n"
+        f"Повторов: {st['retried']}\n"
+        f"Потеряно: {st['dropped']}\n"
+        f"В полёте: {st['in_flight']}\n"
+        f"Задержка p50/p95/p99: {st['latency_p50'] * 1000:.0f}/"
+        f"{st['latency_p95'] * 1000:.0f}/{st['latency_p99'] * 1000:.0f} мс"
+    )
+
 # === Обработка запросов клиента ===
 @dp.message(F.text.in_(["Прошу открыть въезд 🚗", "🚗 Прошу открыть выезд"]))
 async def handle_request(message: types.Message):
@@ -74,22 +92,18 @@ async def handle_request(message: types.Message):
         "user_msg_id": user_msg.message_id
     }
 
-    # Операторам: уведомление с кнопками
-    for op_id in OPERATORS:
-        try:
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="Сделано", callback_data=f"done:{task_id}"),
-                    InlineKeyboardButton(text="Игнорировать", callback_data=f"ignore:{task_id}")
-                ]
-            ])
-            await bot.send_message(
-                int(op_id),
-                f"-> @{user_name} просит открыть {direction}",
-                reply_markup=kb
-            )
-        except Exception as e:
-            print(f"[LOG] Ошибка уведомления оператору {op_id}: {e}")
+    # Операторам: уведомление с кнопками (всем одновременно)
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="Сделано", callback_data=f"done:{task_id}"),
+            InlineKeyboardButton(text="Игнорировать", callback_data=f"ignore:{task_id}")
+        ]
+    ])
+    await outbox.broadcast(
+        OPERATORS,
+        f"-> @{user_name} просит открыть {direction}",
+        reply_markup=kb
+    )
 
 # === Обработка действий операторов ===
 @dp.callback_query(F.data.startswith(("done:", "ignore:")))
@@ -159,14 +173,10 @@ async def handle_thank(callback: types.CallbackQuery):
     )
 
     # Операторам: уведомление о благодарности
-    for op_id in OPERATORS:
-        try:
-            await bot.send_message(
-                int(op_id),
-                f"-> 👏 Спасибо за {direction} от @{user_name}"
-            )
-        except:
-            pass
+    await outbox.broadcast(
+        OPERATORS,
+        f"-> 👏 Спасибо за {direction} от @{user_name}"
+    )
 
 # === Основной цикл ===
 async def main():
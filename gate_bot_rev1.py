@@ -6,6 +6,9 @@ from aiogram.filters import Command
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from dotenv import load_dotenv
 
+from task_store import MemoryTaskStore
+from intents import IntentRouter, intent_settings, REQUEST, DONE, THANKS
+
 # === Загрузка переменных окружения ===
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -13,7 +16,7 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher(bot=bot)
 
-tasks = {}  # Словарь текущих задач, только новые заявки
+tasks = MemoryTaskStore()  # Текущие задачи с индексом по клиенту, только новые заявки
 
 # === Основная клавиатура клиента с кнопками ===
 main_kb = ReplyKeyboardMarkup(
@@ -23,6 +26,11 @@ main_kb = ReplyKeyboardMarkup(
     ],
     resize_keyboard=True
 )
+# Кнопки, цифры 1–4 и синонимы -> намерение; текст разбирается один раз
+intents = IntentRouter({
+    "Прошу открыть ворота ВЪЕЗД 🚗": "въезд",
+    "🚗 Прошу открыть ворота ВЫЕЗД": "выезд",
+}, **intent_settings())
 
 # === /start ===
 @dp.message(Command("start"))
@@ -57,17 +65,25 @@ async def get_id(message: types.Message):
     await message.answer(f"Ваш Telegram ID: {message.from_user.id}")
 
 # === Обработка кнопок и цифр ===
-@dp.message()
-async def handle_request(message: types.Message):
-    text = message.text.strip()
-    # Определяем действие пользователя
-    if text in ["Прошу открыть ворота ВЪЕЗД 🚗", "1"]:
-        direction = "въезд"
-    elif text in ["🚗 Прошу открыть ворота ВЫЕЗД", "2"]:
-        direction = "выезд"
-    else:
-        return  # Другие сообщения игнорируем
-
+# Один хендлер на весь текст: раньше «ловящий всё» @dp.message() стоял
+# перед обработчиком «4» и тот никогда не срабатывал
+@dp.message(F.text)
+async def handle_text(message: types.Message):
+    intent = intents.resolve(message.text)
+    if intent is None:
+        if intents.should_hint(message.from_user.id):
+            await message.answer(
+                f"Не понял сообщение. Нажмите кнопку или отправьте цифру: {intents.shortcuts()} (/help)",
+                reply_markup=main_kb
+            )
+    elif intent.action == REQUEST:
+        await handle_request(message, intent.arg)
+    elif intent.action == DONE:
+        await handle_done_number(message)
+    elif intent.action == THANKS:
+        await handle_thank_number(message)
+
+async def handle_request(message: types.Message, direction: str):
     user_id = message.from_user.id
     user_name = message.from_user.username or message.from_user.first_name
     task_id = str(uuid.uuid4())
@@ -78,14 +94,14 @@ async def handle_request(message: types.Message):
         reply_markup=main_kb
     )
 
-    tasks[task_id] = {
+    await tasks.create(task_id, {
         "user_id": user_id,
         "user_name": user_name,
         "direction": direction,
         "user_msg_id": user_msg.message_id,
         "operator_done_msg_id": None,
         "operator_name": None
-    }
+    })
 
     # Оператору (тот же аккаунт)
     kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -109,23 +125,39 @@ async def handle_operator_action(callback: types.CallbackQuery):
         await callback.answer("Заявка уже закрыта или не найдена.")
         return
 
-    user_id = task["user_id"]
-    user_name = task["user_name"]
     direction = task["direction"]
     operator_name = callback.from_user.username or callback.from_user.first_name
-    task["operator_name"] = operator_name
+    await tasks.update(task_id, operator_id=callback.from_user.id, operator_name=operator_name)
 
     if action == "ignore":
         await callback.message.edit_text(f"[ОПЕРАТОР] Заявка на {direction} была пропущена")
-        tasks.pop(task_id)
+        await tasks.pop(task_id)
+        return
+    await complete_task(task_id, operator_name)
+
+# === Выполнено цифрой 3: последняя заявка, ещё не отмеченная выполненной ===
+async def handle_done_number(message: types.Message):
+    task_id = tasks.latest_for_user(message.from_user.id)
+    task = tasks.get(task_id) if task_id else None
+    if not task or task.get("operator_done_msg_id"):
+        await message.answer("Нет заявки, ожидающей выполнения.")
         return
+    operator_name = message.from_user.username or message.from_user.first_name
+    await tasks.update(task_id, operator_id=message.from_user.id, operator_name=operator_name)
+    await complete_task(task_id, operator_name)
+
+async def complete_task(task_id, operator_name):
+    task = tasks.get(task_id)
+    user_id = task["user_id"]
+    user_name = task["user_name"]
+    direction = task["direction"]
 
     # Создаём сообщение о выполнении
     done_msg = await bot.send_message(
         user_id,
         f"[ОПЕРАТОР] Заявка для @{user_name} на {direction} выполнена ✅\n(Отправьте 4 — Спасибо)"
     )
-    task["operator_done_msg_id"] = done_msg.message_id
+    await tasks.update(task_id, operator_done_msg_id=done_msg.message_id)
 
     # Клиенту: уведомление с кнопкой Спасибо
     thank_kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -138,13 +170,9 @@ async def handle_operator_action(callback: types.CallbackQuery):
     )
 
 # === Обработка Спасибо через кнопку или цифру 4 ===
-@dp.message(F.text.in_(["4"]))
 async def handle_thank_number(message: types.Message):
-    # Ищем последнюю задачу для этого пользователя
-    task_id = None
-    for tid, t in tasks.items():
-        if t["user_id"] == message.from_user.id:
-            task_id = tid
+    # Последняя задача этого пользователя — по индексу, без перебора
+    task_id = tasks.latest_for_user(message.from_user.id)
     if not task_id:
         await message.answer("Нет активной заявки для благодарности.")
         return
@@ -157,7 +185,7 @@ async def handle_thank(callback: types.CallbackQuery):
     await handle_thank_by_id(callback, task_id)
 
 async def handle_thank_by_id(obj, task_id):
-    task = tasks.pop(task_id, None)
+    task = await tasks.pop(task_id, None)
     if not task:
         if isinstance(obj, types.CallbackQuery):
             await obj.answer("Заявка уже закрыта.")
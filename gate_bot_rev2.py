@@ -1,40 +1,548 @@
 import asyncio
 import os
-import uuid
+import sys
+import time
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardButton, InlineKeyboardMarkup
 )
 from dotenv import load_dotenv
 
+from outbox import LOW, URGENT, Outbox
+from task_store import create_task_store
+from callbacks import CallbackCodec, callback_is
+from sweeper import TaskSweeper, sweeper_settings
+from webhook import run_webhook, webhook_settings
+from catchup import OffsetStore, drain_backlog
+import metrics
+import tracing
+from tracing import traced, tracing_settings
+from board import QueueBoard
+from assignment import Assigner
+from throttle import RequestThrottleMiddleware, throttle_settings
+from jobs import JobQueue, job_settings
+from scheduler import UpdateScheduler, update_key, scheduler_settings
+from journal import Journal, journal_settings, stats_text, ROLLUP_DAYS
+from profiling import Profiler, profiling_settings, profile_signal_settings, MODES
+from gate_controller import GateController
+from rules import RuleEngine
+from cleanup import MessageCleaner, cleanup_settings
+from gate_config import load_gate_configs
+from roster import RosterStore
+from cluster import run_master, cluster_settings
+from intents import IntentRouter, intent_is, intent_settings, REQUEST, DONE, THANKS
+
 # === Загрузка переменных окружения ===
 load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-OPERATORS = os.getenv("OPERATORS", "").split(",") if os.getenv("OPERATORS") else []
-ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # свой Bot API сервер или тестовая заглушка
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling или webhook
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # в режиме polling; 0 — без /metrics
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # соединений к Bot API на все боты
+CLUSTER = cluster_settings()  # CLUSTER_WORKERS=N — апдейты обрабатывают N процессов (нужен TASK_STORE=shared)
+AUTO_OPERATOR = "автоматика"
 
-bot = Bot(token=BOT_TOKEN)
+# Одна сессия (пул соединений) и один диспетчер на все ворота процесса
+if TELEGRAM_API_URL:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL), limit=HTTP_POOL_LIMIT)
+else:
+    session = AiohttpSession(limit=HTTP_POOL_LIMIT)
 dp = Dispatcher()
-tasks = {}
-
-# === Основная клавиатура клиента ===
-main_kb = ReplyKeyboardMarkup(
-    keyboard=[
-        [KeyboardButton(text="Прошу открыть въезд 🚗")],
-        [KeyboardButton(text="🚗 Прошу открыть выезд")]
-    ],
-    resize_keyboard=True
+jobs = JobQueue(**job_settings())  # фоновые отправки всех ворот, по порядку внутри заявки
+scheduler = UpdateScheduler(**scheduler_settings())  # входящие обновления, по порядку внутри чата и заявки
+journal = Journal(**journal_settings())  # переходы заявок всех ворот и сводка для /stats
+profiler = Profiler(**profiling_settings())  # /profile и сигнал PROFILE_SIGNAL
+
+
+# === Ворота: бот, заявки и всё состояние одних ворот ===
+class Gate:
+    def __init__(self, config: dict):
+        self.config = config
+        self.name = config["name"]
+        # Состав операторов и смены — снимок, который подменяется на лету (roster.py)
+        self.roster_store = RosterStore(config["roster_file"], self.name, config["operators"],
+                                        config["admin_id"], config["roster_reload"])
+        self.directions = config["directions"]  # текст кнопки -> направление
+        self.request_texts = list(self.directions)
+        self.greeting = config["greeting"]
+        # Подписи кнопок всех версий, цифры и синонимы -> намерение, одним поиском в dict
+        self.intents = IntentRouter(self.directions, **intent_settings())
+
+        self.bot = Bot(token=config["token"], session=session)
+        metrics.bot_names[self.bot.id] = self.name
+        self.outbox = Outbox(self.bot)  # параллельная рассылка с учётом лимитов Telegram (на бота)
+        self.tasks = create_task_store(config["task_store"], config["task_db"])
+        # Подпись кнопок заявок: ключ от токена, соль — от хранилища
+        self.callbacks = CallbackCodec(config["token"], self.tasks.key_salt)
+        self.cleaner = MessageCleaner(self.bot, self.outbox, name=self.name, **cleanup_settings())
+
+        self.gate_mode = config["gate_mode"] if config["gate_url"] else "off"
+        self.controller = None
+        if self.gate_mode != "off":
+            self.controller = GateController(config["gate_url"], name=self.name, **config["gate"])
+
+        self.board = None
+        if config["operator_mode"] == "board":
+            self.board = QueueBoard(self.bot, self.outbox, self.tasks, self.roster.on_shift, self.callbacks)
+        self.assigner = None
+        if config["assign_mode"] == "targeted" and not self.board:
+            # Передача дальше — задание по ключу заявки: не пересекается с её закрытием,
+            # ошибки попадают в лог и метрики очереди, при остановке дорабатывается
+            self.assigner = Assigner(
+                self.roster.operators, config["assign_timeout"], on_shift=self.roster.on_shift,
+                on_timeout=lambda task_id: self.submit(task_id, lambda: self.reassign_task(task_id))
+            )
+        self.roster_store.on_change = self.apply_roster
+
+        self.rules = None
+        if config["rules_file"]:
+            if self.controller:
+                self.rules = RuleEngine(config["rules_file"], self.directions.values(),
+                                        config["rules_audit"], config["rules_reload"])
+            else:
+                print(f"[LOG] {self.name}: файл правил задан, но контроллер ворот не подключён — правила не применяются")
+
+        self.offsets = OffsetStore(config["offset_file"]) if config["catchup"] else None
+        # Повторные нажатия и флуд отсекаются до хендлеров, без запросов к Bot API
+        self.throttle = RequestThrottleMiddleware(
+            self.tasks,
+            on_coalesce=lambda task_id, task: self.board.mark_dirty() if self.board else None,
+            **throttle_settings()
+        )
+        self.sweeper = TaskSweeper(self.tasks, on_expire=self.expire_task,
+                                   on_escalate=self.escalate_task, **sweeper_settings())
+
+        # === Основная клавиатура клиента ===
+        self.main_kb = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=text)] for text in self.request_texts],
+            resize_keyboard=True
+        )
+
+    @property
+    def roster(self):
+        return self.roster_store.roster
+
+    def is_operator(self, user_id: int) -> bool:
+        return self.roster.is_operator(user_id)
+
+    def submit(self, task_id, factory):
+        # Очередь заданий общая для всех ворот, а номера заявок у каждых ворот
+        # свои: ключ — (ворота, заявка), чужие заявки с тем же номером не ждут друг друга
+        jobs.submit((self.name, task_id), factory)
+
+    def apply_roster(self, old, new):
+        # Состав сменился (файл или команда): табло и распределение — на новый снимок
+        if self.assigner:
+            self.assigner.set_roster(new.operators, new.on_shift)
+        if self.board:
+            self.board.set_operators(new.on_shift)
+        added = set(new.operators) - set(old.operators)
+        removed = set(old.operators) - set(new.operators)
+        print(f"[LOG] {self.name}: состав обновлён, на смене {len(new.on_shift)} из {len(new.operators)}"
+              f"{f', добавлены {sorted(added)}' if added else ''}{f', убраны {sorted(removed)}' if removed else ''}")
+
+    async def take_task(self, task_id, action, operator_id, operator_name) -> dict | None:
+        # Первый нажавший забирает заявку (compare-and-set в хранилище)
+        task = await self.tasks.claim(task_id, operator_id, operator_name)
+        if task is None:
+            return None
+        journal.record("claimed", self.name, task_id, task, operator_id, operator_name)
+        if action == "ignore":
+            await self.tasks.transition(task_id, "claimed", "ignored")
+            journal.record("ignored", self.name, task_id, task, operator_id)
+        if self.board:
+            self.board.mark_dirty()
+        if self.assigner:
+            self.assigner.claimed(task_id, operator_id)
+            if action == "ignore":
+                self.assigner.finished(task_id)
+        return task
+
+    async def thank_task(self, task_id) -> dict | None:
+        # «Спасибо» закрывает заявку; задержка в журнале — от выполнения
+        task = await self.tasks.pop(task_id, None)
+        if self.assigner:
+            self.assigner.finished(task_id)
+        if task is not None:
+            journal.record("thanked", self.name, task_id, task, task.get("operator_id"), since=task["state_at"])
+        return task
+
+    async def start(self, sweep: bool = True):
+        await self.tasks.start()
+        self.roster_store.start()
+        if sweep:
+            self.sweeper.start()  # в кластере просроченные заявки убирает один процесс
+        if self.controller:
+            self.controller.start()
+        if self.rules:
+            self.rules.start()
+        if self.offsets:
+            self.offsets.start()
+        if self.board and self.tasks.count("pending"):
+            self.board.mark_dirty()  # восстановленные заявки
+        if self.assigner:
+            self.assigner.restore(self.tasks)
+
+    async def close(self):
+        await self.roster_store.close()
+        await self.cleaner.close()
+        if self.controller:
+            await self.controller.close()
+        if self.rules:
+            await self.rules.close()
+        await self.sweeper.stop()
+        await self.tasks.close()
+        if self.offsets:
+            await self.offsets.close()
+
+    # === Новая заявка ===
+    @traced()
+    async def auto_open_task(self, task_id, rule=None):
+        # Открываем сами; операторы подключаются, только если плата не ответила
+        task = await self.tasks.transition(task_id, "pending", "claimed", operator_id=None,
+                                           operator_name=AUTO_OPERATOR, auto=True, rule=rule)
+        if task is None:
+            return
+        journal.record("claimed", self.name, task_id, task, None, AUTO_OPERATOR)
+        opened = await self.controller.open(task["direction"])
+        if opened:
+            await self.finish_done(task_id, None, AUTO_OPERATOR)
+            return
+        result = "не подтверждено" if opened is None else "не удалось"
+        print(f"[LOG] {self.name}: автооткрытие {task['direction']} {result}, заявка {task_id} уходит операторам")
+        if rule:
+            self.rules.refund(task["user_id"], task["direction"], rule)
+        await self.tasks.transition(task_id, "claimed", "pending", operator_name=None, auto=False)
+        await self.announce_task(task_id)
+
+    @traced()
+    async def announce_task(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        # Клиенту и операторам — одновременно
+        if self.board:
+            self.board.mark_dirty()  # табло обновится одной правкой на всю пачку заявок
+            notify = asyncio.sleep(0)
+        elif self.assigner:
+            notify = self.assign_task(task_id)
+        else:
+            notify = self.broadcast_task(task_id)
+        user_msg, _ = await asyncio.gather(
+            self.outbox.send(task["user_id"], "[КЛИЕНТ] Заявка направлена операторам. Ожидайте ⏳",
+                             reply_markup=self.main_kb),
+            notify
+        )
+        if user_msg:
+            await self.tasks.update(task_id, user_msg_id=user_msg.message_id)
+
+    async def broadcast_task(self, task_id):
+        # Операторам (всем одновременно); запоминаем копии, чтобы потом их обновить
+        task = self.tasks.get(task_id)
+        sent = await self.outbox.broadcast(
+            self.roster.on_shift,
+            f"[ОПЕРАТОР] @{task['user_name']} просит открыть {task['direction']}", URGENT,
+            reply_markup=operator_kb(self.callbacks, task_id)
+        )
+        await self.remember_operator_msgs(task_id, sent)
+
+    async def assign_task(self, task_id, tried=()):
+        # Отдаём заявку самому свободному оператору на смене; если все уже
+        # пробовали — рассылаем оставшимся
+        task = self.tasks.get(task_id)
+        text = f"[ОПЕРАТОР] @{task['user_name']} просит открыть {task['direction']}"
+        op_id = self.assigner.pick(exclude=tried)
+        if op_id is None:
+            await self.tasks.update(task_id, assigned_to=None)
+            rest = [op for op in self.roster.on_shift if op not in tried]
+            sent = await self.outbox.broadcast(rest, text, URGENT, reply_markup=operator_kb(self.callbacks, task_id))
+            await self.remember_operator_msgs(task_id, sent)
+            return
+        tried = [*tried, op_id]
+        await self.tasks.update(task_id, assigned_to=op_id, assigned_at=time.time(), tried=tried)
+        self.assigner.assign(task_id, op_id)
+        sent = await self.outbox.send(op_id, text, URGENT, reply_markup=operator_kb(self.callbacks, task_id))
+        if sent is None:
+            # Оператор недоступен — сразу к следующему
+            self.assigner.release(task_id)
+            await self.assign_task(task_id, tried)
+            return
+        await self.remember_operator_msgs(task_id, {op_id: sent})
+
+    @traced()
+    async def reassign_task(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None or task["state"] != "pending":
+            return
+        tracing.bind(task.get("trace_id"), task_id=task_id)
+        print(f"[LOG] {self.name}: заявку {task_id} не взяли вовремя, передаём дальше")
+        await self.assign_task(task_id, tuple(task.get("tried", ())))
+
+    # === Сообщения заявки ===
+    async def remember_operator_msgs(self, task_id, sent):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        msgs = task["operator_msgs"] + [[chat_id, msg.message_id] for chat_id, msg in sent.items() if msg]
+        await self.tasks.update(task_id, operator_msgs=msgs)
+
+    async def track_msg(self, task_id, chat_id, msg):
+        # Прочие сообщения по заявке, которые надо убрать при её закрытии
+        task = self.tasks.get(task_id)
+        if task is not None and msg:
+            await self.tasks.update(task_id, msgs=task.get("msgs", []) + [[chat_id, msg.message_id]])
+
+    async def edit_operator_msgs(self, task, text_for):
+        # Обновляем все копии заявки у операторов параллельно; text_for(chat_id) -> текст
+        await asyncio.gather(*(
+            self.outbox.call(chat_id, self.bot.edit_message_text, text=text_for(chat_id),
+                             chat_id=chat_id, message_id=msg_id, priority=URGENT)
+            for chat_id, msg_id in task.get("operator_msgs", ())
+        ))
+
+    # === Закрытие заявки ===
+    @traced()
+    async def finish_ignored(self, task_id, operator_name):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        # "Ожидайте" у клиента и все копии у операторов
+        print(f"[LOG] {self.name}: заявку @{task['user_name']} на {task['direction']} проигнорировал @{operator_name}")
+        self.cleaner.schedule(task_messages(task))
+        await self.tasks.pop(task_id, None)
+
+    @traced()
+    async def finish_done(self, task_id, operator_id, operator_name):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        user_id = task["user_id"]
+        user_name = task["user_name"]
+        direction = task["direction"]
+        opened = True
+        if self.gate_mode == "on_done" and not task.get("auto"):
+            opened = await self.controller.open(direction)
+        if not opened:
+            # Реле не сработало или плата не ответила — заявка снова ждёт, клиенту ничего не сообщаем
+            reverted = await self.tasks.transition(task_id, "claimed", "pending", operator_id=None, operator_name=None)
+            if self.board:
+                self.board.mark_dirty()
+            if self.assigner:
+                self.assigner.finished(task_id)
+            if opened is None:
+                text = (f"[ОПЕРАТОР] ⚠️ Контроллер ворот не подтвердил открытие — {direction} для @{user_name} "
+                        f"мог открыться. Проверьте ворота; если закрыты, нажмите «Сделано» ещё раз.")
+            else:
+                text = (f"[ОПЕРАТОР] ⚠️ Контроллер ворот не ответил — {direction} для @{user_name} не открыт. "
+                        f"Нажмите «Сделано» ещё раз или откройте вручную.")
+            warning = await self.outbox.send(operator_id, text)
+            await self.track_msg(task_id, operator_id, warning)
+            if reverted and self.assigner:
+                # Таймер назначения сняли при взятии — назначаем заново, как новую заявку,
+                # иначе без повторного «Сделано» она так и ждала бы до TASK_TTL_PENDING
+                await self.assign_task(task_id, tuple(reverted.get("tried", ())))
+            return
+        done_text = f"[ОПЕРАТОР] Заявка для @{user_name} на {direction} выполнена."
+        taken_text = f"[ОПЕРАТОР] Заявку @{user_name} на {direction} взял @{operator_name}."
+        thank_kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="👍 Спасибо", callback_data=self.callbacks.encode("thank", task_id))]
+        ])
+
+        # "Ожидайте" у клиента больше не нужно
+        self.cleaner.schedule([(user_id, task.get("user_msg_id"))])
+        await self.tasks.update(task_id, user_msg_id=None)
+
+        # Сообщения операторам и клиенту — одновременно
+        _, thank_msg = await asyncio.gather(
+            self.edit_operator_msgs(task, lambda chat_id: done_text if chat_id == operator_id else taken_text),
+            self.outbox.send(
+                user_id,
+                f"[КЛИЕНТ] Ворота {direction} открыты автоматически" if task.get("auto")
+                else f"[КЛИЕНТ] Ворота {direction} открыты оператором @{operator_name}",
+                reply_markup=thank_kb
+            )
+        )
+        await self.tasks.transition(task_id, "claimed", "done",
+                                    thank_msg_id=thank_msg.message_id if thank_msg else None)
+        if self.assigner:
+            self.assigner.finished(task_id)
+        journal.record("done", self.name, task_id, task, operator_id)
+
+    @traced()
+    async def finish_thanks(self, task):
+        user_id = task["user_id"]
+        user_name = task["user_name"]
+        direction = task["direction"]
+        operator_name = task.get("operator_name", "оператор")
+        if task.get("auto"):
+            thanked = []  # открыто без оператора — благодарить некого
+        elif self.assigner and task.get("operator_id"):
+            thanked = [task["operator_id"]]
+        else:
+            thanked = self.roster.on_shift
+
+        await asyncio.gather(
+            # Отправляем главное меню клиенту
+            self.outbox.send(
+                user_id,
+                f"[КЛИЕНТ] Заявка на {direction} выполнена @{operator_name}",
+                reply_markup=self.main_kb  # Главное меню с кнопками
+            ),
+            # Отправляем уведомление оператору о благодарности
+            # (при адресном назначении — только тому, кто открыл)
+            self.outbox.broadcast(thanked, f"[ОПЕРАТОР] 👏 Спасибо за {direction} от @{user_name}", LOW)
+        )
+        # Ответ ушёл — теперь убираем сообщение с кнопкой Спасибо и копии заявки у операторов
+        self.cleaner.schedule(task_messages(task))
+
+    # === Просроченные заявки ===
+    @traced()
+    async def expire_task(self, task_id, task):
+        # Убираем все сообщения заявки (у клиента и у операторов) и сообщаем, что она закрыта
+        tracing.bind(task.get("trace_id"), task_id=task_id)
+        # Просроченной считается и выполненная заявка, за которую не поблагодарили
+        journal.record("expired", self.name, task_id, task, task.get("operator_id"))
+        user_id = task["user_id"]
+        self.cleaner.schedule(task_messages(task))
+        if self.board:
+            self.board.mark_dirty()
+        if self.assigner:
+            self.assigner.finished(task_id)
+        if task["state"] != "done":
+            print(f"[LOG] {self.name}: заявка @{task['user_name']} на {task['direction']} закрыта по таймауту")
+            await self.outbox.send(
+                user_id,
+                f"[КЛИЕНТ] Заявка на {task['direction']} не была обработана. Отправьте её ещё раз.",
+                reply_markup=self.main_kb
+            )
+
+    @traced()
+    async def escalate_task(self, task_id, task):
+        # Повторно напоминаем операторам о заявке, которая давно ждёт
+        tracing.bind(task.get("trace_id"), task_id=task_id)
+        if self.board:
+            self.board.mark_dirty(renotify=True)
+            return
+        waited = int((time.time() - task["created_at"]) // 60)
+        sent = await self.outbox.broadcast(
+            self.roster.on_shift,
+            f"[ОПЕРАТОР] ⏰ @{task['user_name']} ждёт {task['direction']} уже {waited} мин", LOW,
+            reply_markup=operator_kb(self.callbacks, task_id)
+        )
+        await self.remember_operator_msgs(task_id, sent)
+
+    def request_key(self, update: types.Update):
+        # Повторные запросы одного клиента в одну сторону при дочитывании схлопываем
+        message = update.message
+        intent = self.intents.resolve(message.text) if message else None
+        if intent and intent.action == REQUEST:
+            return message.from_user.id, intent.arg
+        return None
+
+
+def task_messages(task):
+    # Все сообщения бота по заявке: (chat_id, message_id)
+    user_id = task["user_id"]
+    return [(user_id, task.get("user_msg_id")), (user_id, task.get("thank_msg_id")),
+            *task.get("operator_msgs", ()), *task.get("msgs", ())]
+
+
+# === Кнопки оператора для заявки ===
+def operator_kb(callbacks, task_id):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Сделано", callback_data=callbacks.encode("done", task_id)),
+        InlineKeyboardButton(text="❌ Игнорировать", callback_data=callbacks.encode("ignore", task_id))
+    ]])
+
+
+gates = [Gate(config) for config in load_gate_configs()]
+gates_by_bot = {gate.bot.id: gate for gate in gates}
+
+
+# === Middleware: ворота по боту, принявшему апдейт ===
+async def gate_middleware(handler, event, data):
+    # Хендлеры получают ворота аргументом gate; состояние разных ворот не пересекается.
+    # Дальше обновление идёт в планировщик: по порядку внутри чата/заявки,
+    # при переполнении очереди приём (getUpdates, ответ webhook) ждёт здесь
+    gate = gates_by_bot[data["bot"].id]
+    data["gate"] = gate
+    offsets = gate.offsets
+    if offsets:
+        # В обработке с момента постановки в очередь: offset не перескочит
+        # обновление, пока оно ждёт своей очереди
+        if offsets.seen(event.update_id):
+            return None
+        offsets.begin(event.update_id)
+    await scheduler.put(update_key(event, gate.bot.id), lambda: handle_update(handler, event, data, offsets))
+
+
+async def handle_update(handler, event, data, offsets):
+    try:
+        await handler(event, data)
+    finally:
+        if offsets:
+            offsets.finish(event.update_id)
+
+
+async def intent_middleware(handler, event, data):
+    # Текст разбирается один раз; хендлеры и throttle берут готовое data["intent"]
+    data["intent"] = data["gate"].intents.resolve(event.text)
+    return await handler(event, data)
+
+
+async def throttle_middleware(handler, event, data):
+    return await data["gate"].throttle(handler, event, data)
+
+
+dp.update.outer_middleware(gate_middleware)
+dp.message.outer_middleware(intent_middleware)
+dp.message.outer_middleware(throttle_middleware)
+
+# === Метрики ===
+metrics.setup_metrics(dp, session)
+tracing.setup_tracing(dp, session)
+metrics.registry.computed(
+    "gate_open_tasks", "Открытые заявки по состоянию",
+    lambda: {(g.name, state): len(ids) for g in gates for state, ids in g.tasks.by_state.items()},
+    labels=("gate", "state")
+)
+metrics.registry.computed(
+    "gate_oldest_pending_seconds", "Сколько ждёт самая давняя заявка без оператора",
+    lambda: {g.name: next((time.time() - t["state_at"] for _, t in g.tasks.oldest("pending")), 0) for g in gates},
+    labels=("gate",)
+)
+metrics.registry.computed(
+    "gate_outbox_in_flight", "Исходящие сообщения в очереди",
+    lambda: {g.name: g.outbox.in_flight for g in gates}, labels=("gate",)
+)
+metrics.registry.computed("gate_jobs_pending", "Фоновые задания в очереди", lambda: jobs.pending)
+metrics.registry.computed("gate_update_pending", "Обновления в очереди планировщика", lambda: scheduler.pending)
+metrics.registry.computed(
+    "gate_update_keys", "Чаты и заявки с обновлениями в очереди",
+    lambda: {kind: sum(1 for key in scheduler.queues if key[1] == kind) for kind in ("chat", "task")},
+    labels=("kind",)
+)
+metrics.registry.computed(
+    "gate_update_key_depth_max", "Самая длинная очередь одного чата или заявки",
+    lambda: max(scheduler.depths().values(), default=0)
+)
+metrics.registry.computed(
+    "gate_controller_connected", "Есть связь с контроллером ворот",
+    lambda: {g.name: int(g.controller.connected.is_set()) for g in gates if g.controller}, labels=("gate",)
+)
+metrics.registry.computed(
+    "gate_outbox_total", "Исходящие сообщения по итогу",
+    lambda: {(g.name, result): getattr(g.outbox, result) for g in gates for result in ("sent", "retried", "dropped")},
+    labels=("gate", "result"), kind="counter"
 )
 
 # === Команда /start ===
 @dp.message(Command("start"))
-async def cmd_start(message: types.Message):
-    await message.answer(
-        "Привет! Выберите действие:",
-        reply_markup=main_kb
-    )
+async def cmd_start(message: types.Message, gate: Gate):
+    await message.answer(gate.greeting, reply_markup=gate.main_kb)
 
 # === Команда /id ===
 @dp.message(Command("id"))
@@ -43,7 +551,7 @@ async def get_id(message: types.Message):
 
 # === Команда /help ===
 @dp.message(Command("help"))
-async def cmd_help(message: types.Message):
+async def cmd_help(message: types.Message, gate: Gate):
     text = (
         "📘 <b>Справка по управлению воротами</b>\n\n"
         "🔹 <b>Прошу открыть въезд 🚗</b> — отправляет запрос операторам открыть ворота для въезда.\n"
@@ -51,134 +559,361 @@ async def cmd_help(message: types.Message):
         "🔹 После нажатия оператор получает уведомление и нажимает «Сделано».\n"
         "🔹 Когда ворота открыты, вы получите сообщение с кнопкой «👍 Спасибо».\n"
         "🔹 После «Спасибо» оператору приходит уведомление о благодарности 👏.\n\n"
+        f"🔹 Вместо кнопок можно отправить цифру: {gate.intents.shortcuts()} "
+        "(оператору: 3 — выполнено).\n\n"
         "📍 Дополнительные команды:\n"
         "/id — показать ваш Telegram ID\n"
+        "/my — ваши активные заявки\n"
         "/start — перезапуск меню\n"
     )
-    await message.answer(text, parse_mode="HTML", reply_markup=main_kb)
+    await message.answer(text, parse_mode="HTML", reply_markup=gate.main_kb)
+
+# === Команда /sendstats (только для администратора) ===
+@dp.message(Command("sendstats"))
+async def cmd_sendstats(message: types.Message, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    st = gate.outbox.stats()
+    await message.answer(
+        f"Отправлено: {st['sent']}\n"
+        f"Повторов: {st['retried']}\n"
+        f"Потеряно: {st['dropped']}\n"
+        f"В полёте: {st['in_flight']}\n"
+        f"Задержка p50/p95/p99: {st['latency_p50'] * 1000:.0f}/"
+        f"{st['latency_p95'] * 1000:.0f}/{st['latency_p99'] * 1000:.0f} мс"
+    )
+
+# === Команда /stats — сводка по журналу заявок (только для администратора) ===
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message, command: CommandObject, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    days = int(command.args) if command.args and command.args.strip().isdigit() else 7
+    await journal.refresh()  # в кластере — и заявки других процессов
+    await message.answer(stats_text(journal.rollups, gate.name, max(1, min(days, ROLLUP_DAYS))))
+
+# === Команда /profile — профилирование на окно (только для администратора) ===
+@dp.message(Command("profile"))
+async def cmd_profile(message: types.Message, command: CommandObject, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    settings = profile_signal_settings()
+    args = (command.args or "").split()
+    seconds = float(args[0]) if args and args[0].isdigit() else settings["seconds"]
+    mode = args[1] if len(args) > 1 and args[1] in MODES else settings["mode"]
+    chat_id = message.chat.id
+
+    async def report(summary):
+        await gate.outbox.send(chat_id, summary[:4000])
+
+    if not profiler.start(seconds, mode, on_done=report):
+        await message.answer("Профилирование уже идёт, дождитесь результата.")
+        return
+    await message.answer(f"Профилирование ({mode}) на {seconds:.0f} с, результат пришлю сюда.\n"
+                         f"Использование: /profile [секунд] [{'|'.join(MODES)}]")
+
+# === Команда /queues — очередь входящих обновлений (только для администратора) ===
+@dp.message(Command("queues"))
+async def cmd_queues(message: types.Message, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    st = scheduler.stats()
+    deepest = "\n".join(f"  {kind} {key}: {depth}" for (_, kind, key), depth in st["deepest"] if depth)
+    await message.answer(
+        f"В очереди: {st['pending']} (предел {scheduler.max_pending})\n"
+        f"Чатов и заявок в очереди: {st['keys']}\n"
+        f"Обработано: {st['done']}, с ошибкой: {st['failed']}\n"
+        f"Приём ждал места: {st['throttled']} раз, {st['throttled_seconds']:.1f} с\n"
+        f"Самая длинная очередь с запуска: {st['max_depth']}"
+        + (f"\nДлиннее всего сейчас:\n{deepest}" if deepest else "")
+    )
+
+# === Команда /gate — состояние контроллера ворот (только для администратора) ===
+@dp.message(Command("gate"))
+async def cmd_gate(message: types.Message, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    if not gate.controller:
+        await message.answer("Контроллер ворот не подключён (GATE_MODE=off).")
+        return
+    st = gate.controller.stats()
+    await message.answer(
+        f"Режим: {gate.gate_mode}\n"
+        f"Связь: {'есть' if st['connected'] else 'нет'}\n"
+        f"Открытий: {st['opened']}, отказов: {st['failed']}, без ответа: {st['unknown']}\n"
+        f"Переподключений: {st['reconnects']}\n"
+        f"Ответ платы p50/p95/p99: {st['latency_p50'] * 1000:.0f}/"
+        f"{st['latency_p95'] * 1000:.0f}/{st['latency_p99'] * 1000:.0f} мс"
+    )
+
+# === Команда /rules — правила автодопуска (только для администратора) ===
+@dp.message(Command("rules"))
+async def cmd_rules(message: types.Message, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    if not gate.rules:
+        await message.answer("Правила автодопуска не загружены (нужны RULES_FILE и GATE_URL).")
+        return
+    st = gate.rules.stats()
+    await message.answer(
+        f"Правил: {st['rules']}\n"
+        f"Пропущено автоматически: {st['approved']}, передано операторам: {st['rejected']}\n"
+        f"Проходов по правилам сегодня: {sum(st['today'].values())}"
+    )
+
+# === Команда /my — активные заявки клиента (и взятые оператором) ===
+MY_STATE_LABELS = {
+    "pending": "ожидает оператора",
+    "claimed": "оператор открывает",
+    "done": "выполнена, ждёт «Спасибо»",
+    "ignored": "отклонена",
+}
+
+
+@dp.message(Command("my"))
+async def cmd_my(message: types.Message, gate: Gate):
+    user_id = message.from_user.id
+    tasks = gate.tasks
+    lines = []
+    for task_id in tasks.user_tasks(user_id):
+        task = tasks.get(task_id)
+        if task is None:
+            continue
+        # Имя оператора есть уже у взятой заявки — подпись берём по состоянию
+        lines.append(f"• {task['direction']} — {MY_STATE_LABELS.get(task['state'], task['state'])}")
+    for task_id in tasks.operator_tasks(user_id):
+        task = tasks.get(task_id)
+        if task is None:
+            continue
+        lines.append(f"• [ОПЕРАТОР] {task['direction']} для @{task['user_name']}")
+    if not lines:
+        await message.answer("Активных заявок нет.", reply_markup=gate.main_kb)
+        return
+    await message.answer("Активные заявки:\n" + "\n".join(lines), reply_markup=gate.main_kb)
+
+# === Смена оператора: /shift_on, /shift_off ===
+@dp.message(Command("shift_on", "shift_off"))
+async def cmd_shift(message: types.Message, command: CommandObject, gate: Gate):
+    op_id = message.from_user.id
+    if not gate.is_operator(op_id):
+        return
+    on = command.command == "shift_on"
+    await gate.roster_store.set_shift(op_id, on)
+    await message.answer("[ОПЕРАТОР] Вы на смене ✅" if on else "[ОПЕРАТОР] Смена закончена, новые заявки не придут.")
+
+# === Состав операторов (только для администратора) ===
+# /roster — кто оператор и кто на смене; /op_add ID, /op_del ID; /shift ID on|off
+def parse_user_id(command: CommandObject) -> int | None:
+    arg = (command.args or "").split()
+    return int(arg[0]) if arg and arg[0].lstrip("-").isdigit() else None
+
+
+def roster_text(roster) -> str:
+    lines = [f"• {op} — {'на смене ✅' if op in roster.on_shift_ids else 'не на смене'}" for op in roster.operators]
+    return "Операторы:\n" + ("\n".join(lines) if lines else "нет")
+
+
+@dp.message(Command("roster"))
+async def cmd_roster(message: types.Message, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    await message.answer(roster_text(gate.roster))
+
+
+@dp.message(Command("op_add", "op_del"))
+async def cmd_operator(message: types.Message, command: CommandObject, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    op_id = parse_user_id(command)
+    if op_id is None:
+        await message.answer(f"Укажите Telegram ID: /{command.command} 123456789")
+        return
+    if command.command == "op_add":
+        roster = await gate.roster_store.add_operator(op_id)
+    else:
+        roster = await gate.roster_store.remove_operator(op_id)
+    await message.answer(roster_text(roster))
+
+
+@dp.message(Command("shift"))
+async def cmd_shift_admin(message: types.Message, command: CommandObject, gate: Gate):
+    if not gate.roster.is_admin(message.from_user.id):
+        return
+    op_id = parse_user_id(command)
+    mode = (command.args or "").split()[1:2]
+    if op_id is None or mode not in (["on"], ["off"]) or not gate.is_operator(op_id):
+        await message.answer("Использование: /shift ID on|off (ID — из /roster)")
+        return
+    roster = await gate.roster_store.set_shift(op_id, mode == ["on"])
+    await message.answer(roster_text(roster))
 
 # === Обработка запросов клиента ===
-@dp.message(F.text.in_(["Прошу открыть въезд 🚗", "🚗 Прошу открыть выезд"]))
-async def handle_request(message: types.Message):
-    direction = "въезд" if "въезд" in message.text else "выезд"
+@dp.message(intent_is(REQUEST))
+async def handle_request(message: types.Message, gate: Gate, intent):
+    direction = intent.arg
     user_id = message.from_user.id
     user_name = message.from_user.username or message.from_user.first_name
-    task_id = str(uuid.uuid4())
-
-    # Клиенту
-    user_msg = await message.answer(
-        f"[КЛИЕНТ] Заявка направлена операторам. Ожидайте ⏳",
-        reply_markup=main_kb
-    )
+    task_id = await gate.tasks.next_id()
+    trace_id = tracing.bind(None, task_id=task_id)  # трейс хендлера становится трейсом заявки
 
-    tasks[task_id] = {
+    # Заявку заводим до первой отправки: повторное нажатие, пришедшее, пока мы
+    # отвечаем клиенту, уже увидит её и не создаст вторую (next_id и create
+    # хранилища в памяти цикл не уступают)
+    task = await gate.tasks.create(task_id, {
         "user_id": user_id,
         "user_name": user_name,
         "direction": direction,
-        "user_msg_id": user_msg.message_id
-    }
-
-    # Операторам
-    for op_id in OPERATORS:
-        try:
-            kb = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="✅ Сделано", callback_data=f"done:{task_id}"),
-                InlineKeyboardButton(text="❌ Игнорировать", callback_data=f"ignore:{task_id}")
-            ]])
-            await bot.send_message(
-                int(op_id),
-                f"[ОПЕРАТОР] @{user_name} просит открыть {direction}",
-                reply_markup=kb
-            )
-        except Exception as e:
-            print(f"[Ошибка уведомления оператору {op_id}]: {e}")
+        "user_msg_id": None,
+        "operator_msgs": [],
+        "trace_id": trace_id
+    })
+    journal.record("created", gate.name, task_id, task)
+    # Сообщения клиенту и операторам отправляются фоном
+    rule = gate.rules.decide(user_id, direction) if gate.rules else None
+    if rule or gate.gate_mode == "auto":
+        gate.submit(task_id, lambda: gate.auto_open_task(task_id, rule))
+    else:
+        gate.submit(task_id, lambda: gate.announce_task(task_id))
 
 # === Действия оператора ===
-@dp.callback_query(F.data.startswith(("done:", "ignore:")))
-async def handle_operator_action(callback: types.CallbackQuery):
-    action, task_id = callback.data.split(":")
+@dp.callback_query(callback_is("done", "ignore"))
+async def handle_operator_action(callback: types.CallbackQuery, gate: Gate, action: str, task_id):
+    # Кнопки заявки мог переслать кто угодно — нажимать их вправе только операторы
+    if not gate.is_operator(callback.from_user.id):
+        await gate.outbox.call(None, callback.answer, "Заявку могут взять только операторы.", show_alert=True)
+        return
+    tasks = gate.tasks
     task = tasks.get(task_id)
     if not task:
-        await callback.answer("Заявка уже закрыта или не найдена.")
+        await gate.outbox.call(None, callback.answer, "Заявка уже закрыта или не найдена.")
         return
+    tracing.bind(task.get("trace_id"), task_id=task_id, action=action)
 
-    user_id = task["user_id"]
-    user_name = task["user_name"]
-    direction = task["direction"]
+    # Первый нажавший забирает заявку; остальным — короткий ответ без лишних вызовов
+    operator_id = callback.from_user.id
     operator_name = callback.from_user.username or callback.from_user.first_name
-    task["operator_name"] = operator_name
-
-    # Удаляем сообщение клиента с "Ожидайте"
-    user_msg_id = task.get("user_msg_id")
-    if user_msg_id:
-        try:
-            await bot.delete_message(chat_id=user_id, message_id=user_msg_id)
-        except:
-            pass
+    if not await gate.take_task(task_id, action, operator_id, operator_name):
+        await gate.outbox.call(None, callback.answer,
+                               f"Заявку уже взял @{task.get('operator_name') or 'другой оператор'}.")
+        return
 
+    # Состояние записано — отпускаем кнопку, сообщения уходят фоном
+    await gate.outbox.call(None, callback.answer)
     if action == "ignore":
-        await callback.message.edit_text(f"[ОПЕРАТОР] Заявка от @{user_name} на {direction} была проигнорирована.")
-        tasks.pop(task_id, None)
+        gate.submit(task_id, lambda: gate.finish_ignored(task_id, operator_name))
+    else:
+        gate.submit(task_id, lambda: gate.finish_done(task_id, operator_id, operator_name))
+
+# === Обработка кнопки "Спасибо" ===
+@dp.callback_query(callback_is("thank"))
+async def handle_thank(callback: types.CallbackQuery, gate: Gate, task_id):
+    task = await gate.thank_task(task_id)
+    if not task:
+        await gate.outbox.call(None, callback.answer, "Заявка уже закрыта.")
         return
+    tracing.bind(task.get("trace_id"), task_id=task_id)
 
-    # Сообщение оператору
-    await callback.message.edit_text(
-        f"[ОПЕРАТОР] Заявка для @{user_name} на {direction} выполнена."
-    )
+    # Подтверждаем пользователю, что обратная связь отправлена; остальное — фоном
+    await gate.outbox.call(None, callback.answer, "Обратная связь отправлена.")
+    # Сообщение с кнопкой Спасибо — тоже в уборку (thank_msg_id мог не успеть записаться)
+    task["msgs"] = [*task.get("msgs", ()), (task["user_id"], callback.message.message_id)]
+    gate.submit(task_id, lambda: gate.finish_thanks(task))
 
-    # Клиенту
-    thank_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👍 Спасибо", callback_data=f"thank:{task_id}")]
-    ])
-    await bot.send_message(
-        user_id,
-        f"[КЛИЕНТ] Ворота {direction} открыты оператором @{operator_name}",
-        reply_markup=thank_kb
-    )
+# === Кнопка, подпись которой не сошлась: от прошлого запуска, другого бота или подделка ===
+@dp.callback_query()
+async def handle_stale_button(callback: types.CallbackQuery, gate: Gate):
+    await gate.outbox.call(None, callback.answer, "Кнопка устарела.")
 
-# === Обработка кнопки "Спасибо" ===
-@dp.callback_query(F.data.startswith("thank:"))
-async def handle_thank(callback: types.CallbackQuery):
-    task_id = callback.data.split(":")[1]
-    task = tasks.pop(task_id, None)
-    if not task:
-        await callback.answer("Заявка уже закрыта.")
+# === «3» / «сделано» текстом: оператор берёт самую давнюю ждущую заявку ===
+@dp.message(intent_is(DONE))
+async def handle_done_text(message: types.Message, gate: Gate):
+    operator_id = message.from_user.id
+    if not gate.is_operator(operator_id):
+        await message.answer("Эта команда только для операторов.", reply_markup=gate.main_kb)
         return
+    operator_name = message.from_user.username or message.from_user.first_name
+    for task_id, task in gate.tasks.oldest("pending"):
+        if task.get("assigned_to") not in (None, operator_id):
+            continue  # адресная заявка другого оператора
+        if await gate.take_task(task_id, "done", operator_id, operator_name):
+            tracing.bind(task.get("trace_id"), task_id=task_id, action="done")
+            gate.submit(task_id, lambda: gate.finish_done(task_id, operator_id, operator_name))
+            return
+    await message.answer("[ОПЕРАТОР] Заявок, ожидающих оператора, нет.")
 
-    user_id = task["user_id"]
-    user_name = task["user_name"]
-    direction = task["direction"]
-    operator_name = task.get("operator_name", "оператор")
+# === «4» / «спасибо» текстом: за последнюю выполненную заявку клиента ===
+@dp.message(intent_is(THANKS))
+async def handle_thank_text(message: types.Message, gate: Gate):
+    tasks = gate.tasks
+    for task_id in reversed(tasks.user_tasks(message.from_user.id)):
+        task = tasks.get(task_id)
+        if task and task["state"] == "done" and (task := await gate.thank_task(task_id)):
+            tracing.bind(task.get("trace_id"), task_id=task_id)
+            gate.submit(task_id, lambda: gate.finish_thanks(task))
+            return
+    await message.answer("Нет выполненной заявки, за которую можно поблагодарить.", reply_markup=gate.main_kb)
 
-    # Убираем сообщение с кнопкой Спасибо
-    try:
-        await callback.message.delete()
-    except:
-        pass
-
-    # Отправляем главное меню клиенту
-    await bot.send_message(
-        user_id,
-        f"[КЛИЕНТ] Заявка на {direction} выполнена @{operator_name}",
-        reply_markup=main_kb  # Главное меню с кнопками
+# === Непонятный текст: подсказка, но не чаще раза в HINT_INTERVAL ===
+@dp.message(F.text)
+async def handle_unknown_text(message: types.Message, gate: Gate):
+    if message.chat.type != "private" or not gate.intents.should_hint(message.from_user.id):
+        return
+    await gate.outbox.send(
+        message.chat.id,
+        f"Не понял сообщение 🤔 Нажмите кнопку ниже или отправьте цифру: {gate.intents.shortcuts()}. "
+        "Справка — /help.",
+        reply_markup=gate.main_kb
     )
 
-    # Отправляем уведомление оператору о благодарности
-    for op_id in OPERATORS:
-        try:
-            await bot.send_message(
-                int(op_id),
-                f"[ОПЕРАТОР] 👏 Спасибо за {direction} от @{user_name}"
-            )
-        except:
-            pass
-
-    # Подтверждаем пользователю, что обратная связь отправлена
-    await callback.answer("Обратная связь отправлена.")
 
 async def main():
-    print("🚀 Бот запущен. Ожидаем события...")
-    await dp.start_polling(bot, skip_updates=True)
+    if CLUSTER["workers"] > 1:
+        await run_master(sys.modules[__name__], CLUSTER["workers"])
+        return
+    if BOT_MODE == "webhook" and len(gates) > 1:
+        raise SystemExit("BOT_MODE=webhook поддерживает одни ворота; для нескольких используйте polling")
+    for gate in gates:
+        await gate.start()
+    jobs.start()
+    scheduler.start()
+    tracing.tracer.open(**tracing_settings())
+    await journal.open()
+    profiler.attach(dp, Gate)
+    profiler.install_signal(**profile_signal_settings())
+    metrics_runner = None
+    if METRICS_PORT and BOT_MODE != "webhook":
+        metrics_runner = await metrics.start_metrics_server("0.0.0.0", METRICS_PORT)
+    print(f"🚀 Бот запущен ({BOT_MODE}, ворот: {len(gates)}). Ожидаем события...")
+    bots = [gate.bot for gate in gates]
+    try:
+        for gate in gates:
+            if gate.offsets:
+                # Дочитываем накопившееся через getUpdates (webhook на это время снимаем)
+                await gate.bot.delete_webhook(drop_pending_updates=False)
+                await drain_backlog(gate.bot, dp, gate.offsets, collapse_key=gate.request_key,
+                                    max_age=gate.config["catchup_max_age"], settle=scheduler.wait_idle)
+            elif BOT_MODE != "webhook":
+                # Без дочитывания накопившееся у этих ворот отбрасываем — решение
+                # по каждым воротам, а не одним флагом skip_updates на всех
+                await gate.bot.delete_webhook(drop_pending_updates=True)
+        if BOT_MODE == "webhook":
+            gate = gates[0]
+            await run_webhook(dp, gate.bot, drop_pending_updates=not gate.offsets, background=False,
+                              setup_app=metrics.add_metrics_route, **webhook_settings())
+        else:
+            # handle_as_tasks=False: следующий getUpdates — только когда пачка
+            # разложена по очередям планировщика (см. scheduler.py)
+            await dp.start_polling(*bots, handle_as_tasks=False)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await scheduler.close()
+        await jobs.close()
+        await journal.close()
+        await tracing.tracer.close()
+        for gate in gates:
+            await gate.close()
+        await session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
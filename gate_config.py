@@ -0,0 +1,93 @@
+import json
+import os
+
+from assignment import assign_settings
+from catchup import catchup_settings
+from gate_controller import gate_settings
+from rules import rules_settings
+from roster import roster_settings
+
+# === Настройки ворот ===
+# Один процесс может обслуживать несколько ворот, у каждых свой бот.
+# Без GATES_FILE ворота одни и настраиваются переменными окружения, как раньше.
+# С GATES_FILE=gates.json — список ворот; чего нет в записи, берётся из окружения,
+# кроме того, что у каждых ворот своё: имя (без name — gate1, gate2, ...),
+# база заявок и offset (без task_db / offset_file — TASK_DB и OFFSET_FILE
+# с именем ворот: tasks-north.db, offset-north.json). Общая база дала бы
+# двум ботам одни id заявок, а общий offset — чужие номера обновлений.
+#
+#   {"gates": [
+#     {"name": "north", "token": "123:AAA", "operators": [111, 222], "admin_id": 111,
+#      "operator_mode": "board", "gate_url": "tcp://10.0.0.5:7000", "gate_mode": "on_done",
+#      "task_db": "north.db", "offset_file": "north_offset.json",
+#      "directions": {"Прошу открыть въезд 🚗": "въезд", "🚗 Прошу открыть выезд": "выезд"},
+#      "greeting": "Северные ворота. Выберите действие:"},
+#     {"name": "south", "token": "456:BBB", "operators": [333]}
+#   ]}
+
+DEFAULT_DIRECTIONS = {"Прошу открыть въезд 🚗": "въезд", "🚗 Прошу открыть выезд": "выезд"}
+DEFAULT_GREETING = "Привет! Выберите действие:"
+
+
+def env_gate_config() -> dict:
+    gate = gate_settings()
+    rules = rules_settings()
+    catchup = catchup_settings()
+    assign = assign_settings()
+    roster = roster_settings()
+    return {
+        "name": os.getenv("GATE_NAME", "main"),
+        "token": os.getenv("BOT_TOKEN"),
+        "operators": os.getenv("OPERATORS", "").split(",") if os.getenv("OPERATORS") else [],
+        "admin_id": int(os.getenv("ADMIN_ID", "0")),
+        "roster_file": roster["path"],  # состав и смены, правятся на лету (см. roster.py)
+        "roster_reload": roster["reload_interval"],
+        "operator_mode": os.getenv("OPERATOR_MODE", "messages"),  # messages — сообщение на заявку, board — табло
+        "assign_mode": assign["mode"],  # targeted — заявка одному оператору (только в режиме messages)
+        "assign_timeout": assign["timeout"],
+        "gate_url": gate.pop("url"),
+        "gate_mode": gate.pop("mode"),  # on_done|auto — бот сам управляет реле ворот
+        "gate": gate,                   # таймауты и импульс контроллера
+        "rules_file": rules["path"],    # автодопуск известных клиентов (нужен gate_url)
+        "rules_audit": rules["audit_path"],
+        "rules_reload": rules["reload_interval"],
+        "task_store": os.getenv("TASK_STORE", "memory"),
+        "task_db": os.getenv("TASK_DB", "tasks.db"),
+        "catchup": catchup["enabled"],
+        "offset_file": catchup["offset_file"],
+        "catchup_max_age": catchup["max_age"],
+        "directions": DEFAULT_DIRECTIONS,
+        "greeting": DEFAULT_GREETING,
+    }
+
+
+PER_GATE_KEYS = ("name", "task_db", "offset_file")
+
+
+def gate_path(path: str, name: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}-{name}{ext}"
+
+
+def load_gate_configs(path: str | None = None) -> list[dict]:
+    path = path if path is not None else os.getenv("GATES_FILE", "")
+    defaults = env_gate_config()
+    if not path:
+        return [defaults]
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["gates"]
+    configs = []
+    for n, entry in enumerate(entries):
+        config = {key: value for key, value in defaults.items() if key not in PER_GATE_KEYS}
+        config.update(entry)
+        config["operators"] = [str(op) for op in config["operators"]]
+        config["admin_id"] = int(config["admin_id"])
+        name = config.setdefault("name", f"gate{n + 1}")
+        config.setdefault("task_db", gate_path(defaults["task_db"], name))
+        config.setdefault("offset_file", gate_path(defaults["offset_file"], name))
+        configs.append(config)
+    for key in PER_GATE_KEYS:
+        values = [c[key] for c in configs]
+        if len(set(values)) != len(values):
+            raise ValueError(f"Повторяющиеся {key} ворот в {path}: {values}")
+    return configs
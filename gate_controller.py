@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+
+import metrics
+import tracing
+
+# === Контроллер ворот (плата реле) ===
+# Строчный протокол поверх TCP или последовательного порта:
+#   бот   -> "<seq> OPEN <реле> <мс>\n"   импульс на реле
+#   бот   -> "<seq> PING\n"               проверка связи
+#   плата -> "<seq> OK\n" | "<seq> PONG\n" | "<seq> ERR <причина>\n"
+# Номер seq связывает ответ с командой, поэтому запоздавший ответ на
+# команду, по которой уже истёк таймаут, просто отбрасывается.
+# OPEN, ушедший в канал, не повторяется: без ответа неизвестно, сработало
+# ли реле, а повтор под новым seq дал бы второй импульс. Такой исход
+# open() возвращает как None («неизвестно»), а не False («не открыто»);
+# повторяется только то, что до платы не дошло, и PING.
+# Соединение поднимается заново с нарастающей паузой; раз в
+# GATE_HEALTH_INTERVAL плата опрашивается PING-ом, молчание — переподключение.
+#
+# GATE_URL: tcp://host:port или serial:///dev/ttyUSB0?baud=9600
+# (для serial нужен pyserial-asyncio; pty-заглушка открывается так же).
+
+GATE_TIMEOUT = 2.0           # сек на ответ платы
+GATE_RETRIES = 1             # повторов команды, не дошедшей до платы (PING — и при таймауте)
+GATE_HEALTH_INTERVAL = 10.0  # сек между PING
+GATE_PULSE_MS = 1000         # длительность импульса на реле
+RECONNECT_MAX = 30.0         # сек, предел паузы между переподключениями
+GATE_RELAYS = {"въезд": 1, "выезд": 2}
+
+controller_seconds = metrics.registry.histogram(
+    "gate_controller_seconds", "Время ответа контроллера ворот", ("gate", "command")
+)
+controller_errors = metrics.registry.counter(
+    "gate_controller_errors_total", "Команды контроллеру без ответа", ("gate", "command")
+)
+
+
+class GateController:
+    def __init__(self, url: str, timeout: float = GATE_TIMEOUT, retries: int = GATE_RETRIES,
+                 health_interval: float = GATE_HEALTH_INTERVAL, pulse_ms: int = GATE_PULSE_MS,
+                 relays: dict | None = None, name: str = ""):
+        self.url = url
+        self.name = name  # метка ворот в метриках
+        self.timeout = timeout
+        self.retries = retries
+        self.health_interval = health_interval
+        self.pulse_ms = pulse_ms
+        self.relays = relays or GATE_RELAYS
+
+        self.writer: asyncio.StreamWriter | None = None
+        self.connected = asyncio.Event()
+        self.waiting: dict[int, asyncio.Future] = {}
+        self.seq = itertools.count(1)
+        self.supervisor: asyncio.Task | None = None
+        self.closing = False
+
+        self.latencies = deque(maxlen=1000)
+        self.opened = 0
+        self.failed = 0
+        self.unknown = 0  # OPEN ушёл, ответа нет
+        self.reconnects = 0
+
+    # === Соединение ===
+    async def _connect(self):
+        parsed = urlparse(self.url)
+        if parsed.scheme == "tcp":
+            return await asyncio.open_connection(parsed.hostname, parsed.port)
+        if parsed.scheme == "serial":
+            try:
+                import serial_asyncio
+            except ImportError:
+                raise RuntimeError("Для GATE_URL=serial://... установите pyserial-asyncio")
+            baud = int(parse_qs(parsed.query).get("baud", ["9600"])[0])
+            return await serial_asyncio.open_serial_connection(url=parsed.path, baudrate=baud)
+        raise ValueError(f"Неизвестная схема GATE_URL: {self.url}")
+
+    def start(self):
+        if self.supervisor is None:
+            self.supervisor = asyncio.create_task(self._supervise())
+
+    async def _supervise(self):
+        backoff = 0.5
+        while not self.closing:
+            try:
+                reader, writer = await asyncio.wait_for(self._connect(), self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"[LOG] Контроллер ворот недоступен ({e!r}), повтор через {backoff:.1f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX)
+                continue
+            backoff = 0.5
+            self.writer = writer
+            self.connected.set()
+            print(f"[LOG] Контроллер ворот подключён: {self.url}")
+            health = asyncio.create_task(self._health_loop())
+            try:
+                await self._read_loop(reader)
+            finally:
+                health.cancel()
+                self._disconnect()
+            if not self.closing:
+                self.reconnects += 1
+                print("[LOG] Связь с контроллером ворот потеряна, переподключаемся")
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                line = await reader.readline()
+            except (OSError, asyncio.IncompleteReadError):
+                return
+            if not line:
+                return
+            seq, _, reply = line.decode(errors="replace").strip().partition(" ")
+            future = self.waiting.get(int(seq)) if seq.isdigit() else None
+            if future and not future.done():
+                future.set_result(reply)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            if (await self._send_once("PING"))[1] != "PONG":
+                print("[LOG] Контроллер ворот не ответил на PING")
+                self._disconnect()
+                return
+
+    def _disconnect(self):
+        self.connected.clear()
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        for future in self.waiting.values():
+            if not future.done():
+                future.set_exception(ConnectionError("соединение с контроллером закрыто"))
+
+    # === Команды ===
+    async def _send_once(self, command: str) -> tuple[bool, str | None]:
+        # (ушла ли команда в канал, ответ платы или None)
+        if not self.connected.is_set():
+            try:
+                await asyncio.wait_for(self.connected.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                return False, None
+        writer = self.writer
+        if writer is None:
+            return False, None
+        seq = next(self.seq)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[seq] = future
+        name = command.split(" ", 1)[0]
+        started = time.perf_counter()
+        try:
+            writer.write(f"{seq} {command}\n".encode())
+            await writer.drain()
+            reply = await asyncio.wait_for(future, self.timeout)
+        except (OSError, ConnectionError, asyncio.TimeoutError):
+            controller_errors.inc(self.name, name)
+            return True, None
+        finally:
+            self.waiting.pop(seq, None)
+        elapsed = time.perf_counter() - started
+        controller_seconds.observe(elapsed, self.name, name)
+        self.latencies.append(elapsed)
+        return True, reply
+
+    async def command(self, command: str, idempotent: bool = False) -> tuple[bool, str | None]:
+        # idempotent — повтор безопасен (PING); иначе повторяем, только если команда не ушла
+        sent = False
+        for attempt in range(self.retries + 1):
+            sent, reply = await self._send_once(command)
+            if reply is not None or (sent and not idempotent):
+                return sent, reply
+            print(f"[LOG] Контроллер ворот не ответил на {command!r} (попытка {attempt + 1})")
+        return sent, None
+
+    async def open(self, direction: str) -> bool | None:
+        # True — открыто, False — не открыто, None — неизвестно (OPEN ушёл, ответа нет)
+        relay = self.relays.get(direction)
+        if relay is None:
+            print(f"[LOG] Для направления {direction} не задано реле")
+            return False
+        with tracing.child("gate.open", direction=direction) as span:
+            sent, reply = await self.command(f"OPEN {relay} {self.pulse_ms}")
+            if span:
+                span.attrs["reply"] = reply
+        if reply == "OK":
+            self.opened += 1
+            return True
+        if sent and reply is None:
+            self.unknown += 1
+            print(f"[LOG] Контроллер ворот не подтвердил открытие ({direction}): неизвестно, сработало ли реле")
+            return None
+        self.failed += 1
+        if reply is not None:
+            print(f"[LOG] Контроллер ворот отказал ({direction}): {reply}")
+        return False
+
+    def stats(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return lat[min(len(lat) - 1, int(len(lat) * p))] if lat else 0.0
+
+        return {
+            "connected": self.connected.is_set(),
+            "opened": self.opened,
+            "failed": self.failed,
+            "unknown": self.unknown,
+            "reconnects": self.reconnects,
+            "latency_p50": pct(0.50),
+            "latency_p95": pct(0.95),
+            "latency_p99": pct(0.99),
+        }
+
+    async def close(self):
+        self.closing = True
+        self._disconnect()
+        if self.supervisor:
+            self.supervisor.cancel()
+            await asyncio.gather(self.supervisor, return_exceptions=True)
+            self.supervisor = None
+
+
+def gate_settings() -> dict:
+    return {
+        "url": os.getenv("GATE_URL", ""),
+        # off — только переписка; on_done — «Сделано» открывает реле;
+        # auto — бот открывает сам, операторы нужны, только если плата не ответила
+        "mode": os.getenv("GATE_MODE", "off"),
+        "timeout": float(os.getenv("GATE_TIMEOUT", str(GATE_TIMEOUT))),
+        "health_interval": float(os.getenv("GATE_HEALTH_INTERVAL", str(GATE_HEALTH_INTERVAL))),
+        "pulse_ms": int(os.getenv("GATE_PULSE_MS", str(GATE_PULSE_MS))),
+    }
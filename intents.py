@@ -0,0 +1,108 @@
+import os
+import re
+import time
+from typing import NamedTuple
+
+# === Разбор текста клиента и оператора в намерение ===
+# Вместо цепочки фильтров (каждый апдейт проверяется каждым F.text.in_ по
+# очереди, а «ловящий всё» хендлер глотает то, что зарегистрировано после
+# него) — одна таблица: текст нормализуется один раз и ищется одним
+# обращением к dict. В таблице подписи кнопок всех версий бота (у клиентов
+# могла остаться старая клавиатура), цифры 1–4 и короткие синонимы.
+
+REQUEST = "request"   # открыть ворота; arg — направление
+DONE = "done"         # оператор: выполнено
+THANKS = "thanks"     # клиент: спасибо
+
+HINT_INTERVAL = 60    # сек, не чаще одной подсказки на непонятный текст
+MAX_HINTED_USERS = 10000
+
+# Подписи кнопок прежних версий бота: текст -> направление
+LEGACY_DIRECTIONS = {
+    "Прошу открыть ворота ВЪЕЗД 🚗": "въезд",
+    "🚗 Прошу открыть ворота ВЫЕЗД": "выезд",
+    "Прошу открыть въезд 🚗": "въезд",
+    "🚗 Прошу открыть выезд": "выезд",
+}
+DIGITS = {"1": "въезд", "2": "выезд"}
+DIRECTION_ALIASES = ("{}", "открыть {}", "открой {}", "на {}", "ворота {}")
+DONE_ALIASES = ("3", "сделано", "выполнено", "готово")
+THANKS_ALIASES = ("4", "спасибо", "благодарю", "спс")
+
+# Всё, кроме букв, цифр и пробелов (эмодзи, знаки препинания), — выбрасываем
+_NOISE = re.compile(r"[^\w\s]+")
+
+
+class Intent(NamedTuple):
+    action: str
+    arg: str | None = None
+
+
+def intent_is(action: str):
+    # Фильтр хендлера: намерение уже разобрано middleware и лежит в data["intent"].
+    # Асинхронный намеренно: синхронные фильтры aiogram выполняет через to_thread
+    async def check(message, intent: Intent | None = None) -> bool:
+        return intent is not None and intent.action == action
+    return check
+
+
+def normalize(text: str) -> str:
+    return " ".join(_NOISE.sub(" ", text.casefold().replace("ё", "е")).split())
+
+
+class IntentRouter:
+    def __init__(self, directions: dict, hint_interval: float = HINT_INTERVAL):
+        # directions: текст кнопки текущей клавиатуры -> направление
+        self.hint_interval = hint_interval
+        self.table: dict[str, Intent] = {}
+        self.exact: dict[str, Intent] = {}  # подписи кнопок как есть — без нормализации
+        self.hinted: dict[int, float] = {}
+
+        known = set(directions.values())
+        legacy = {text: direction for text, direction in LEGACY_DIRECTIONS.items() if direction in known}
+        for text, direction in {**legacy, **directions}.items():
+            self.exact[text] = Intent(REQUEST, direction)
+            self._add(text, Intent(REQUEST, direction))
+        for digit, direction in DIGITS.items():
+            if direction in known:
+                self._add(digit, Intent(REQUEST, direction))
+        for direction in known:
+            for alias in DIRECTION_ALIASES:
+                self._add(alias.format(direction), Intent(REQUEST, direction))
+        for alias in DONE_ALIASES:
+            self._add(alias, Intent(DONE))
+        for alias in THANKS_ALIASES:
+            self._add(alias, Intent(THANKS))
+
+    def _add(self, text: str, intent: Intent):
+        key = normalize(text)
+        if key and key not in self.table:
+            self.table[key] = intent
+
+    def resolve(self, text: str | None) -> Intent | None:
+        if not text:
+            return None
+        intent = self.exact.get(text)
+        if intent is None:
+            intent = self.table.get(normalize(text))
+        return intent
+
+    def shortcuts(self) -> str:
+        # «1 — въезд, 2 — выезд, 4 — спасибо» — только то, что есть в таблице
+        digits = [f"{digit} — {intent.arg}" for digit in DIGITS if (intent := self.table.get(digit))]
+        return ", ".join([*digits, "4 — спасибо"])
+
+    def should_hint(self, user_id: int, now: float | None = None) -> bool:
+        # Подсказку на непонятный текст шлём не чаще раза в hint_interval
+        now = time.monotonic() if now is None else now
+        last = self.hinted.get(user_id)
+        if last is not None and now - last < self.hint_interval:
+            return False
+        if last is None and len(self.hinted) >= MAX_HINTED_USERS:
+            self.hinted = {u: t for u, t in self.hinted.items() if now - t < self.hint_interval}
+        self.hinted[user_id] = now
+        return True
+
+
+def intent_settings() -> dict:
+    return {"hint_interval": float(os.getenv("HINT_INTERVAL", str(HINT_INTERVAL)))}
@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+
+import metrics
+import tracing
+
+# === Фоновые задания ===
+# Хендлер только меняет состояние заявки и ставит задания на отправку
+# сообщений; кнопка перестаёт «крутиться» сразу после callback.answer.
+# Задания с одним ключом (task_id) выполняются строго по очереди, с разными
+# ключами — параллельно, не больше JOB_WORKERS одновременно.
+# Задание выполняется в контексте того, кто его поставил: спаны задания
+# попадают в трейс заявки, из хендлера которой оно пришло.
+
+JOB_WORKERS = 8
+DRAIN_TIMEOUT = 10  # сек на доработку заданий при остановке
+
+job_wait_seconds = metrics.registry.histogram("gate_job_wait_seconds", "Ожидание задания в очереди")
+job_run_seconds = metrics.registry.histogram("gate_job_run_seconds", "Выполнение задания")
+
+
+class JobQueue:
+    wait_metric = job_wait_seconds
+    run_metric = job_run_seconds
+    kind = "job"  # метка в gate_errors_total и в логе
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers_count = workers
+        self.queues: dict = {}            # key -> deque[(factory, поставлено в)]
+        self.ready: asyncio.Queue = asyncio.Queue()  # ключи, готовые к выполнению
+        self.workers: list[asyncio.Task] = []
+        self.pending = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.closed = False
+
+        self.done = 0
+        self.failed = 0
+
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+
+    def submit(self, key, factory):
+        # factory — функция без аргументов, возвращающая корутину
+        if self.closed:
+            print(f"[LOG] Очередь заданий закрыта, задание {key} отброшено")
+            return
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            # Ключ попадает в ready, только если по нему ничего не выполняется
+            self.ready.put_nowait(key)
+        queue.append((factory, time.perf_counter(), contextvars.copy_context()))
+        self.pending += 1
+        self.idle.clear()
+
+    async def _worker(self):
+        while True:
+            key = await self.ready.get()
+            queue = self.queues[key]
+            factory, enqueued, context = queue.popleft()
+            started = time.perf_counter()
+            self.wait_metric.observe(started - enqueued)
+            try:
+                await asyncio.create_task(self._run(key, factory, started - enqueued), context=context)
+                self.done += 1
+            except Exception as e:
+                self.failed += 1
+                metrics.errors_total.inc(self.kind, type(e).__name__)
+                print(f"[LOG] Ошибка ({self.kind}) {key}: {e!r}")
+            finally:
+                self.run_metric.observe(time.perf_counter() - started)
+                if queue:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.queues[key]
+                self.pending -= 1
+                self._finished()
+
+    def _finished(self):
+        if not self.pending:
+            self.idle.set()
+
+    async def _run(self, key, factory, wait: float):
+        with tracing.child("job", key=str(key), wait_ms=round(wait * 1000, 1)):
+            await factory()
+
+    async def wait_idle(self, timeout: float | None = None) -> bool:
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, timeout: float = DRAIN_TIMEOUT):
+        # Новых заданий не принимаем, дорабатываем уже поставленные
+        self.closed = True
+        if self.pending:
+            print(f"[LOG] Дорабатываем ({self.kind}): {self.pending}")
+            if not await self.wait_idle(timeout):
+                print(f"[LOG] Не успели доработать ({self.kind}): {self.pending}")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+
+def job_settings() -> dict:
+    return {"workers": int(os.getenv("JOB_WORKERS", str(JOB_WORKERS)))}
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from bisect import bisect_left
+
+# === Журнал заявок и сводная статистика ===
+# Каждый переход заявки (created, claimed, done, ignored, thanked, expired)
+# дописывается строкой в журнал — каталог JOURNAL_DIR с сегментами
+# 000001.jsonl, 000002.jsonl, ...; сегмент закрывается по размеру, самые
+# старые сверх JOURNAL_SEGMENTS удаляются. Строка — компактный массив:
+#
+#   [ts, событие, ворота, task_id, направление, оператор, секунд с создания, имя оператора]
+#
+# Секунды считаются при записи (от created_at заявки), поэтому сводка
+# собирается из каждой строки отдельно, без сопоставления с другими.
+#
+# Сводка (Rollups) обновляется сразу при записи: счётчики событий и
+# гистограммы задержек по часам (ворота, час, оператор, направление) и
+# готовые суммы по дням — по воротам, операторам и направлениям. /stats
+# складывает 7 дневных сумм, сколько бы заявок за них ни было. При запуске
+# сводка собирается заново чтением журнала строка за строкой.
+#
+# В кластере у каждого процесса свой каталог JOURNAL_DIR/worker<N>. Чтобы
+# /stats показывал заявки всех процессов, сводка перед ответом дочитывает
+# новые строки из сегментов соседей (с запомненного смещения, только
+# дописанные до конца строки) — файлы пишет каждый в свой, сводка общая.
+#
+#   python journal.py journal/ --days 7   # та же сводка по журналу без бота (и по worker*/)
+
+JOURNAL_DIR = "journal"
+JOURNAL_SEGMENT_BYTES = 4 * 1024 * 1024
+JOURNAL_SEGMENTS = 50
+JOURNAL_FLUSH_INTERVAL = 1.0   # сек
+ROLLUP_DAYS = 35               # сколько дней сводки держать в памяти
+
+EVENTS = ("created", "claimed", "done", "ignored", "thanked", "expired")
+# Границы корзин задержки, сек; p50/p95 оцениваются по верхней границе корзины
+DELAY_BUCKETS = (5, 10, 20, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Cell:
+    # Счётчики событий и гистограммы задержек одной ячейки сводки
+    __slots__ = ("counts", "hists", "sums")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(EVENTS, 0)
+        self.hists: dict[str, list[int]] = {}
+        self.sums: dict[str, float] = {}
+
+    def add(self, event: str, delay: float | None):
+        self.counts[event] += 1
+        if delay is None:
+            return
+        hist = self.hists.get(event)
+        if hist is None:
+            hist = self.hists[event] = [0] * (len(DELAY_BUCKETS) + 1)
+            self.sums[event] = 0.0
+        hist[bisect_left(DELAY_BUCKETS, delay)] += 1
+        self.sums[event] += delay
+
+    def merge(self, other: "Cell"):
+        for event, count in other.counts.items():
+            self.counts[event] += count
+        for event, hist in other.hists.items():
+            mine = self.hists.setdefault(event, [0] * (len(DELAY_BUCKETS) + 1))
+            for i, count in enumerate(hist):
+                mine[i] += count
+            self.sums[event] = self.sums.get(event, 0.0) + other.sums[event]
+
+    def mean(self, event: str) -> float | None:
+        hist = self.hists.get(event)
+        return self.sums[event] / sum(hist) if hist else None
+
+    def quantile(self, event: str, q: float) -> float | None:
+        hist = self.hists.get(event)
+        if not hist:
+            return None
+        rank = q * sum(hist)
+        seen = 0
+        for bound, count in zip(DELAY_BUCKETS + (float("inf"),), hist):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return float("inf")
+
+
+class Rollups:
+    def __init__(self, days: int = ROLLUP_DAYS):
+        self.days = days
+        self.hours: dict[tuple, Cell] = {}  # (ворота, час, оператор, направление)
+        # (ворота, день) -> итог дня, по операторам, по направлениям
+        self.gates: dict[tuple, Cell] = {}
+        self.operators: dict[tuple, dict] = {}
+        self.directions: dict[tuple, dict] = {}
+        self.names: dict = {}  # оператор -> последнее известное имя
+        self.records = 0
+        self.first_day = None
+
+    def add(self, ts: float, event: str, gate: str, direction: str | None,
+            operator, delay: float | None, operator_name: str | None = None):
+        if event not in EVENTS:
+            return
+        hour = int(ts // 3600)
+        day = hour // 24
+        if self.first_day is None:
+            self.first_day = day
+        elif day - self.first_day >= self.days:
+            self.prune(day - self.days + 1)
+        key = (gate, day)
+        for cell in (_cell(self.hours, (gate, hour, operator, direction)),
+                     _cell(self.gates, key),
+                     _cell(self.operators.setdefault(key, {}), operator),
+                     _cell(self.directions.setdefault(key, {}), direction)):
+            cell.add(event, delay)
+        if operator_name:
+            self.names[operator] = operator_name
+        self.records += 1
+
+    def prune(self, first_day: int):
+        # Раньше first_day — из памяти (в журнале остаются, пока жив сегмент);
+        # случается раз в сутки
+        first_hour = first_day * 24
+        self.hours = {k: c for k, c in self.hours.items() if k[1] >= first_hour}
+        for index in (self.gates, self.operators, self.directions):
+            for key in [k for k in index if k[1] < first_day]:
+                del index[key]
+        self.first_day = first_day
+
+    def summary(self, gate: str, days: int = 7, now: float | None = None) -> dict:
+        # Суммы за последние days дней (включая сегодня): по одной ячейке дня на строку
+        today = int((time.time() if now is None else now) // 86400)
+        total = Cell()
+        operators: dict = {}
+        directions: dict = {}
+        for day in range(today - days + 1, today + 1):
+            key = (gate, day)
+            cell = self.gates.get(key)
+            if cell is None:
+                continue
+            total.merge(cell)
+            for operator, cell in self.operators[key].items():
+                _cell(operators, operator).merge(cell)
+            for direction, cell in self.directions[key].items():
+                _cell(directions, direction).merge(cell)
+        return {"total": total, "operators": operators, "directions": directions}
+
+
+def _cell(index: dict, key) -> Cell:
+    cell = index.get(key)
+    if cell is None:
+        cell = index[key] = Cell()
+    return cell
+
+
+class Journal:
+    def __init__(self, path: str = JOURNAL_DIR, segment_bytes: int = JOURNAL_SEGMENT_BYTES,
+                 segments: int = JOURNAL_SEGMENTS, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 cluster_root: str = ""):
+        self.path = path  # пусто — журнал не пишется, сводка только с момента запуска
+        self.cluster_root = cluster_root  # каталог журналов всех процессов кластера; пусто — один процесс
+        self.peer_offsets: dict[str, int] = {}  # сегмент соседа -> сколько байт уже в сводке
+        self.peer_lock = asyncio.Lock()
+        self.segment_bytes = segment_bytes
+        self.segments = segments
+        self.flush_interval = flush_interval
+        self.rollups = Rollups()
+        self.buffer: list = []
+        self.segment: str | None = None
+        self.flusher: asyncio.Task | None = None
+
+        self.written = 0
+        self.dropped = 0
+
+    # === Запись ===
+    def record(self, event: str, gate: str, task_id: str, task: dict | None = None,
+               operator=None, operator_name: str | None = None, since: float | None = None):
+        # since — от какого момента считать задержку (по умолчанию от создания заявки)
+        ts = time.time()
+        task = task or {}
+        direction = task.get("direction")
+        start = since if since is not None else task.get("created_at")
+        delay = round(ts - start, 3) if start and event != "created" else None
+        self.rollups.add(ts, event, gate, direction, operator, delay, operator_name)
+        if self.path:
+            self.buffer.append([round(ts, 3), event, gate, task_id, direction, operator, delay, operator_name])
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer or not self.path:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except OSError as e:
+            self.dropped += len(batch)
+            print(f"[LOG] Не удалось записать журнал заявок в {self.path}: {e}")
+
+    def _write(self, batch: list):
+        lines = "".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in batch)
+        with open(self.segment, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        if size >= self.segment_bytes:
+            self._rotate()
+
+    def _segment_files(self) -> list[str]:
+        return sorted(glob.glob(os.path.join(self.path, "[0-9]" * 6 + ".jsonl")))
+
+    def _rotate(self):
+        # Новый сегмент с номером на единицу больше; лишние старые удаляем
+        files = self._segment_files()
+        number = int(os.path.basename(files[-1])[:6]) + 1 if files else 1
+        self.segment = os.path.join(self.path, f"{number:06d}.jsonl")
+        for old in files[:max(0, len(files) + 1 - self.segments)]:
+            os.remove(old)
+
+    # === Запуск: сводка из журнала ===
+    def load(self) -> int:
+        # Читаем сегменты по порядку, строку за строкой; в память журнал целиком не попадает
+        os.makedirs(self.path, exist_ok=True)
+        files = self._segment_files()
+        broken = 0
+        for name in files:
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        ts, event, gate, _, direction, operator, delay, operator_name = json.loads(line)
+                    except ValueError:
+                        broken += 1  # недописанная строка при падении
+                        continue
+                    self.rollups.add(ts, event, gate, direction, operator, delay, operator_name)
+        for row in self._read_peers():
+            self.rollups.add(*row)
+        if broken:
+            print(f"[LOG] В журнале заявок пропущено повреждённых строк: {broken}")
+        if files:
+            self.segment = files[-1]
+        else:
+            self._rotate()
+        return self.rollups.records
+
+    # === Кластер: строки других процессов ===
+    def _peer_files(self) -> list[str]:
+        own = os.path.abspath(self.path) if self.path else None
+        files = []
+        for folder in sorted(glob.glob(os.path.join(self.cluster_root, "worker*"))):
+            if os.path.abspath(folder) != own:
+                files += sorted(glob.glob(os.path.join(folder, "[0-9]" * 6 + ".jsonl")))
+        return files
+
+    def _read_peers(self) -> list[tuple]:
+        # Новые полные строки соседей с прошлого раза; недописанный хвост — в следующий раз
+        if not self.cluster_root:
+            return []
+        files = self._peer_files()
+        self.peer_offsets = {name: self.peer_offsets.get(name, 0) for name in files}  # удалённые сегменты забываем
+        rows = []
+        for name in files:
+            try:
+                with open(name, "rb") as f:
+                    f.seek(self.peer_offsets[name])
+                    data = f.read()
+            except OSError:
+                continue  # сегмент удалили при ротации
+            end = data.rfind(b"\n") + 1
+            self.peer_offsets[name] += end
+            for line in data[:end].splitlines():
+                try:
+                    ts, event, gate, _, direction, operator, delay, operator_name = json.loads(line)
+                except ValueError:
+                    continue
+                rows.append((ts, event, gate, direction, operator, delay, operator_name))
+        return rows
+
+    async def refresh(self):
+        # Перед /stats: дочитываем соседей; разбор в потоке, в сводку — здесь, в цикле событий
+        if not self.cluster_root:
+            return
+        async with self.peer_lock:
+            try:
+                rows = await asyncio.to_thread(self._read_peers)
+            except OSError as e:
+                print(f"[LOG] Не удалось дочитать журналы кластера ({self.cluster_root}): {e}")
+                return
+        for row in rows:
+            self.rollups.add(*row)
+
+    async def open(self):
+        if not self.path:
+            return
+        started = time.perf_counter()
+        try:
+            records = await asyncio.to_thread(self.load)
+        except OSError as e:
+            print(f"[LOG] Журнал заявок недоступен ({self.path}): {e}; пишем только сводку в памяти")
+            self.path = ""
+            return
+        print(f"[LOG] Журнал заявок: {self.path}, записей {records}, "
+              f"сводка собрана за {time.perf_counter() - started:.2f} с")
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self.flusher:
+            self.flusher.cancel()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+            self.flusher = None
+        await self.flush()
+
+
+def format_delay(seconds: float | None) -> str:
+    if seconds is None:
+        return "—"
+    if seconds == float("inf"):
+        return f">{DELAY_BUCKETS[-1] // 60} мин"
+    if seconds < 10:
+        return f"{seconds:.1f} с"
+    return f"{seconds:.0f} с" if seconds < 120 else f"{seconds / 60:.0f} мин"
+
+
+def stats_text(rollups: Rollups, gate: str, days: int = 7) -> str:
+    summary = rollups.summary(gate, days)
+    total = summary["total"]
+    counts = total.counts
+    lines = [
+        f"📊 Заявки за {days} дн.: {counts['created']}",
+        f"Выполнено: {counts['done']}, проигнорировано: {counts['ignored']}, "
+        f"просрочено: {counts['expired']}, спасибо: {counts['thanked']}",
+        f"До оператора: среднее {format_delay(total.mean('claimed'))}, "
+        f"p95 ≤ {format_delay(total.quantile('claimed', 0.95))}",
+        f"До открытия: среднее {format_delay(total.mean('done'))}, "
+        f"p50 ≤ {format_delay(total.quantile('done', 0.5))}, p95 ≤ {format_delay(total.quantile('done', 0.95))}",
+    ]
+    # Создание заявки записано без оператора — в строках только те, кто брал заявки
+    operators = sorted(((op, cell) for op, cell in summary["operators"].items() if cell.counts["claimed"]),
+                       key=lambda item: item[1].counts["done"], reverse=True)
+    if operators:
+        lines.append("\nОператоры (выполнено / до открытия в среднем):")
+        for op, cell in operators:
+            name = rollups.names.get(op) or op
+            lines.append(f"  @{name}: {cell.counts['done']} / {format_delay(cell.mean('done'))}")
+    directions = [(d, cell) for d, cell in summary["directions"].items() if d and cell.counts["created"]]
+    if directions:
+        lines.append("\nНаправления: " + ", ".join(f"{d} {cell.counts['created']}" for d, cell in directions))
+    return "\n".join(lines)
+
+
+def journal_settings() -> dict:
+    path = os.getenv("JOURNAL_DIR", JOURNAL_DIR)
+    worker = os.getenv("CLUSTER_WORKER")
+    cluster_root = ""
+    if path and worker is not None:
+        # У процессов кластера свои сегменты, сводка — по всем
+        cluster_root, path = path, os.path.join(path, f"worker{worker}")
+    return {
+        "path": path,  # пусто — без журнала
+        "cluster_root": cluster_root,
+        "segment_bytes": int(os.getenv("JOURNAL_SEGMENT_BYTES", str(JOURNAL_SEGMENT_BYTES))),
+        "segments": int(os.getenv("JOURNAL_SEGMENTS", str(JOURNAL_SEGMENTS))),
+        "flush_interval": float(os.getenv("JOURNAL_FLUSH_INTERVAL", str(JOURNAL_FLUSH_INTERVAL))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сводка по журналу заявок")
+    parser.add_argument("path", nargs="?", default=JOURNAL_DIR, help="каталог журнала")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--hourly", action="store_true", help="ещё и разбивка по часам (UTC), операторам и направлениям")
+    args = parser.parse_args()
+    journal = Journal(args.path, cluster_root=args.path)  # и каталоги worker*/ процессов кластера
+    journal.rollups.days = max(args.days, ROLLUP_DAYS)
+    journal.load()
+    for gate in sorted({key[0] for key in journal.rollups.gates}):
+        print(f"=== {gate} ===")
+        print(stats_text(journal.rollups, gate, args.days))
+        if args.hourly:
+            first_hour = (int(time.time() // 86400) - args.days + 1) * 24
+            print(f"\n{'час':<18}{'оператор':<14}{'направление':<14}{'заявок':>8}{'выполнено':>11}{'до открытия':>14}")
+            for (g, hour, operator, direction), cell in sorted(journal.rollups.hours.items(), key=lambda item: item[0][1]):
+                if g == gate and hour >= first_hour and (cell.counts["created"] or cell.counts["done"]):
+                    print(f"{time.strftime('%Y-%m-%d %H:00', time.gmtime(hour * 3600)):<18}"
+                          f"{journal.rollups.names.get(operator) or operator or '—'!s:<14}{direction or '—':<14}"
+                          f"{cell.counts['created']:>8}{cell.counts['done']:>11}{format_delay(cell.mean('done')):>14}")
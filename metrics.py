@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import TelegramObject
+
+# === Метрики в формате Prometheus ===
+# Без сторонних библиотек: счётчики, гистограммы с фиксированными
+# корзинами и «ленивые» показатели, которые считаются только при чтении
+# /metrics. Запись — несколько операций со словарём, её можно держать
+# включённой в проде.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        # labels -> [счётчики по корзинам..., +Inf], сумма
+        self.counts: dict[tuple, list[int]] = {}
+        self.sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, *labels):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def render(self):
+        for labels, counts in self.counts.items():
+            names = self.label_names + ("le",)
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {total}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {self.sums[labels]}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {total}"
+
+
+class Computed:
+    # Значение считается при выдаче метрик: fn() -> число или {labels: число}
+    def __init__(self, name: str, help_text: str, fn: Callable, labels: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.label_names = labels
+        self.kind = kind
+
+    def render(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                labels = labels if isinstance(labels, tuple) else (labels,)
+                yield f"{self.name}{_labels(self.label_names, labels)} {v}"
+        else:
+            yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help_text, labels, buckets))
+
+    def computed(self, name, help_text, fn, labels=(), kind="gauge"):
+        return self.add(Computed(name, help_text, fn, labels, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# ошибка {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+handler_seconds = registry.histogram("gate_handler_seconds", "Время обработки апдейта хендлером", ("gate", "handler"))
+api_seconds = registry.histogram("gate_api_seconds", "Время вызова метода Bot API", ("gate", "method"))
+errors_total = registry.counter("gate_errors_total", "Ошибки по типу и месту", ("where", "type"))
+api_429_total = registry.counter("gate_api_429_total", "Ответы 429 от Bot API", ("gate", "method"))
+
+# id бота -> имя ворот: метка gate у метрик, когда в процессе несколько ботов
+bot_names: dict[int, str] = {}
+
+
+def gate_label(bot) -> str:
+    return bot_names.get(bot.id, "") if bot is not None else ""
+
+
+# === Middleware: время хендлеров ===
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Вешается как внутренний middleware (dp.message.middleware(...)),
+    # поэтому срабатывает только для апдейтов, нашедших свой хендлер.
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            errors_total.inc("handler", type(e).__name__)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, gate_label(data.get("bot")), name)
+
+
+# === Middleware сессии: время методов Bot API ===
+async def api_metrics_middleware(make_request, bot, method):
+    name = method.__api_method__
+    gate = gate_label(bot)
+    started = time.perf_counter()
+    try:
+        return await make_request(bot, method)
+    except TelegramRetryAfter:
+        api_429_total.inc(gate, name)
+        raise
+    except Exception as e:
+        errors_total.inc("api", type(e).__name__)
+        raise
+    finally:
+        api_seconds.observe(time.perf_counter() - started, gate, name)
+
+
+def setup_metrics(dp, session):
+    # session — общая сессия всех ботов процесса: middleware вешается один раз
+    metrics_middleware = HandlerMetricsMiddleware()
+    dp.message.middleware(metrics_middleware)
+    dp.callback_query.middleware(metrics_middleware)
+    session.middleware(api_metrics_middleware)
+
+
+# === HTTP /metrics ===
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+def add_metrics_route(app: web.Application, path: str = "/metrics"):
+    app.router.add_get(path, metrics_handler)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    add_metrics_route(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[LOG] Метрики: http://{host}:{port}/metrics")
+    return runner
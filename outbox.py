@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+from collections import deque
+
+from aiohttp import ClientError
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+)
+
+import tracing
+
+# === Лимиты Telegram Bot API ===
+# ~30 сообщений в секунду на бота и ~1 сообщение в секунду в один чат, но
+# короткие всплески в чат Telegram пропускает. Поэтому в чат отправляем
+# сразу и притормаживаем только после 429: retry_after ставит на паузу
+# этот чат, следующие сообщения в него ждут окончания паузы, а не получают
+# по 429 каждое. Общий лимит бота держим заранее (GLOBAL_*). Правки,
+# удаления и закрепления лимит новых сообщений не тратят и идут через свой
+# общий лимит EDIT_*.
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+EDIT_RATE = 30.0
+EDIT_BURST = 30
+SEND_METHODS = frozenset({
+    "send_message", "send_photo", "send_document", "send_video", "send_animation", "send_audio",
+    "send_voice", "send_sticker", "send_location", "send_contact", "send_media_group",
+    "copy_message", "copy_messages", "forward_message", "forward_messages",
+})
+
+# Приоритеты: кто ждёт лимита или паузы после 429, уходит в этом порядке
+URGENT = 0  # новая заявка операторам, правка копий при взятии
+NORMAL = 1  # ответы клиенту и всё остальное
+LOW = 2     # «Спасибо» операторам, напоминания о заявке
+
+MAX_CHAT_LANES = 10000
+
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+
+
+# === Token bucket ===
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        # Сколько ждать до целого токена
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+# === Очередь к лимиту с приоритетами ===
+class Lane:
+    # Пока лимит позволяет и никто не ждёт — проходим сразу. Иначе встаём
+    # в кучу (приоритет, номер): когда лимит освобождается, первым уходит
+    # самый срочный, при равенстве — кто раньше встал.
+    __slots__ = ("bucket", "paused_until", "waiters", "pump")
+    order = itertools.count()
+
+    def __init__(self, bucket: TokenBucket | None = None):
+        self.bucket = bucket
+        self.paused_until = 0.0  # после 429: Telegram сказал подождать
+        self.waiters: list = []
+        self.pump: asyncio.Task | None = None
+
+    def _delay(self, now: float) -> float:
+        delay = self.paused_until - now
+        if self.bucket is not None:
+            delay = max(delay, self.bucket.wait_time(now))
+        return max(0.0, delay)
+
+    def _take(self, now: float):
+        if self.bucket is not None:
+            self.bucket.take(now)
+
+    async def acquire(self, priority: int):
+        now = time.monotonic()
+        if not self.waiters and not self._delay(now):
+            self._take(now)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.order), future))
+        if self.pump is None or self.pump.done():
+            self.pump = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        while self.waiters:
+            now = time.monotonic()
+            delay = self._delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():  # ожидавший мог быть отменён
+                self._take(now)
+                future.set_result(None)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return not self.waiters and self.paused_until <= now
+
+
+# === Исходящая очередь: параллельная рассылка с лимитами и повторами ===
+class Outbox:
+    def __init__(self, bot: Bot, global_rate: float = GLOBAL_RATE, global_burst: int = GLOBAL_BURST,
+                 edit_rate: float = EDIT_RATE, edit_burst: int = EDIT_BURST,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.bot = bot
+        self.global_lane = Lane(TokenBucket(global_rate, global_burst))
+        self.edit_lane = Lane(TokenBucket(edit_rate, edit_burst))
+        self.chat_lanes: dict[int, Lane] = {}  # только паузы после 429
+        self.max_attempts = max_attempts
+
+        # Счётчики и задержки для наблюдения
+        self.latencies = deque(maxlen=1000)
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.in_flight = 0
+
+    def _chat_lane(self, chat_id: int) -> Lane:
+        lane = self.chat_lanes.get(chat_id)
+        if lane is None:
+            if len(self.chat_lanes) >= MAX_CHAT_LANES:
+                self._prune_lanes()
+            lane = self.chat_lanes[chat_id] = Lane()
+        return lane
+
+    def _prune_lanes(self):
+        # Чаты без паузы и без ожидающих ничего не ограничивают — их можно забыть
+        now = time.monotonic()
+        for chat_id in [c for c, lane in self.chat_lanes.items() if lane.is_idle(now)]:
+            del self.chat_lanes[chat_id]
+
+    async def _acquire(self, chat_id: int | None, sends: bool, priority: int):
+        if chat_id is None:
+            return  # не сообщение в чат (например, answerCallbackQuery) — лимиты не тратим
+        await self._chat_lane(chat_id).acquire(priority)
+        await (self.global_lane if sends else self.edit_lane).acquire(priority)
+
+    async def call(self, chat_id: int | None, method, /, *args, priority: int = NORMAL, **kwargs):
+        # Выполняет метод Bot API с учётом лимитов; при окончательной
+        # неудаче (ошибка Telegram или сети) возвращает None и увеличивает
+        # счётчик потерь. Прочие исключения — ошибки в коде: в лог с трассой
+        # и дальше вызывающему.
+        # chat_id=None — вызов без лимитов чата, только с повторами.
+        chat_id = int(chat_id) if chat_id is not None else None
+        name = getattr(method, "__name__", "call")
+        with tracing.child(f"outbox {name}", chat_id=chat_id) as span:
+            return await self._call(chat_id, name in SEND_METHODS, priority, span, method, *args, **kwargs)
+
+    async def _call(self, chat_id: int | None, sends: bool, priority: int, span, method, /, *args, **kwargs):
+        started = time.monotonic()
+        self.in_flight += 1
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                if span:
+                    span.attrs["attempts"] = attempt
+                await self._acquire(chat_id, sends, priority)
+                try:
+                    result = await method(*args, **kwargs)
+                except TelegramRetryAfter as e:
+                    # Telegram сам говорит, сколько ждать: на паузу встаёт весь чат
+                    if attempt == self.max_attempts:
+                        self.dropped += 1
+                        print(f"[LOG] Сообщение в чат {chat_id} не доставлено: 429 на последней попытке "
+                              f"(retry_after {e.retry_after} с)")
+                        return None
+                    self.retried += 1
+                    print(f"[LOG] 429 для чата {chat_id}, ждём {e.retry_after} с")
+                    if chat_id is None:
+                        await asyncio.sleep(e.retry_after)
+                    else:
+                        self._chat_lane(chat_id).pause(e.retry_after)
+                    continue
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    if attempt == self.max_attempts:
+                        raise
+                    self.retried += 1
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                    print(f"[LOG] Сетевая ошибка для чата {chat_id} ({e}), повтор через {delay} с")
+                    await asyncio.sleep(delay)
+                    continue
+                self.sent += 1
+                self.latencies.append(time.monotonic() - started)
+                return result
+        except (TelegramAPIError, ClientError, asyncio.TimeoutError, OSError) as e:
+            self.dropped += 1
+            print(f"[LOG] Сообщение в чат {chat_id} не доставлено: {e}")
+            return None
+        except Exception:
+            print(f"[LOG] Ошибка в вызове {getattr(method, '__name__', method)!r} для чата {chat_id}:\n"
+                  f"{traceback.format_exc()}")
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def send(self, chat_id: int, text: str, priority: int = NORMAL, **kwargs):
+        return await self.call(chat_id, self.bot.send_message, chat_id, text, priority=priority, **kwargs)
+
+    async def broadcast(self, chat_ids, text: str, priority: int = NORMAL, **kwargs) -> dict:
+        # Рассылаем всем сразу; возвращаем {chat_id: Message | None}.
+        # chat_ids — уже int (снимок состава операторов), без преобразований на каждой рассылке
+        chat_ids = tuple(chat_ids)
+        results = await asyncio.gather(*(self.send(c, text, priority, **kwargs) for c in chat_ids))
+        return dict(zip(chat_ids, results))
+
+    def stats(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return lat[min(len(lat) - 1, int(len(lat) * p))] if lat else 0.0
+
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "in_flight": self.in_flight,
+            "latency_p50": pct(0.50),
+            "latency_p95": pct(0.95),
+            "latency_p99": pct(0.99),
+        }
@@ -0,0 +1,237 @@
+import asyncio
+import cProfile
+import inspect
+import io
+import os
+import pstats
+import signal
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+# === Профилирование работающего бота по запросу ===
+# /profile [секунд] [cprofile|sample] у администратора или сигнал
+# PROFILE_SIGNAL (по умолчанию SIGUSR1: kill -USR1 <pid>) включают на
+# заданное окно профилировщик и tracemalloc. В PROFILE_DIR остаются:
+#   <время>-cprofile.pstats   — cProfile (python -m pstats, snakeviz);
+#   <время>-sample.collapsed  — стеки сэмплера в формате flamegraph.pl/speedscope;
+#   <время>-alloc.txt         — кто выделил и не освободил память за окно,
+#                               по хендлерам и методам ворот.
+# cProfile точнее, но замедляет весь код под ним; сэмплер раз в
+# PROFILE_SAMPLE_INTERVAL процессорного времени запоминает стек главного
+# потока и почти не мешает. tracemalloc дорог: с глубиной стека
+# PROFILE_FRAMES обработка идёт в разы медленнее, поэтому он включается
+# только на окно, а PROFILE_FRAMES=0 выключает его совсем.
+#
+# Память приписывается хендлеру, если его кадр есть в стеке выделения:
+# хендлеры диспетчера и корутины ворот (фоновые задания идут не из хендлера).
+
+PROFILE_DIR = "profiles"
+PROFILE_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+PROFILE_MODE = "sample"          # sample или cprofile
+PROFILE_SAMPLE_INTERVAL = 0.005  # сек
+PROFILE_FRAMES = 64              # глубина стека tracemalloc: хендлер должен в неё попасть
+MODES = ("sample", "cprofile")
+TOP = 10
+
+
+class Sampler:
+    # Раз в interval процессорного времени (ITIMER_PROF) приходит SIGPROF;
+    # обработчик выполняется в главном потоке и видит его текущий кадр.
+    # Сэмплер-поток видел бы главный поток почти всегда в select: GIL
+    # отдаётся чаще всего там. Простой в ожидании сети в сэмплы не попадает.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()  # (код, ..., код) от внешнего к внутреннему -> сэмплов
+        self.previous = None
+
+    def start(self):
+        self.previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+
+    def collapsed(self) -> Counter:
+        # "f (файл:строка);g (...)" -> сэмплов, формат flamegraph.pl
+        result = Counter()
+        for stack, count in self.stacks.items():
+            result[";".join(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                            for code in stack)] += count
+        return result
+
+
+class Profiler:
+    def __init__(self, path: str = PROFILE_DIR, frames: int = PROFILE_FRAMES,
+                 sample_interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.path = path
+        self.frames = frames
+        self.sample_interval = sample_interval
+        self.targets: dict[str, list] = defaultdict(list)  # файл -> [(первая, последняя строка, имя)]
+        self.running: asyncio.Task | None = None
+        self.last: str | None = None  # сводка последнего окна
+
+    # === Чему приписывать память ===
+    def attach(self, dp, *classes):
+        # Хендлеры всех роутеров диспетчера (кроме внутренних у aiogram) и корутины переданных классов
+        for router in dp.chain_tail:
+            for observer in router.observers.values():
+                for handler in observer.handlers:
+                    callback = handler.callback
+                    if not getattr(callback, "__module__", "").startswith("aiogram"):
+                        self._target(callback, callback.__name__)
+        for cls in classes:
+            for name, func in vars(cls).items():
+                if inspect.iscoroutinefunction(func):
+                    self._target(func, f"{cls.__name__}.{name}")
+
+    def _target(self, func, name: str):
+        code = getattr(inspect.unwrap(func), "__code__", None)
+        if code is None:
+            return
+        lines = [line for _, _, line in code.co_lines() if line is not None]
+        self.targets[code.co_filename].append((min(lines, default=code.co_firstlineno),
+                                               max(lines, default=code.co_firstlineno), name))
+
+    def _owner(self, traceback) -> str | None:
+        # Ближайший к месту выделения кадр хендлера (кадры — от старых к новым)
+        for frame in reversed(traceback):
+            for first, last, name in self.targets.get(frame.filename, ()):
+                if first <= frame.lineno <= last:
+                    return name
+        return None
+
+    # === Окно профилирования ===
+    def start(self, seconds: float = PROFILE_SECONDS, mode: str = PROFILE_MODE, on_done=None) -> bool:
+        # on_done — async (сводка); False, если окно уже идёт
+        if self.running is not None:
+            return False
+        self.running = asyncio.create_task(self._run(min(seconds, PROFILE_MAX_SECONDS), mode, on_done))
+        return True
+
+    async def _run(self, seconds: float, mode: str, on_done):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        print(f"[LOG] Профилирование ({mode}) на {seconds:.0f} с")
+        started_tracemalloc = self.frames > 0 and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(self.frames)
+        profile = sampler = None
+        try:
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            if mode == "cprofile" or not hasattr(signal, "setitimer"):  # Windows — только cProfile
+                profile = cProfile.Profile()
+                profile.enable()
+            else:
+                sampler = Sampler(self.sample_interval)
+                sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                if profile:
+                    profile.disable()
+                if sampler:
+                    sampler.stop()
+            wall = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracemalloc:
+                tracemalloc.stop()
+            try:
+                summary = await asyncio.to_thread(self._save, stamp, mode, wall, cpu, peak, profile, sampler, snapshot)
+            except OSError as e:
+                summary = f"Не удалось сохранить профиль в {self.path}: {e}"
+            self.last = summary
+        finally:
+            if started_tracemalloc and tracemalloc.is_tracing():
+                tracemalloc.stop()  # окно прервали (остановка бота)
+            self.running = None
+        print(f"[LOG] Профилирование завершено:\n{summary}")
+        if on_done:
+            await on_done(summary)
+
+    def _save(self, stamp, mode, wall, cpu, peak, profile, sampler, snapshot) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        base = os.path.join(self.path, f"{stamp}-")
+        lines = [f"Окно {wall:.1f} с, CPU {cpu:.2f} с ({cpu / wall:.0%})"
+                 + (f", пик tracemalloc {peak / 1024:.0f} КБ" if snapshot else "")]
+        if profile:
+            profile.dump_stats(base + "cprofile.pstats")
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(TOP)
+            lines.append(f"\n{base}cprofile.pstats, по cumulative:")
+            lines += [line for line in out.getvalue().splitlines() if line.strip()][-TOP:]
+        if sampler:
+            stacks = sampler.collapsed()
+            with open(base + "sample.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+            lines.append(f"\n{base}sample.collapsed, сэмплов {sum(stacks.values())}; "
+                         "чаще всего наверху стека:")
+            leaves = Counter()
+            for stack, count in stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            lines += [f"  {count:6} {leaf}" for leaf, count in leaves.most_common(TOP)]
+        if snapshot:
+            lines.append(f"\n{base}alloc.txt, не освобождено за окно по хендлерам:")
+            lines += self._allocations(snapshot, base + "alloc.txt")
+        return "\n".join(lines)
+
+    def _allocations(self, snapshot, path: str) -> list[str]:
+        # Хендлер -> места выделения (файл:строка) -> байт, блоков
+        by_owner: dict[str, Counter] = defaultdict(Counter)
+        blocks: dict[str, Counter] = defaultdict(Counter)
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        for stat in snapshot.statistics("traceback"):
+            owner = self._owner(stat.traceback) or "(вне хендлеров)"
+            site = f"{stat.traceback[-1].filename}:{stat.traceback[-1].lineno}"
+            by_owner[owner][site] += stat.size
+            blocks[owner][site] += stat.count
+        totals = sorted(((sum(sites.values()), owner) for owner, sites in by_owner.items()), reverse=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for total, owner in totals:
+                f.write(f"{owner}: {total} байт\n")
+                for site, size in by_owner[owner].most_common(TOP):
+                    f.write(f"  {size:10} байт {blocks[owner][site]:6} блоков  {site}\n")
+        return [f"  {total / 1024:8.1f} КБ  {owner}" for total, owner in totals[:TOP]]
+
+    # === Сигнал ===
+    def install_signal(self, signame: str = "SIGUSR1", seconds: float = PROFILE_SECONDS, mode: str = PROFILE_MODE):
+        sig = getattr(signal, signame, None) if signame else None
+        if sig is None:
+            return
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, lambda: self.start(seconds, mode))
+        except (NotImplementedError, RuntimeError):
+            return  # Windows — только командой
+        print(f"[LOG] Профилирование по сигналу {signame} (pid {os.getpid()})")
+
+
+def profiling_settings() -> dict:
+    path = os.getenv("PROFILE_DIR", PROFILE_DIR)
+    worker = os.getenv("CLUSTER_WORKER")
+    if worker is not None:
+        path = os.path.join(path, f"worker{worker}")
+    return {
+        "path": path,
+        "frames": int(os.getenv("PROFILE_FRAMES", str(PROFILE_FRAMES))),
+        "sample_interval": float(os.getenv("PROFILE_SAMPLE_INTERVAL", str(PROFILE_SAMPLE_INTERVAL))),
+    }
+
+
+def profile_signal_settings() -> dict:
+    return {
+        "signame": os.getenv("PROFILE_SIGNAL", "SIGUSR1"),  # пусто — без сигнала
+        "seconds": float(os.getenv("PROFILE_SECONDS", str(PROFILE_SECONDS))),
+        "mode": os.getenv("PROFILE_MODE", PROFILE_MODE),
+    }
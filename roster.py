@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+from typing import NamedTuple
+
+# === Состав операторов и смены ===
+# Операторы, кто из них на смене и администраторы — в файле ROSTER_FILE,
+# который перечитывается на лету (раз в ROSTER_RELOAD секунд по mtime),
+# и меняются командами администратора без перезапуска бота:
+#
+#   {"main": {"operators": [111, 222, 333], "off_shift": [333], "admins": [111]}}
+#
+# Ключ — имя ворот (GATE_NAME / name в GATES_FILE). Пока файла нет, состав
+# берётся из OPERATORS / ADMIN_ID; первая же правка командой создаёт файл,
+# и дальше он главнее окружения.
+#
+# Горячий путь читает готовый неизменяемый снимок Roster: id уже int,
+# множества для проверок уже собраны. Перезагрузка и команды собирают новый
+# снимок целиком и подменяют ссылку — хендлер видит либо старый состав,
+# либо новый, но не наполовину изменённый.
+
+ROSTER_FILE = "roster.json"
+ROSTER_RELOAD = 5  # сек
+
+
+class Roster(NamedTuple):
+    operators: tuple[int, ...]       # все операторы, в порядке добавления
+    on_shift: tuple[int, ...]        # кому уходят заявки
+    operator_ids: frozenset[int]
+    on_shift_ids: frozenset[int]
+    admins: frozenset[int]
+
+    def is_operator(self, user_id: int) -> bool:
+        return user_id in self.operator_ids
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+    def to_json(self) -> dict:
+        return {"operators": list(self.operators),
+                "off_shift": [op for op in self.operators if op not in self.on_shift_ids],
+                "admins": sorted(self.admins)}
+
+
+def build_roster(operators, off_shift=(), admins=()) -> Roster:
+    ops = tuple(dict.fromkeys(int(op) for op in operators))
+    off = {int(op) for op in off_shift}
+    on_shift = tuple(op for op in ops if op not in off)
+    return Roster(ops, on_shift, frozenset(ops), frozenset(on_shift),
+                  frozenset(int(a) for a in admins if int(a)))
+
+
+class RosterStore:
+    def __init__(self, path: str, name: str, operators=(), admin_id: int = 0,
+                 reload_interval: float = ROSTER_RELOAD, on_change=None):
+        self.path = path
+        self.name = name  # ключ ворот в файле
+        self.admin_id = admin_id  # из окружения: администратор есть всегда, даже с пустым файлом
+        self.reload_interval = reload_interval
+        self.on_change = on_change  # (старый Roster, новый Roster)
+
+        self.roster = build_roster(operators, admins=[admin_id])
+        self.mtime = None
+        self.saving = asyncio.Lock()  # правки подряд не пишут файл одновременно
+        self.watcher: asyncio.Task | None = None
+        self.reloads = 0
+        self.reload()
+
+    # === Загрузка ===
+    def reload(self) -> bool:
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f).get(self.name)
+            if entry is None:
+                return False  # в файле другие ворота — наш состав по-прежнему из окружения
+            roster = build_roster(entry.get("operators", ()), entry.get("off_shift", ()),
+                                  [self.admin_id, *entry.get("admins", ())])
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"[LOG] Ошибка в файле состава {self.path}: {e}; оставляем прежний состав")
+            return False
+        self.reloads += 1
+        self._swap(roster)
+        if self.on_change is None:  # иначе изменения пишет в лог сам подписчик
+            print(f"[LOG] {self.name}: состав операторов загружен, на смене {len(roster.on_shift)}"
+                  f" из {len(roster.operators)}")
+        return True
+
+    def _swap(self, roster: Roster):
+        old, self.roster = self.roster, roster
+        if self.on_change and old != roster:
+            self.on_change(old, roster)
+
+    def start(self):
+        if self.watcher is None and self.path:
+            self.watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload()
+
+    async def close(self):
+        if self.watcher:
+            self.watcher.cancel()
+            await asyncio.gather(self.watcher, return_exceptions=True)
+            self.watcher = None
+
+    # === Правки (команды администратора и операторов) ===
+    def _save(self):
+        # Файл общий для всех ворот: переписываем только свой ключ
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        data[self.name] = self.roster.to_json()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        self.mtime = os.stat(self.path).st_mtime  # свою запись не перечитываем
+
+    async def _update(self, operators, off_shift, admins) -> Roster:
+        self._swap(build_roster(operators, off_shift, admins))
+        if self.path:
+            try:
+                async with self.saving:
+                    await asyncio.to_thread(self._save)
+            except (OSError, ValueError) as e:
+                print(f"[LOG] Не удалось сохранить состав в {self.path}: {e}")
+        return self.roster
+
+    def _off_shift(self) -> list[int]:
+        return [op for op in self.roster.operators if op not in self.roster.on_shift_ids]
+
+    async def add_operator(self, op_id: int) -> Roster:
+        return await self._update([*self.roster.operators, op_id], self._off_shift(), self.roster.admins)
+
+    async def remove_operator(self, op_id: int) -> Roster:
+        return await self._update([op for op in self.roster.operators if op != op_id],
+                                  self._off_shift(), self.roster.admins)
+
+    async def set_shift(self, op_id: int, on: bool) -> Roster:
+        off = [op for op in self._off_shift() if op != op_id] + ([] if on else [op_id])
+        return await self._update(self.roster.operators, off, self.roster.admins)
+
+
+def roster_settings() -> dict:
+    return {
+        "path": os.getenv("ROSTER_FILE", ROSTER_FILE),  # пусто — состав только из окружения, правки до перезапуска
+        "reload_interval": float(os.getenv("ROSTER_RELOAD", str(ROSTER_RELOAD))),
+    }
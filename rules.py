@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+# === Правила автодопуска ===
+# Известных клиентов (жильцов, доставку по расписанию) бот пропускает сам,
+# без операторов. Правила лежат в JSON-файле и перечитываются на лету:
+#
+#   {"rules": [
+#     {"name": "жильцы", "users": [111, 222], "directions": ["въезд", "выезд"],
+#      "days": ["пн", "вт", "ср", "чт", "пт"], "hours": ["07:00-10:00", "17:00-23:30"],
+#      "daily_quota": 4},
+#     {"name": "выезд ночью", "directions": ["выезд"], "hours": ["22:00-06:00"]}
+#   ]}
+#
+# users не задан — правило для всех; days/hours не заданы — в любое время;
+# окно через полночь (22:00-06:00) допустимо. daily_quota — сколько раз в
+# сутки клиент может пройти по этому правилу.
+# При загрузке правила раскладываются в индекс (клиент, направление) -> правила,
+# поэтому решение — один поиск в словаре и пара сравнений.
+# Каждое решение пишется в журнал RULES_AUDIT (JSON по строке).
+
+RULES_RELOAD = 5.0  # сек между проверками файла правил
+DAY_NAMES = {"пн": 0, "вт": 1, "ср": 2, "чт": 3, "пт": 4, "сб": 5, "вс": 6}
+ALL_DAYS = 0b1111111
+
+
+def _parse_minutes(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class Rule:
+    def __init__(self, spec: dict):
+        self.name = spec.get("name") or "без имени"
+        self.days = ALL_DAYS
+        if spec.get("days"):
+            self.days = 0
+            for day in spec["days"]:
+                self.days |= 1 << (DAY_NAMES[day.lower()] if isinstance(day, str) else int(day))
+        self.windows = []
+        for window in spec.get("hours", ()):
+            start, end = window.split("-")
+            self.windows.append((_parse_minutes(start), _parse_minutes(end)))
+        self.quota = int(spec.get("daily_quota", 0))  # 0 — без ограничения
+
+    def active(self, weekday: int, minute: int) -> bool:
+        if not self.days >> weekday & 1:
+            return False
+        if not self.windows:
+            return True
+        for start, end in self.windows:
+            if start <= end:
+                if start <= minute < end:
+                    return True
+            elif minute >= start or minute < end:  # окно через полночь
+                return True
+        return False
+
+
+def compile_rules(specs: list, directions) -> tuple[dict, dict]:
+    # -> ({(user_id, направление): (правила...)}, {направление: (правила для всех...)})
+    by_user: dict[tuple, list] = {}
+    anyone: dict[str, list] = {}
+    names = set()
+    for spec in specs:
+        rule = Rule(spec)
+        # Квота считается по имени правила: два правила с одним именем делили бы её
+        if rule.name in names:
+            raise ValueError(f"имя правила {rule.name} повторяется")
+        names.add(rule.name)
+        for direction in spec.get("directions") or directions:
+            if direction not in directions:
+                raise ValueError(f"правило {rule.name}: неизвестное направление {direction}")
+            if spec.get("users"):
+                for user_id in spec["users"]:
+                    by_user.setdefault((int(user_id), direction), []).append(rule)
+            else:
+                anyone.setdefault(direction, []).append(rule)
+    return ({key: tuple(rules) for key, rules in by_user.items()},
+            {key: tuple(rules) for key, rules in anyone.items()})
+
+
+class RuleEngine:
+    def __init__(self, path: str, directions, audit_path: str | None = None,
+                 reload_interval: float = RULES_RELOAD):
+        self.path = path
+        self.directions = tuple(directions)
+        self.audit_path = audit_path
+        self.reload_interval = reload_interval
+
+        self.by_user: dict = {}
+        self.anyone: dict = {}
+        self.rules_count = 0
+        self.mtime = None
+        self.used: dict[tuple, int] = {}  # (user_id, правило) -> проходов за сегодня
+        self.used_day = None
+        self.audit: list[tuple] = []
+        self.watcher: asyncio.Task | None = None
+
+        self.approved = 0
+        self.rejected = 0
+        self.reload()
+
+    # === Загрузка ===
+    def reload(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self.mtime is not None:
+                print(f"[LOG] Файл правил {self.path} пропал, оставляем прежние правила")
+            return False
+        if mtime == self.mtime:
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                specs = json.load(f).get("rules", [])
+            by_user, anyone = compile_rules(specs, self.directions)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[LOG] Ошибка в файле правил {self.path}: {e}; оставляем прежние правила")
+            self.mtime = mtime
+            return False
+        # Подменяем индекс целиком: решения не видят наполовину загруженные правила
+        self.by_user, self.anyone = by_user, anyone
+        self.rules_count = len(specs)
+        self.mtime = mtime
+        print(f"[LOG] Загружено правил автодопуска: {len(specs)}")
+        return True
+
+    def start(self):
+        if self.watcher is None:
+            self.watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.reload()
+            await self.flush_audit()
+
+    async def close(self):
+        if self.watcher:
+            self.watcher.cancel()
+            await asyncio.gather(self.watcher, return_exceptions=True)
+            self.watcher = None
+        await self.flush_audit()
+
+    # === Решение ===
+    def decide(self, user_id: int, direction: str, now: datetime | None = None) -> str | None:
+        # -> имя сработавшего правила или None (заявка идёт операторам)
+        now = now or datetime.now()
+        day = now.date()
+        if day != self.used_day:
+            self.used.clear()
+            self.used_day = day
+        weekday = now.weekday()
+        minute = now.hour * 60 + now.minute
+        matched = None
+        for rules in (self.by_user.get((user_id, direction), ()), self.anyone.get(direction, ())):
+            for rule in rules:
+                if not rule.active(weekday, minute):
+                    continue
+                key = (user_id, rule.name)
+                if rule.quota and self.used.get(key, 0) >= rule.quota:
+                    matched = matched or f"{rule.name} (квота исчерпана)"
+                    continue
+                # Проход занимаем сразу, чтобы одновременные заявки не превысили
+                # квоту; если ворота не откроются, auto_open_task вернёт его (refund)
+                self.used[key] = self.used.get(key, 0) + 1
+                self.approved += 1
+                self._log(user_id, direction, rule.name, True)
+                return rule.name
+        self.rejected += 1
+        self._log(user_id, direction, matched, False)
+        return None
+
+    def refund(self, user_id: int, direction: str, rule_name: str):
+        # Ворота по правилу не открылись и заявка ушла операторам: проход
+        # не состоялся, квоту возвращаем, в журнал — отказ
+        key = (user_id, rule_name)
+        if self.used.get(key, 0) > 0:
+            self.used[key] -= 1
+        self.approved -= 1
+        self.rejected += 1
+        self._log(user_id, direction, f"{rule_name} (ворота не открылись)", False)
+
+    # === Журнал решений ===
+    def _log(self, user_id: int, direction: str, rule: str | None, approved: bool):
+        # Здесь только кортеж в список; JSON и запись — в потоке, вне обработки апдейта
+        if self.audit_path:
+            self.audit.append((time.time(), user_id, direction, rule, approved))
+
+    def _write_audit(self, records: list):
+        with open(self.audit_path, "a", encoding="utf-8") as f:
+            for ts, user_id, direction, rule, approved in records:
+                f.write(json.dumps({"ts": ts, "user_id": user_id, "direction": direction,
+                                    "rule": rule, "approved": approved}, ensure_ascii=False) + "\n")
+
+    async def flush_audit(self):
+        if not self.audit or not self.audit_path:
+            return
+        records, self.audit = self.audit, []
+        try:
+            await asyncio.to_thread(self._write_audit, records)
+        except OSError as e:
+            print(f"[LOG] Не удалось записать журнал правил: {e}")
+
+    def stats(self) -> dict:
+        return {"rules": self.rules_count, "approved": self.approved, "rejected": self.rejected,
+                "today": dict(self.used)}
+
+
+def rules_settings() -> dict:
+    return {
+        "path": os.getenv("RULES_FILE", ""),  # пусто — все заявки идут операторам
+        "audit_path": os.getenv("RULES_AUDIT", "rules_audit.jsonl"),
+        "reload_interval": float(os.getenv("RULES_RELOAD", str(RULES_RELOAD))),
+    }
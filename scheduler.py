@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+
+import metrics
+from callbacks import task_ref
+from cluster import update_chat_id
+from jobs import JobQueue, DRAIN_TIMEOUT
+
+# === Планировщик входящих обновлений ===
+# Стоит между polling/webhook и хендлерами. Обновления с одним ключом идут
+# строго по очереди, с разными — параллельно, не больше UPDATE_CONCURRENCY:
+#   чат         — сообщения и команды одного пользователя по порядку
+#                 (ограничение частоты нажатий видит их в порядке прихода);
+#   заявка      — нажатия «Сделано»/«Игнорировать»/«Спасибо» по одной
+#                 заявке по порядку, от кого бы они ни пришли.
+# Когда в очереди UPDATE_MAX_PENDING обновлений, приём ждёт, пока освободится
+# место: polling не запрашивает следующий getUpdates, webhook не отвечает
+# Telegram — память не растёт, а Telegram сам придерживает обновления.
+#
+# Обновление считается доставленным, когда оно поставлено в очередь: при
+# падении процесса очередь теряется (с CATCHUP=1 offset сдвигается только
+# за обработанными, и потерянное дочитается при перезапуске).
+
+UPDATE_CONCURRENCY = 32
+UPDATE_MAX_PENDING = 1000
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+update_wait_seconds = metrics.registry.histogram("gate_update_wait_seconds", "Ожидание обновления в очереди")
+update_run_seconds = metrics.registry.histogram("gate_update_run_seconds", "Обработка обновления")
+update_key_depth = metrics.registry.histogram(
+    "gate_update_key_depth", "Обновлений того же ключа впереди в очереди", labels=("kind",), buckets=DEPTH_BUCKETS
+)
+update_backpressure_seconds = metrics.registry.counter(
+    "gate_update_backpressure_seconds_total", "Сколько приём обновлений ждал места в очереди"
+)
+
+
+def update_key(update, bot_id: int) -> tuple:
+    # Нажатие кнопки заявки («Сделано», «Спасибо», см. callbacks.py) — ключ
+    # заявки, всё остальное — ключ чата
+    callback = update.callback_query
+    if callback is not None and (ref := task_ref(callback.data)) is not None:
+        return bot_id, "task", ref
+    return bot_id, "chat", update_chat_id(update)
+
+
+class UpdateScheduler(JobQueue):
+    wait_metric = update_wait_seconds
+    run_metric = update_run_seconds
+    kind = "update"
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING):
+        super().__init__(workers=concurrency)
+        self.max_pending = max_pending
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.throttled = 0          # сколько раз приём ждал места
+        self.throttled_seconds = 0.0
+        self.max_depth = 0          # самая длинная очередь одного ключа с запуска
+
+    async def put(self, key, factory):
+        if self.pending >= self.max_pending:
+            # Очередь полна — держим того, кто принимает обновления
+            started = time.perf_counter()
+            self.throttled += 1
+            while self.pending >= self.max_pending and not self.closed:
+                self.not_full.clear()
+                await self.not_full.wait()
+            waited = time.perf_counter() - started
+            self.throttled_seconds += waited
+            update_backpressure_seconds.inc(value=waited)
+        queue = self.queues.get(key)
+        depth = len(queue) if queue else 0
+        update_key_depth.observe(depth, key[1])
+        self.max_depth = max(self.max_depth, depth + 1)
+        self.submit(key, factory)
+
+    def _finished(self):
+        super()._finished()
+        if self.pending < self.max_pending:
+            self.not_full.set()
+
+    def depths(self) -> dict:
+        # Ключ -> сколько его обновлений ждут своей очереди
+        return {key: len(queue) for key, queue in self.queues.items()}
+
+    def stats(self, top: int = 5) -> dict:
+        depths = self.depths()
+        deepest = sorted(depths.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "pending": self.pending,
+            "keys": len(depths),
+            "done": self.done,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "throttled_seconds": self.throttled_seconds,
+            "max_depth": self.max_depth,
+            "deepest": deepest,
+        }
+
+    async def close(self, timeout: float = DRAIN_TIMEOUT):
+        await super().close(timeout)
+        self.not_full.set()  # отпускаем тех, кто ждал места
+
+
+def scheduler_settings() -> dict:
+    return {
+        "concurrency": int(os.getenv("UPDATE_CONCURRENCY", str(UPDATE_CONCURRENCY))),
+        "max_pending": int(os.getenv("UPDATE_MAX_PENDING", str(UPDATE_MAX_PENDING))),
+    }
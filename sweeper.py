@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+
+# === Очистка просроченных заявок и эскалация ===
+# Заявки в каждом состоянии лежат в индексе by_state в порядке перехода
+# в это состояние, поэтому обход останавливается на первой непросроченной:
+# стоимость прохода пропорциональна числу просроченных, а не всех заявок.
+
+SWEEP_INTERVAL = 30   # сек между проходами
+SWEEP_BATCH = 100     # сколько заявок удаляем за один пакет
+
+
+class TaskSweeper:
+    def __init__(self, store, ttls: dict, on_expire=None,
+                 escalate_after: float = 0, max_escalations: int = 1, on_escalate=None,
+                 interval: float = SWEEP_INTERVAL, batch: int = SWEEP_BATCH):
+        self.store = store
+        self.ttls = {state: ttl for state, ttl in ttls.items() if ttl > 0}
+        self.on_expire = on_expire            # async (task_id, task) — уборка сообщений
+        self.escalate_after = escalate_after  # 0 — эскалация выключена
+        self.max_escalations = max_escalations
+        self.on_escalate = on_escalate        # async (task_id, task) — повторное уведомление
+        self.interval = interval
+        self.batch = batch
+        self.runner: asyncio.Task | None = None
+
+        self.expired = 0
+        self.escalated = 0
+
+    def _collect_expired(self, state: str, ttl: float, now: float) -> list:
+        found = []
+        for task_id, task in self.store.oldest(state):
+            if now - task["state_at"] < ttl or len(found) >= self.batch:
+                break
+            found.append(task_id)
+        return found
+
+    async def _expire(self, state: str, ttl: float, now: float):
+        while True:
+            batch = self._collect_expired(state, ttl, now)
+            if not batch:
+                return
+            # В кластере заявку мог уже убрать другой процесс — её pop вернёт None
+            popped = [(task_id, task) for task_id in batch if (task := await self.store.pop(task_id)) is not None]
+            self.expired += len(popped)
+            print(f"[LOG] Удалено просроченных заявок ({state}): {len(popped)}")
+            if self.on_expire:
+                await asyncio.gather(
+                    *(self.on_expire(task_id, task) for task_id, task in popped),
+                    return_exceptions=True
+                )
+
+    async def _escalate(self, now: float):
+        due = []
+        for task_id, task in self.store.oldest("pending"):
+            waited_from = task.get("escalated_at") or task["state_at"]
+            if now - task["state_at"] < self.escalate_after:
+                break
+            if task.get("escalations", 0) >= self.max_escalations:
+                continue
+            if now - waited_from >= self.escalate_after:
+                due.append(task_id)
+        for task_id in due:
+            # Пока напоминали о предыдущих, заявку могли взять или убрать:
+            # перечитываем и отмечаем только если она всё ещё ждёт (compare-and-set)
+            task = self.store.get(task_id)
+            if task is None or task["state"] != "pending":
+                continue
+            task = await self.store.transition(task_id, "pending", "pending", state_at=task["state_at"],
+                                               escalated_at=now, escalations=task.get("escalations", 0) + 1)
+            if task is None:
+                continue
+            self.escalated += 1
+            if self.on_escalate:
+                try:
+                    await self.on_escalate(task_id, task)
+                except Exception as e:
+                    print(f"[LOG] Ошибка эскалации заявки {task_id}: {e}")
+
+    async def sweep(self):
+        now = time.time()
+        for state, ttl in self.ttls.items():
+            await self._expire(state, ttl, now)
+        if self.escalate_after > 0 and self.on_escalate:
+            await self._escalate(now)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[LOG] Ошибка очистки заявок: {e}")
+
+    def start(self):
+        if self.runner is None:
+            self.runner = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self.runner:
+            self.runner.cancel()
+            try:
+                await self.runner
+            except asyncio.CancelledError:
+                pass
+            self.runner = None
+
+
+def sweeper_settings() -> dict:
+    # Настройки из окружения (секунды; 0 — выключено)
+    pending = os.getenv("TASK_TTL_PENDING", "1800")
+    return {
+        "ttls": {
+            "pending": float(pending),
+            # Взятая, но не завершённая заявка (например, бот упал посередине);
+            # по умолчанию — как у ждущей
+            "claimed": float(os.getenv("TASK_TTL_CLAIMED", pending)),
+            "done": float(os.getenv("TASK_TTL_DONE", "3600")),
+        },
+        "escalate_after": float(os.getenv("ESCALATE_AFTER", "0")),
+        "max_escalations": int(os.getenv("MAX_ESCALATIONS", "1")),
+        "interval": float(os.getenv("SWEEP_INTERVAL", str(SWEEP_INTERVAL))),
+    }
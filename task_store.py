@@ -0,0 +1,596 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from enum import StrEnum
+
+# === Хранилище заявок ===
+# Заявка — запись Task (user_id, user_name, direction, user_msg_id, state, ...).
+# state: "pending" — ждёт оператора, "claimed" — оператор взял заявку,
+# "done" — ворота открыты, ждём «Спасибо», "ignored" — заявка отклонена.
+# operator_msgs — [(chat_id, message_id), ...] копии заявки у операторов
+# (MessageRefs, в JSON — [[chat_id, message_id], ...]).
+# Чтение всегда идёт из памяти: get() — это прямой dict.get, как и раньше
+# с глобальным tasks = {}. Изменения делаются только через create/update/pop,
+# чтобы постоянное хранилище могло их записать и чтобы индексы
+# по клиенту и оператору оставались согласованными.
+# Изменения (next_id, create, update, transition, claim, pop) — корутины:
+# общему хранилищу кластера нужно ждать блокировку записи вне цикла событий.
+# У хранилищ в памяти внутри них нет await, и цикл они не уступают.
+#
+# id заявки — возрастающее целое из next_id() (короткое в callback_data,
+# см. callbacks.py); заявки со старыми uuid-строками из базы работают как раньше.
+
+FLUSH_INTERVAL = 0.05  # сек, как часто сбрасываем накопленные изменения в SQLite
+FLUSH_BATCH = 500      # сбрасываем сразу, если накопилось столько изменений
+ID_GAP = 10000         # после перезапуска SqliteTaskStore пропускает столько id:
+                       # выданные, но не успевшие записаться, не достанутся новым заявкам
+WRITE_TIMEOUT = 5      # сек, SharedTaskStore: ожидание блокировки записи (в потоке, не в цикле)
+READ_TIMEOUT = 0.05    # сек, чтения в WAL блокировку почти никогда не ждут
+
+
+class State(StrEnum):
+    # Равно своей строке: task["state"] == "pending", в JSON — "pending"
+    PENDING = "pending"
+    CLAIMED = "claimed"
+    DONE = "done"
+    IGNORED = "ignored"
+
+
+class MessageRefs(array):
+    # Пары (chat_id, message_id) подряд в одном массиве int64: у трёх копий
+    # заявки ~130 байт вместо ~470 у списка списков с отдельными int.
+    # Обход и распаковка — по парам, как у прежнего списка; + [(chat, msg)] — новый массив
+    __slots__ = ()
+
+    def __new__(cls, pairs=()):
+        return super().__new__(cls, "q", [value for pair in pairs for value in pair])
+
+    def __iter__(self):
+        values = array.__iter__(self)
+        return zip(values, values)
+
+    def __add__(self, pairs):
+        return MessageRefs([*self, *pairs])
+
+    def to_list(self) -> list:
+        return [list(pair) for pair in self]
+
+
+class Task:
+    # Запись заявки на __slots__: 216 байт при любом наборе полей, у dict —
+    # 272 байта до 10 ключей и 464 после (адресная заявка, напоминания).
+    # Снаружи ведёт себя как прежний dict: task["state"], task.get("repeats", 0),
+    # setdefault, update; незаданное поле — как отсутствующий ключ.
+    # Поля, которых нет в __slots__, записать нельзя (KeyError) — новое поле
+    # сначала добавляется сюда.
+    __slots__ = ("user_id", "user_name", "direction", "state", "state_at", "created_at", "trace_id",
+                 "user_msg_id", "thank_msg_id", "operator_msgs", "msgs", "operator_id", "operator_name",
+                 "auto", "rule", "repeats", "refreshed_at", "assigned_to", "assigned_at", "tried",
+                 "escalated_at", "escalations", "operator_done_msg_id")
+
+    def __init__(self, fields=()):
+        self.update(fields)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key == "state":
+            value = State(value)
+        elif key == "direction" and value is not None:
+            value = sys.intern(value)  # направлений единицы — строка одна на все заявки
+        elif key in ("operator_msgs", "msgs") and value is not None:
+            value = MessageRefs(value)
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def setdefault(self, key, default=None):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            self[key] = default
+            return self[key]
+
+    def update(self, fields=(), **more):
+        for key, value in (fields.items() if hasattr(fields, "items") else fields):
+            self[key] = value
+        for key, value in more.items():
+            self[key] = value
+
+    def to_dict(self) -> dict:
+        result = {}
+        for key in self.__slots__:
+            value = getattr(self, key, self)
+            if value is not self:
+                result[key] = value.to_list() if type(value) is MessageRefs else value
+        return result
+
+    def __repr__(self):
+        return f"Task({self.to_dict()!r})"
+
+
+def _new_task(fields: dict) -> Task:
+    task = Task(fields)
+    task.setdefault("created_at", time.time())
+    task.setdefault("state", State.PENDING)
+    task.setdefault("state_at", task["created_at"])
+    return task
+
+
+def _task_id(value):
+    # id из TEXT-колонки: цифры — новый целый id, иначе старый uuid
+    return int(value) if value.isdigit() else value
+
+
+def _index_add(index: dict, key, task_id):
+    # dict вместо list: порядок вставки сохраняется, удаление за O(1)
+    bucket = index.get(key)
+    if bucket is None:
+        bucket = index[key] = {}
+    bucket[task_id] = None
+
+
+def _index_remove(index: dict, key, task_id):
+    bucket = index.get(key)
+    if bucket is None:
+        return
+    bucket.pop(task_id, None)
+    if not bucket:
+        del index[key]
+
+
+# Индексы по клиенту и оператору: почти у всех одна открытая заявка, а
+# dict на одну запись — 224 байта. Одиночный id лежит в индексе как есть,
+# dict появляется со второй заявкой (id — int или str, не dict).
+def _small_add(index: dict, key, task_id):
+    bucket = index.get(key)
+    if bucket is None:
+        index[key] = task_id
+    elif type(bucket) is dict:
+        bucket[task_id] = None
+    elif bucket != task_id:
+        index[key] = {bucket: None, task_id: None}
+
+
+def _small_remove(index: dict, key, task_id):
+    bucket = index.get(key)
+    if type(bucket) is dict:
+        bucket.pop(task_id, None)
+        if len(bucket) == 1:
+            index[key] = next(iter(bucket))
+    elif bucket == task_id:
+        del index[key]
+
+
+def _small_ids(bucket) -> list:
+    if bucket is None:
+        return []
+    return list(bucket) if type(bucket) is dict else [bucket]
+
+
+class MemoryTaskStore:
+    def __init__(self):
+        self.tasks: dict[int, Task] = {}
+        # Быстрый путь: без обёрток, тот же dict.get
+        self.get = self.tasks.get
+        # Вторичные индексы: user_id / operator_id -> task_id или {task_id: None} в порядке создания
+        self.by_user: dict[int, int | dict[int, None]] = {}
+        self.by_operator: dict[int, int | dict[int, None]] = {}
+        # state -> {task_id: None} в порядке перехода в состояние (самые старые первыми)
+        self.by_state: dict[str, dict[int, None]] = {}
+        # Заявки в памяти не переживают перезапуск, и id начинаются заново —
+        # подпись кнопок получает соль процесса, чтобы старые кнопки не совпали с новыми заявками
+        self.last_id = 0
+        self.key_salt = os.urandom(8)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self.tasks
+
+    def items(self):
+        return self.tasks.items()
+
+    async def next_id(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def _add(self, task_id, task: Task):
+        self.tasks[task_id] = task
+        _small_add(self.by_user, task["user_id"], task_id)
+        _index_add(self.by_state, task["state"], task_id)
+        if task.get("operator_id") is not None:
+            _small_add(self.by_operator, task["operator_id"], task_id)
+
+    async def create(self, task_id, fields: dict) -> Task:
+        task = _new_task(fields)
+        self._add(task_id, task)
+        self._persist(task_id, task)
+        return task
+
+    async def update(self, task_id, **fields) -> Task | None:
+        return self._update(task_id, fields)
+
+    def _update(self, task_id, fields: dict) -> Task | None:
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        if "operator_id" in fields and fields["operator_id"] != task.get("operator_id"):
+            if task.get("operator_id") is not None:
+                _small_remove(self.by_operator, task["operator_id"], task_id)
+            if fields["operator_id"] is not None:
+                _small_add(self.by_operator, fields["operator_id"], task_id)
+        if "state" in fields and fields["state"] != task["state"]:
+            _index_remove(self.by_state, task["state"], task_id)
+            _index_add(self.by_state, fields["state"], task_id)
+            fields.setdefault("state_at", time.time())
+        task.update(fields)
+        self._persist(task_id, task)
+        return task
+
+    async def pop(self, task_id, default=None):
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return default
+        _small_remove(self.by_user, task["user_id"], task_id)
+        _index_remove(self.by_state, task["state"], task_id)
+        if task.get("operator_id") is not None:
+            _small_remove(self.by_operator, task["operator_id"], task_id)
+        self._persist(task_id, None)
+        return task
+
+    async def transition(self, task_id, from_state: str, to_state: str, **fields) -> Task | None:
+        # Атомарная смена состояния (compare-and-set): между проверкой и записью
+        # нет await, поэтому из двух одновременных нажатий пройдёт только одно
+        task = self.tasks.get(task_id)
+        if task is None or task["state"] != from_state:
+            return None
+        fields["state"] = to_state
+        return self._update(task_id, fields)
+
+    async def claim(self, task_id, operator_id: int, operator_name: str) -> Task | None:
+        return await self.transition(task_id, State.PENDING, State.CLAIMED,
+                                     operator_id=operator_id, operator_name=operator_name)
+
+    # === Запросы по индексам ===
+    def user_tasks(self, user_id: int) -> list:
+        return _small_ids(self.by_user.get(user_id))
+
+    def latest_for_user(self, user_id: int):
+        bucket = self.by_user.get(user_id)
+        return next(reversed(bucket)) if type(bucket) is dict else bucket
+
+    def operator_tasks(self, operator_id: int) -> list:
+        return _small_ids(self.by_operator.get(operator_id))
+
+    def count(self, state: str) -> int:
+        return len(self.by_state.get(state, ()))
+
+    def oldest(self, state: str):
+        # Заявки в состоянии state, начиная с самой давней.
+        # Во время обхода хранилище менять нельзя — сначала соберите id.
+        tasks = self.tasks
+        for task_id in self.by_state.get(state, ()):
+            yield task_id, tasks[task_id]
+
+    def _persist(self, task_id, task: Task | None):
+        pass
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SqliteTaskStore(MemoryTaskStore):
+    # Копия в памяти + фоновая пакетная запись в SQLite (WAL).
+    # Запись идёт в отдельном потоке, цикл событий не блокируется.
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+        self.key_salt = b""  # заявки и id переживают перезапуск — кнопки тоже
+        self.dirty: dict = {}  # task_id -> Task | None
+        self.wakeup = asyncio.Event()
+        self.writer: asyncio.Task | None = None
+        self.closing = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS task_ids (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+        conn.commit()
+        return conn
+
+    def _load(self) -> tuple[dict, int]:
+        rows = self.conn.execute("SELECT id, data FROM tasks").fetchall()
+        row = self.conn.execute("SELECT last_id FROM task_ids WHERE name = 'tasks'").fetchone()
+        return {_task_id(task_id): json.loads(data) for task_id, data in rows}, row[0] if row else 0
+
+    def _persist(self, task_id, task: Task | None):
+        # Несколько изменений одной заявки между сбросами схлопываются в одно
+        self.dirty[task_id] = task
+        if len(self.dirty) >= FLUSH_BATCH:
+            self.wakeup.set()
+
+    def _write(self, batch: list, last_id: int):
+        now = time.time()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO task_ids (name, last_id) VALUES ('tasks', ?)", (last_id,))
+            for task_id, data in batch:
+                if data is None:
+                    self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                else:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO tasks (id, data, updated_at) VALUES (?, ?, ?)",
+                        (task_id, data, now)
+                    )
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, {}
+        # Сериализуем здесь: заявки меняются только в цикле событий
+        batch = [
+            (task_id, None if task is None else json.dumps(task.to_dict(), ensure_ascii=False))
+            for task_id, task in dirty.items()
+        ]
+        try:
+            await asyncio.to_thread(self._write, batch, self.last_id)
+        except Exception as e:
+            print(f"[LOG] Ошибка записи заявок в {self.path}: {e}")
+            # Не теряем изменения: вернём их, если новее ничего не пришло
+            for task_id, task in dirty.items():
+                self.dirty.setdefault(task_id, task)
+
+    async def _writer_loop(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        self.conn = await asyncio.to_thread(self._connect)
+        loaded, last_id = await asyncio.to_thread(self._load)
+        # Порядок по created_at, чтобы индексы клиентов были упорядочены как до перезапуска
+        for task_id, fields in sorted(loaded.items(), key=lambda item: item[1].get("created_at", 0)):
+            task = Task(fields)
+            task.setdefault("state", State.PENDING)
+            self._add(task_id, task)
+        # by_state — в порядке перехода в состояние: на нём держится обход sweeper
+        for state, bucket in self.by_state.items():
+            self.by_state[state] = dict.fromkeys(sorted(bucket, key=lambda task_id: self.tasks[task_id]["state_at"]))
+        last_id = max([last_id, *(task_id for task_id in loaded if isinstance(task_id, int))])
+        self.last_id = last_id + ID_GAP if last_id else 0
+        self.writer = asyncio.create_task(self._writer_loop())
+        print(f"[LOG] Восстановлено заявок из {self.path}: {len(loaded)}")
+
+    async def close(self):
+        # Даём писателю закончить текущий пакет, затем сбрасываем остаток
+        self.closing = True
+        self.wakeup.set()
+        if self.writer:
+            await self.writer
+            self.writer = None
+        await self.flush()
+        if self.conn:
+            await asyncio.to_thread(self.conn.close)
+            self.conn = None
+
+
+class SharedTaskStore:
+    # Общий файл SQLite для нескольких процессов (кластерный режим).
+    # Ничего не кэшируется: каждое чтение и изменение идёт в базу, поэтому
+    # заявку, созданную одним процессом, может закрыть любой другой.
+    # Смена состояния — compare-and-set внутри BEGIN IMMEDIATE: из двух
+    # процессов, одновременно забирающих заявку, пройдёт только один.
+    # Чтения точечные, по индексам локального файла (десятки микросекунд), и
+    # в WAL не ждут пишущих — они выполняются прямо в цикле событий, как и у
+    # MemoryTaskStore. Изменения ждут блокировку записи, которую держит другой
+    # процесс (или его checkpoint с fsync), — они идут в потоке через
+    # asyncio.to_thread, на своём соединении и по одному за раз.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: sqlite3.Connection | None = None        # чтения, в цикле событий
+        self.write_conn: sqlite3.Connection | None = None  # изменения, в потоке
+        self.write_lock = asyncio.Lock()
+        self.key_salt = b""
+
+    def _connect(self):
+        # Схему создаёт пишущее соединение, читающее открывается после
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=WRITE_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_tasks ("
+            " id TEXT PRIMARY KEY,"
+            " user_id INTEGER NOT NULL,"
+            " operator_id INTEGER,"
+            " state TEXT NOT NULL,"
+            " state_at REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS shared_tasks_user ON shared_tasks (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS shared_tasks_operator ON shared_tasks (operator_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS shared_tasks_state ON shared_tasks (state, state_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS task_ids (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+        reader = sqlite3.connect(self.path, isolation_level=None, timeout=READ_TIMEOUT, check_same_thread=False)
+        reader.execute("PRAGMA query_only=ON")
+        self.write_conn, self.conn = conn, reader
+
+    def _ensure(self) -> sqlite3.Connection:
+        if self.conn is None:
+            self._connect()
+        return self.conn
+
+    async def _write(self, func, *args):
+        # В потоке: ожидание чужой блокировки записи не останавливает цикл событий
+        self._ensure()
+        async with self.write_lock:
+            return await asyncio.to_thread(func, *args)
+
+    def _next_id(self) -> int:
+        # Один счётчик на все процессы; UPSERT атомарен без явной транзакции
+        return self.write_conn.execute(
+            "INSERT INTO task_ids (name, last_id) VALUES ('shared_tasks', 1)"
+            " ON CONFLICT (name) DO UPDATE SET last_id = last_id + 1 RETURNING last_id"
+        ).fetchone()[0]
+
+    async def next_id(self) -> int:
+        return await self._write(self._next_id)
+
+    def _write_row(self, task_id, task: Task):
+        self.write_conn.execute(
+            "INSERT OR REPLACE INTO shared_tasks (id, user_id, operator_id, state, state_at, data)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (task_id, task["user_id"], task.get("operator_id"), task["state"], task["state_at"],
+             json.dumps(task.to_dict(), ensure_ascii=False))
+        )
+
+    def get(self, task_id, default=None):
+        row = self._ensure().execute("SELECT data FROM shared_tasks WHERE id = ?", (task_id,)).fetchone()
+        return Task(json.loads(row[0])) if row else default
+
+    def __len__(self):
+        return self._ensure().execute("SELECT count(*) FROM shared_tasks").fetchone()[0]
+
+    def __contains__(self, task_id):
+        return self.get(task_id) is not None
+
+    def items(self):
+        rows = self._ensure().execute("SELECT id, data FROM shared_tasks ORDER BY rowid").fetchall()
+        return [(_task_id(task_id), Task(json.loads(data))) for task_id, data in rows]
+
+    async def create(self, task_id, fields: dict) -> Task:
+        task = _new_task(fields)
+        await self._write(self._write_row, task_id, task)
+        return task
+
+    def _modify(self, task_id, change) -> Task | None:
+        # Чтение и запись под одной блокировкой записи: между ними никто не вклинится
+        conn = self.write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM shared_tasks WHERE id = ?", (task_id,)).fetchone()
+            task = Task(json.loads(row[0])) if row else None
+            if task is None or not change(task):
+                conn.execute("ROLLBACK")
+                return None
+            self._write_row(task_id, task)
+            conn.execute("COMMIT")
+            return task
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def update(self, task_id, **fields) -> Task | None:
+        def change(task):
+            if "state" in fields and fields["state"] != task["state"]:
+                fields.setdefault("state_at", time.time())
+            task.update(fields)
+            return True
+        return await self._write(self._modify, task_id, change)
+
+    async def transition(self, task_id, from_state: str, to_state: str, **fields) -> Task | None:
+        def change(task):
+            if task["state"] != from_state:
+                return False
+            task.update(fields, state=to_state, state_at=fields.get("state_at", time.time()))
+            return True
+        return await self._write(self._modify, task_id, change)
+
+    async def claim(self, task_id, operator_id: int, operator_name: str) -> Task | None:
+        return await self.transition(task_id, State.PENDING, State.CLAIMED,
+                                     operator_id=operator_id, operator_name=operator_name)
+
+    def _delete(self, task_id):
+        # DELETE ... RETURNING: заявку получит только тот процесс, который её удалил
+        return self.write_conn.execute("DELETE FROM shared_tasks WHERE id = ? RETURNING data", (task_id,)).fetchone()
+
+    async def pop(self, task_id, default=None):
+        row = await self._write(self._delete, task_id)
+        return Task(json.loads(row[0])) if row else default
+
+    def _ids(self, sql: str, *args) -> list:
+        return [_task_id(row[0]) for row in self._ensure().execute(sql, args)]
+
+    def user_tasks(self, user_id: int) -> list:
+        return self._ids("SELECT id FROM shared_tasks WHERE user_id = ? ORDER BY rowid", user_id)
+
+    def latest_for_user(self, user_id: int):
+        ids = self._ids("SELECT id FROM shared_tasks WHERE user_id = ? ORDER BY rowid DESC LIMIT 1", user_id)
+        return ids[0] if ids else None
+
+    def operator_tasks(self, operator_id: int) -> list:
+        return self._ids("SELECT id FROM shared_tasks WHERE operator_id = ? ORDER BY rowid", operator_id)
+
+    def count(self, state: str) -> int:
+        return self._ensure().execute("SELECT count(*) FROM shared_tasks WHERE state = ?", (state,)).fetchone()[0]
+
+    @property
+    def by_state(self) -> dict[str, list]:
+        result: dict[str, list] = {}
+        for state, task_id in self._ensure().execute("SELECT state, id FROM shared_tasks"):
+            result.setdefault(state, []).append(_task_id(task_id))
+        return result
+
+    def oldest(self, state: str):
+        # Снимок: хранилище можно менять во время обхода
+        rows = self._ensure().execute(
+            "SELECT id, data FROM shared_tasks WHERE state = ? ORDER BY state_at", (state,)
+        ).fetchall()
+        for task_id, data in rows:
+            yield _task_id(task_id), Task(json.loads(data))
+
+    async def start(self):
+        await asyncio.to_thread(self._connect)
+        print(f"[LOG] Общее хранилище заявок {self.path}: {len(self)} заявок")
+
+    async def close(self):
+        async with self.write_lock:
+            for conn in (self.conn, self.write_conn):
+                if conn:
+                    await asyncio.to_thread(conn.close)
+            self.conn = self.write_conn = None
+
+
+def create_task_store(kind: str | None = None, path: str | None = None) -> MemoryTaskStore:
+    # TASK_STORE=memory (по умолчанию), sqlite или shared (общий для процессов
+    # кластера файл); путь к базе — TASK_DB
+    kind = (kind or os.getenv("TASK_STORE", "memory")).lower()
+    if kind == "sqlite":
+        return SqliteTaskStore(path or os.getenv("TASK_DB", "tasks.db"))
+    if kind == "shared":
+        return SharedTaskStore(path or os.getenv("TASK_DB", "tasks.db"))
+    if kind != "memory":
+        raise ValueError(f"Неизвестный TASK_STORE: {kind}")
+    return MemoryTaskStore()
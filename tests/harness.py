@@ -0,0 +1,61 @@
+import asyncio
+import importlib
+import sys
+from contextlib import asynccontextmanager
+
+from fake_gate import FakeGate
+from fake_telegram import FakeTelegram
+
+# Бот целиком на заглушках Bot API и платы реле. gate_bot_rev2 читает
+# настройки при импорте, поэтому модуль импортируется заново на каждый запуск.
+
+OPERATORS = (1000, 1001)
+
+
+@asynccontextmanager
+async def running_bot(monkeypatch, tmp_path, **env):
+    fake = FakeTelegram(latency=0.01)
+    board = FakeGate(latency=0.05)
+    settings = {
+        "BOT_TOKEN": "123456:test", "TELEGRAM_API_URL": await fake.start(),
+        "GATE_URL": await board.start(), "GATE_MODE": "on_done",
+        "OPERATORS": ",".join(map(str, OPERATORS)), "TASK_STORE": "memory", "TASK_DB": str(tmp_path / "tasks.db"),
+        "GATES_FILE": "", "ROSTER_FILE": "", "CATCHUP": "0", "CLUSTER_WORKERS": "0", "METRICS_PORT": "0",
+        "TRACE_FILE": "", "JOURNAL_DIR": str(tmp_path / "journal"), "CLEANUP_DELAY": "0.1",
+    }
+    for name, value in {**settings, **env}.items():
+        monkeypatch.setenv(name, value)
+    sys.modules.pop("gate_bot_rev2", None)
+    app = importlib.import_module("gate_bot_rev2")
+    gate = app.gates[0]
+    app.jobs.start()
+    app.scheduler.start()
+    await gate.start()
+    polling = asyncio.create_task(app.dp.start_polling(gate.bot, handle_signals=False, polling_timeout=1,
+                                                       handle_as_tasks=False))
+    try:
+        yield app, gate, fake, board
+    finally:
+        await app.dp.stop_polling()
+        await polling
+        await app.scheduler.close()
+        await app.jobs.close()
+        await gate.close()
+        await app.session.close()
+        await fake.stop()
+        await board.stop()
+        sys.modules.pop("gate_bot_rev2", None)
+
+
+async def wait(future, timeout: float = 5):
+    return await asyncio.wait_for(future, timeout)
+
+
+def sent_to(chat_id: int, text: str):
+    # Предикат для fake.wait_for: сообщение в чат chat_id с text в тексте
+    return lambda method, params: (method == "sendMessage" and params["chat_id"] == str(chat_id)
+                                   and text in params.get("text", ""))
+
+
+def button(message: dict, row: int = 0, column: int = 0) -> str:
+    return message["reply_markup"]["inline_keyboard"][row][column]["callback_data"]
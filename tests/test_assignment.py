@@ -0,0 +1,50 @@
+import asyncio
+
+from assignment import Assigner
+from harness import OPERATORS, button, running_bot, sent_to, wait
+
+# Адресное распределение: взятая заявка держит нагрузку оператора до
+# закрытия; заявка, вернувшаяся в ожидание после сбоя ворот, снова назначается
+
+CLIENT = 5000
+
+
+def test_claimed_task_keeps_load():
+    async def run():
+        assigner = Assigner(OPERATORS)
+        first = assigner.pick()
+        assigner.assign(1, first)
+        assigner.claimed(1, first)
+        busy = assigner.pick()  # первый открывает ворота — следующая заявка второму
+        assigner.assign(2, busy)
+        assigner.claimed(2, busy)
+        assigner.finished(1)
+        free = assigner.pick()
+        assigner.finished(1)  # повторное закрытие нагрузку не уводит в минус
+        return first, busy, free, dict(assigner.load)
+
+    first, busy, free, load = asyncio.run(run())
+    assert busy != first
+    assert free == first
+    assert load == {first: 0, busy: 1}
+
+
+def test_reassigned_after_failed_open(monkeypatch, tmp_path):
+    async def run():
+        async with running_bot(monkeypatch, tmp_path, ASSIGN_MODE="targeted") as (app, gate, fake, board):
+            board.fail_rate = 1.0  # реле не срабатывает
+            first = fake.wait_for(sent_to(OPERATORS[0], "просит открыть"))
+            fake.push_message(CLIENT, "1")
+            copy = (await wait(first))[2]
+            warned = fake.wait_for(sent_to(OPERATORS[0], "не открыт"))
+            second = fake.wait_for(sent_to(OPERATORS[1], "просит открыть"))
+            fake.push_callback(OPERATORS[0], button(copy), copy)
+            await wait(warned)
+            await wait(second)  # не ждёт ни таймаута, ни повторного «Сделано»
+            task_id, task = next(iter(gate.tasks.items()))
+            return task, gate.assigner.assigned.get(task_id), dict(gate.assigner.load)
+
+    task, entry, load = asyncio.run(run())
+    assert task["state"] == "pending"
+    assert entry is not None and entry[0] == OPERATORS[1]
+    assert load == {OPERATORS[0]: 0, OPERATORS[1]: 1}
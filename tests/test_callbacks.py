@@ -0,0 +1,103 @@
+import asyncio
+import uuid
+
+import pytest
+
+from callbacks import CallbackCodec, base36, task_ref
+from harness import OPERATORS, button, running_bot, sent_to, wait
+from task_store import SqliteTaskStore
+
+# Подпись кнопок заявки и приём кнопок старого формата "done:<uuid>"
+
+TOKEN = "123456:test"
+LEGACY_ID = str(uuid.UUID(int=7, version=4))
+CLIENT = 5000
+
+
+@pytest.mark.parametrize("action", ["done", "ignore", "thank"])
+@pytest.mark.parametrize("task_id", [1, 35, 36, 71, 10 ** 9])
+def test_round_trip(action, task_id):
+    codec = CallbackCodec(TOKEN)
+    data = codec.encode(action, task_id)
+    assert ":" not in data and len(data) <= 64  # лимит callback_data
+    assert codec.decode(data) == (action, task_id)
+
+
+def test_forged_buttons_rejected():
+    codec = CallbackCodec(TOKEN, b"salt")
+    data = codec.encode("thank", 71)
+    signature = data[-8:]
+    flipped = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+    assert codec.decode(data[:-8] + flipped) is None
+    assert codec.decode("t" + base36(72) + signature) is None  # чужая заявка с той же подписью
+    assert codec.decode("d" + data[1:]) is None                # другое действие
+    assert CallbackCodec("654321:other", b"salt").decode(data) is None
+    assert CallbackCodec(TOKEN, b"other").decode(data) is None  # прошлый запуск с хранилищем в памяти
+    assert CallbackCodec(TOKEN, b"salt").decode(data) == ("thank", 71)
+
+
+def test_legacy_buttons():
+    codec = CallbackCodec(TOKEN)
+    assert codec.encode("thank", LEGACY_ID) == f"thank:{LEGACY_ID}"
+    assert codec.decode(f"done:{LEGACY_ID}") == ("done", LEGACY_ID)
+    for data in ("done:5", f"open:{LEGACY_ID}", "", None, "x", "d1"):
+        assert codec.decode(data) is None
+
+
+def test_task_ref():
+    codec = CallbackCodec(TOKEN)
+    assert task_ref(codec.encode("done", 71)) == "1z"
+    assert task_ref(f"thank:{LEGACY_ID}") == LEGACY_ID
+    assert task_ref("x") is None and task_ref(None) is None
+
+
+def test_forged_thank_does_not_close_task(monkeypatch, tmp_path):
+    async def run():
+        async with running_bot(monkeypatch, tmp_path) as (app, gate, fake, board):
+            announced = fake.wait_for(sent_to(OPERATORS[0], "просит открыть"))
+            fake.push_message(CLIENT, "1")
+            copy = (await wait(announced))[2]
+            opened = fake.wait_for(sent_to(CLIENT, "открыты"))
+            fake.push_callback(OPERATORS[0], button(copy), copy)
+            thank_msg = (await wait(opened))[2]
+            task_id = gate.callbacks.decode(button(thank_msg))[1]
+
+            # Другой клиент подставляет номер заявки без подписи
+            stale = fake.wait_for(lambda m, p: m == "answerCallbackQuery" and "устарела" in p.get("text", ""))
+            fake.push_callback(6000, "t" + base36(task_id) + "AAAAAAAA", thank_msg)
+            await wait(stale)
+            still_open = gate.tasks.get(task_id)
+
+            closed = fake.wait_for(sent_to(OPERATORS[0], "Спасибо"))
+            fake.push_callback(CLIENT, button(thank_msg), thank_msg)
+            await wait(closed)
+            return still_open, gate.tasks.get(task_id)
+
+    still_open, after_thanks = asyncio.run(run())
+    assert still_open is not None and still_open["state"] == "done"
+    assert after_thanks is None
+
+
+def test_legacy_task_after_upgrade(monkeypatch, tmp_path):
+    # Заявка с uuid из базы до обновления: старые кнопки по-прежнему работают
+    async def run():
+        store = SqliteTaskStore(str(tmp_path / "tasks.db"))
+        await store.start()
+        await store.create(LEGACY_ID, {"user_id": CLIENT, "user_name": f"user{CLIENT}", "direction": "въезд",
+                                       "operator_msgs": []})
+        await store.close()
+        async with running_bot(monkeypatch, tmp_path, TASK_STORE="sqlite") as (app, gate, fake, board):
+            copy = {"message_id": 1, "date": 0, "chat": {"id": OPERATORS[0], "type": "private"}, "text": "x"}
+            opened = fake.wait_for(sent_to(CLIENT, "открыты"))
+            fake.push_callback(OPERATORS[0], f"done:{LEGACY_ID}", copy)
+            thank_msg = (await wait(opened))[2]
+            thank = button(thank_msg)
+            closed = fake.wait_for(sent_to(OPERATORS[0], "Спасибо"))
+            fake.push_callback(CLIENT, thank, thank_msg)
+            await wait(closed)
+            return thank, len(board.pulses), gate.tasks.get(LEGACY_ID)
+
+    thank, pulses, task = asyncio.run(run())
+    assert thank == f"thank:{LEGACY_ID}"
+    assert pulses == 1
+    assert task is None
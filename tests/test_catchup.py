@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+from catchup import OffsetStore
+
+# offset.json: записи схлопываются, при остановке сохраняется последнее
+
+
+def test_offsets_flushed_in_batches(tmp_path):
+    path = tmp_path / "offset.json"
+
+    async def run():
+        offsets = OffsetStore(str(path), flush_interval=60)
+        offsets.start()
+        for update_id in range(1, 1001):
+            offsets.begin(update_id)
+            offsets.finish(update_id)
+        await asyncio.sleep(0)
+        written_early = path.exists()
+        await offsets.close()
+        return written_early, offsets.offset
+
+    written_early, offset = asyncio.run(run())
+    assert not written_early
+    assert offset == 1000
+    assert json.loads(path.read_text()) == {"offset": 1000, "done": []}
+    assert OffsetStore(str(path)).offset == 1000
+
+
+def test_out_of_order_updates_survive_restart(tmp_path):
+    path = tmp_path / "offset.json"
+
+    async def run():
+        offsets = OffsetStore(str(path))
+        for update_id in (1, 2, 3):
+            offsets.begin(update_id)
+        offsets.finish(1)
+        offsets.finish(3)  # 2 ещё в обработке
+        await offsets.flush()
+
+    asyncio.run(run())
+    restored = OffsetStore(str(path))
+    assert restored.offset == 1
+    assert restored.seen(3) and not restored.seen(2)
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from harness import OPERATORS, button, running_bot, sent_to, wait
+
+# Два оператора одновременно жмут «Сделано»: заявку берёт один, ворота
+# открываются один раз, второму — «уже взял»
+
+CLIENT = 5000
+
+
+async def run_race(monkeypatch, tmp_path, store: str):
+    async with running_bot(monkeypatch, tmp_path, TASK_STORE=store) as (app, gate, fake, board):
+        announced = [fake.wait_for(sent_to(op, "просит открыть")) for op in OPERATORS]
+        fake.push_message(CLIENT, "1")
+        copies = [(await wait(future))[2] for future in announced]
+        opened = fake.wait_for(sent_to(CLIENT, "открыты"))
+        for op, copy in zip(OPERATORS, copies):
+            fake.push_callback(op, button(copy), copy)
+        await wait(opened)
+        await asyncio.sleep(0.3)  # второе нажатие и правки копий успевают дойти
+        return fake, board, [task for _, task in gate.tasks.items()]
+
+
+@pytest.mark.parametrize("store", ["memory", "shared"])
+def test_one_operator_wins(monkeypatch, tmp_path, store):
+    fake, board, tasks = asyncio.run(run_race(monkeypatch, tmp_path, store))
+    task, = tasks
+    assert task["state"] == "done"
+    assert task["operator_id"] in OPERATORS
+    assert len(board.pulses) == 1
+    opened = [p for _, m, p in fake.calls if m == "sendMessage" and "открыты" in p.get("text", "")]
+    assert len(opened) == 1
+    refused = [p for _, m, p in fake.calls if m == "answerCallbackQuery" and "уже взял" in p.get("text", "")]
+    assert len(refused) == 1
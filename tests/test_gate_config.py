@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from gate_config import load_gate_configs
+from task_store import SqliteTaskStore
+
+# Несколько ворот из GATES_FILE: у каждых своё имя, база заявок и offset
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    monkeypatch.setenv("BOT_TOKEN", "1:env")
+    monkeypatch.setenv("TASK_DB", str(tmp_path / "t.db"))
+    monkeypatch.setenv("OFFSET_FILE", str(tmp_path / "offset.json"))
+    monkeypatch.delenv("GATE_NAME", raising=False)
+    return tmp_path
+
+
+def write_gates(path, entries):
+    path.write_text(json.dumps({"gates": entries}), encoding="utf-8")
+    return str(path)
+
+
+def test_gates_do_not_share_files(env):
+    path = write_gates(env / "gates.json", [
+        {"name": "north", "token": "1:A", "operators": [1]},
+        {"name": "south", "token": "2:B", "operators": [2]},
+    ])
+    north, south = load_gate_configs(path)
+    assert north["task_db"] == str(env / "t-north.db")
+    assert south["task_db"] == str(env / "t-south.db")
+    assert north["offset_file"] == str(env / "offset-north.json")
+    assert south["offset_file"] == str(env / "offset-south.json")
+
+
+def test_unnamed_gates_get_unique_names(env):
+    path = write_gates(env / "gates.json", [{"token": "1:A"}, {"token": "2:B"}])
+    assert [c["name"] for c in load_gate_configs(path)] == ["gate1", "gate2"]
+
+
+def test_explicit_files_are_kept(env):
+    path = write_gates(env / "gates.json", [{"name": "north", "token": "1:A", "task_db": "n.db"}])
+    assert load_gate_configs(path)[0]["task_db"] == "n.db"
+
+
+def test_duplicate_files_rejected(env):
+    path = write_gates(env / "gates.json", [
+        {"name": "north", "token": "1:A", "task_db": "same.db"},
+        {"name": "south", "token": "2:B", "task_db": "same.db"},
+    ])
+    with pytest.raises(ValueError):
+        load_gate_configs(path)
+
+
+def test_single_gate_keeps_env_files(env):
+    config, = load_gate_configs("")
+    assert config["name"] == "main"
+    assert config["task_db"] == str(env / "t.db")
+
+
+def test_gate_stores_are_separate(env):
+    # Раньше обе ворот открывали t.db: одинаковые id и чужие заявки после перезапуска
+    path = write_gates(env / "gates.json", [{"name": "north", "token": "1:A"}, {"name": "south", "token": "2:B"}])
+    north, south = load_gate_configs(path)
+
+    async def run():
+        for config, user_id in ((north, 1), (south, 2)):
+            store = SqliteTaskStore(config["task_db"])
+            await store.start()
+            await store.create(await store.next_id(), {"user_id": user_id, "user_name": "u", "direction": "въезд"})
+            await store.close()
+        store = SqliteTaskStore(north["task_db"])
+        await store.start()
+        users = [task["user_id"] for _, task in store.items()]
+        await store.close()
+        return users
+
+    assert asyncio.run(run()) == [1]
@@ -0,0 +1,73 @@
+import asyncio
+
+from fake_gate import FakeGate
+from gate_controller import GateController
+
+# Протокол с платой реле на заглушке fake_gate: ответы, таймауты и повторы
+
+
+async def run_open(gate: FakeGate, timeout: float = 0.5, settle: float = 0.0):
+    url = await gate.start()
+    controller = GateController(url, timeout=timeout, retries=1, health_interval=60)
+    controller.start()
+    try:
+        result = await controller.open("въезд")
+        await asyncio.sleep(settle)  # запоздавшие ответы и повторы успевают дойти до платы
+        return result, controller.stats()
+    finally:
+        await controller.close()
+        await gate.stop()
+
+
+def test_open_ok():
+    gate = FakeGate(latency=0.01)
+    result, stats = asyncio.run(run_open(gate))
+    assert result is True
+    assert stats["opened"] == 1
+    assert [(relay, ms) for _, relay, ms in gate.pulses] == [(1, 1000)]
+
+
+def test_open_refused():
+    gate = FakeGate(latency=0.01, fail_rate=1.0)
+    result, stats = asyncio.run(run_open(gate))
+    assert result is False
+    assert stats["failed"] == 1
+    assert gate.pulses == []
+
+
+def test_timed_out_open_is_not_repeated():
+    # Плата отвечает позже таймаута: реле сработало, но ответа бот не дождался
+    gate = FakeGate(latency=0.3)
+    result, stats = asyncio.run(run_open(gate, timeout=0.25, settle=0.5))
+    assert result is None
+    assert stats["unknown"] == 1 and stats["failed"] == 0
+    assert len(gate.pulses) == 1
+    assert gate.commands == 1
+
+
+def test_unreachable_board_is_failure():
+    async def run():
+        controller = GateController("tcp://127.0.0.1:1", timeout=0.1, retries=1, health_interval=60)
+        controller.start()
+        try:
+            return await controller.open("въезд")
+        finally:
+            await controller.close()
+
+    assert asyncio.run(run()) is False
+
+
+def test_unknown_direction():
+    gate = FakeGate(latency=0.01)
+
+    async def run():
+        url = await gate.start()
+        controller = GateController(url, timeout=0.5, health_interval=60)
+        try:
+            return await controller.open("калитка")
+        finally:
+            await controller.close()
+            await gate.stop()
+
+    assert asyncio.run(run()) is False
+    assert gate.commands == 0
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from journal import Journal
+
+# Кластер: /stats в любом процессе видит заявки всех процессов; недописанная
+# строка соседа попадает в сводку, когда её допишут
+
+
+def test_stats_merge_cluster_workers(tmp_path):
+    root = str(tmp_path)
+
+    async def run():
+        workers = [Journal(str(tmp_path / f"worker{n}"), cluster_root=root) for n in range(3)]
+        for journal in workers:
+            await journal.open()
+        for n, journal in enumerate(workers):
+            for task_id in range(n + 1):
+                journal.record("created", "gate", task_id, {"direction": "въезд"})
+            await journal.flush()
+        with open(workers[2].segment, "a", encoding="utf-8") as f:
+            f.write(f'[{time.time():.3f},"created","gate",9,')  # worker2 пишет строку прямо сейчас
+        await workers[0].refresh()
+        partial = workers[0].rollups.summary("gate")["total"].counts["created"]
+        with open(workers[2].segment, "a", encoding="utf-8") as f:
+            f.write('"въезд",null,null,null]\n')
+        await workers[0].refresh()
+        await workers[0].refresh()  # повторное чтение не считает строки дважды
+        merged = workers[0].rollups.summary("gate")["total"].counts["created"]
+
+        restarted = Journal(str(tmp_path / "worker0"), cluster_root=root)
+        await restarted.open()
+        after_restart = restarted.rollups.records
+        for journal in workers + [restarted]:
+            await journal.close()
+        return partial, merged, after_restart
+
+    partial, merged, after_restart = asyncio.run(run())
+    assert partial == 1 + 2 + 3
+    assert merged == 7
+    assert after_restart == 7
@@ -0,0 +1,32 @@
+import asyncio
+
+from harness import OPERATORS, button, running_bot, sent_to, wait
+
+# /my: состояние заявки клиента — ждёт, открывается, выполнена
+
+CLIENT = 5000
+
+
+def test_my_shows_state(monkeypatch, tmp_path):
+    async def run():
+        async with running_bot(monkeypatch, tmp_path) as (app, gate, fake, board):
+            board.latency = 0.5  # плата отвечает медленно: заявка успевает побыть взятой
+            announced = fake.wait_for(sent_to(OPERATORS[0], "просит открыть"))
+            fake.push_message(CLIENT, "1")
+            copy = (await wait(announced))[2]
+            answers = []
+            for step in ("pending", "claimed", "done"):
+                if step == "claimed":
+                    fake.push_callback(OPERATORS[0], button(copy), copy)
+                    await asyncio.sleep(0.2)
+                if step == "done":
+                    await wait(fake.wait_for(sent_to(CLIENT, "открыты")))
+                reply = fake.wait_for(sent_to(CLIENT, "Активные заявки"))
+                fake.push_message(CLIENT, "/my")
+                answers.append((await wait(reply))[1]["text"])
+            return answers
+
+    pending, claimed, done = asyncio.run(run())
+    assert "ожидает оператора" in pending
+    assert "оператор открывает" in claimed
+    assert "ждёт «Спасибо»" in done
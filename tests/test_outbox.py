@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from outbox import LOW, URGENT, Outbox
+
+# Исходящая очередь: в чат сразу, после 429 — пауза чата и порядок по приоритету
+
+
+def retry_after(seconds: int) -> TelegramRetryAfter:
+    return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Too Many Requests", seconds)
+
+
+def test_sends_without_pacing():
+    async def run():
+        outbox = Outbox(None)
+        sent = []
+
+        async def send_message(n):
+            sent.append(n)
+            return n
+
+        started = time.monotonic()
+        await asyncio.gather(*(outbox.call(1000, send_message, n) for n in range(5)))
+        return sent, time.monotonic() - started
+
+    sent, elapsed = asyncio.run(run())
+    assert sorted(sent) == list(range(5))
+    assert elapsed < 0.1  # пять сообщений в один чат — без ожидания по 1 с
+
+
+def test_urgent_goes_first_after_429():
+    async def run():
+        outbox = Outbox(None)
+        order = []
+        limited = [True]
+
+        async def send_message(name):
+            if limited[0]:
+                limited[0] = False
+                raise retry_after(1)
+            order.append(name)
+            return name
+
+        thanks = asyncio.create_task(outbox.call(1000, send_message, "thanks", priority=LOW))
+        await asyncio.sleep(0.05)  # «Спасибо» получило 429, чат на паузе
+        reminder = asyncio.create_task(outbox.call(1000, send_message, "reminder", priority=LOW))
+        await asyncio.sleep(0)
+        request = asyncio.create_task(outbox.call(1000, send_message, "request", priority=URGENT))
+        await asyncio.gather(thanks, reminder, request)
+        return order
+
+    assert asyncio.run(run()) == ["request", "thanks", "reminder"]
+
+
+def test_429_on_last_attempt_is_reported_without_waiting():
+    async def run():
+        outbox = Outbox(None, max_attempts=1)
+
+        async def send_message():
+            raise retry_after(30)
+
+        started = time.monotonic()
+        result = await outbox.call(1000, send_message)
+        return result, time.monotonic() - started, outbox.stats()
+
+    result, elapsed, stats = asyncio.run(run())
+    assert result is None
+    assert elapsed < 1
+    assert stats["dropped"] == 1
@@ -0,0 +1,54 @@
+import asyncio
+import json
+from datetime import datetime
+
+from harness import OPERATORS, running_bot, sent_to, wait
+from rules import RuleEngine
+
+# Правила автодопуска: квота возвращается, если ворота не открылись;
+# файл с повторяющимися именами правил не загружается
+
+DIRECTIONS = ("въезд", "выезд")
+NOW = datetime(2026, 10, 19, 12, 0)
+CLIENT = 5000
+
+
+def write_rules(path, rules: list):
+    path.write_text(json.dumps({"rules": rules}, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_refund_returns_quota(tmp_path):
+    path = write_rules(tmp_path / "rules.json", [{"name": "жильцы", "users": [1], "daily_quota": 1}])
+    engine = RuleEngine(path, DIRECTIONS, audit_path=None)
+    assert engine.decide(1, "въезд", NOW) == "жильцы"
+    engine.refund(1, "въезд", "жильцы")  # плата не ответила
+    assert engine.decide(1, "въезд", NOW) == "жильцы"
+    assert engine.decide(1, "въезд", NOW) is None  # а вот теперь квота исчерпана
+    assert engine.stats()["approved"] == 1 and engine.stats()["rejected"] == 2
+
+
+def test_duplicate_rule_names_rejected(tmp_path):
+    path = write_rules(tmp_path / "rules.json", [
+        {"name": "жильцы", "users": [1], "daily_quota": 1},
+        {"name": "жильцы", "users": [2], "daily_quota": 1},
+    ])
+    engine = RuleEngine(path, DIRECTIONS, audit_path=None)
+    assert engine.rules_count == 0
+    assert engine.decide(1, "въезд", NOW) is None
+
+
+def test_failed_auto_open_refunds_quota(monkeypatch, tmp_path):
+    path = write_rules(tmp_path / "rules.json", [{"name": "жильцы", "users": [CLIENT], "daily_quota": 1}])
+
+    async def run():
+        async with running_bot(monkeypatch, tmp_path, RULES_FILE=path, RULES_AUDIT="") as (app, gate, fake, board):
+            board.fail_rate = 1.0  # реле не срабатывает
+            announced = fake.wait_for(sent_to(OPERATORS[0], "просит открыть"))
+            fake.push_message(CLIENT, "1")
+            await wait(announced)  # заявка ушла операторам
+            return gate.rules.stats()
+
+    stats = asyncio.run(run())
+    assert stats["today"] == {(CLIENT, "жильцы"): 0}
+    assert stats["approved"] == 0 and stats["rejected"] == 1
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from sweeper import TaskSweeper
+from task_store import MemoryTaskStore, SharedTaskStore
+
+# Эскалация: заявку, которую взяли или убрали, пока напоминали о предыдущих,
+# не трогаем и повторно операторам не шлём
+
+
+def new_task(user_id: int, created_at: float) -> dict:
+    return {"user_id": user_id, "user_name": f"user{user_id}", "direction": "въезд", "operator_msgs": [],
+            "created_at": created_at, "state": "pending", "state_at": created_at}
+
+
+@pytest.mark.parametrize("kind", ["memory", "shared"])
+def test_task_claimed_during_escalation(tmp_path, kind):
+    async def run():
+        store = MemoryTaskStore() if kind == "memory" else SharedTaskStore(str(tmp_path / "shared.db"))
+        await store.start()
+        ids = []
+        for user_id in range(3):
+            ids.append(await store.next_id())
+            await store.create(ids[-1], new_task(user_id, 100.0 + user_id))
+        escalated = []
+
+        async def on_escalate(task_id, task):
+            escalated.append(task_id)
+            if task_id == ids[0]:
+                # Пока уходит первое напоминание, вторую заявку берут, третью убирают
+                await store.claim(ids[1], 1000, "op")
+                await store.pop(ids[2])
+
+        sweeper = TaskSweeper(store, {}, escalate_after=60, on_escalate=on_escalate)
+        await sweeper._escalate(1000.0)
+        result = ids, escalated, sweeper.escalated, store.get(ids[0]), store.get(ids[1])
+        await store.close()
+        return result
+
+    ids, escalated, count, first, second = asyncio.run(run())
+    assert escalated == [ids[0]] and count == 1
+    assert first["escalations"] == 1 and first["state_at"] == 100.0
+    assert second["state"] == "claimed" and second.get("escalations") is None
@@ -0,0 +1,121 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+
+from task_store import SharedTaskStore, SqliteTaskStore
+
+# Восстановление SqliteTaskStore; общее хранилище кластера: заявку забирает
+# один процесс, а изменения ждут чужую блокировку записи вне цикла событий
+
+
+def new_task(user_id: int) -> dict:
+    return {"user_id": user_id, "user_name": f"user{user_id}", "direction": "въезд", "operator_msgs": []}
+
+
+def test_restart_keeps_index_order(tmp_path):
+    # Клиент: заявки по созданию; состояния: по времени перехода (на этом стоит обход sweeper)
+    path = str(tmp_path / "tasks.db")
+
+    async def run():
+        store = SqliteTaskStore(path)
+        await store.start()
+        first, second = await store.next_id(), await store.next_id()
+        await store.create(first, {**new_task(1), "created_at": 100.0, "state": "done", "state_at": 300.0})
+        await store.create(second, {**new_task(1), "created_at": 200.0, "state": "done", "state_at": 250.0})
+        await store.close()
+        store = SqliteTaskStore(path)
+        await store.start()
+        result = store.user_tasks(1), store.latest_for_user(1), [task_id for task_id, _ in store.oldest("done")]
+        await store.close()
+        return (first, second), result
+
+    (first, second), (user_tasks, latest, done) = asyncio.run(run())
+    assert user_tasks == [first, second]
+    assert latest == second
+    assert done == [second, first]
+
+
+def test_shared_write_waits_off_loop(tmp_path):
+    path = str(tmp_path / "shared.db")
+
+    async def run():
+        store = SharedTaskStore(path)
+        await store.start()
+        task_id = await store.next_id()
+        await store.create(task_id, new_task(1))
+
+        # Другой процесс держит блокировку записи 0.3 с
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.3, other.execute, "COMMIT")
+
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        started = time.monotonic()
+        claimed = await store.claim(task_id, 1000, "op")
+        waited = time.monotonic() - started
+        ticking.cancel()
+        other.close()
+        # Пока claim ждал, цикл работал: чтения и другие хендлеры не стояли
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        state = store.get(task_id)["state"]
+        await store.close()
+        return claimed, waited, max(gaps), state
+
+    claimed, waited, gap, state = asyncio.run(run())
+    assert claimed is not None and state == "claimed"
+    assert waited >= 0.25
+    assert gap < 0.1
+
+
+def claim_all(path: str, operator_id: int, ids: list, start, results):
+    # Процесс кластера: пытается забрать все заявки подряд
+    async def run():
+        store = SharedTaskStore(path)
+        await store.start()
+        won = [task_id for task_id in ids if await store.claim(task_id, operator_id, f"op{operator_id}")]
+        await store.close()
+        return won
+    start.wait()
+    results.put((operator_id, asyncio.run(run())))
+
+
+def test_shared_claim_is_atomic_across_processes(tmp_path):
+    path = str(tmp_path / "shared.db")
+
+    async def create():
+        store = SharedTaskStore(path)
+        await store.start()
+        ids = []
+        for user_id in range(50):
+            ids.append(await store.next_id())
+            await store.create(ids[-1], new_task(user_id))
+        await store.close()
+        return ids
+
+    ids = asyncio.run(create())
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=claim_all, args=(path, 1000 + n, ids, start, results)) for n in range(3)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    won = dict(results.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    claimed = sorted(task_id for task_ids in won.values() for task_id in task_ids)
+    assert claimed == ids  # каждая заявка взята ровно одним процессом
+    store = SharedTaskStore(path)
+    owners = {task_id: task["operator_id"] for task_id, task in store.items()}
+    asyncio.run(store.close())
+    assert all(task_id in won[owners[task_id]] for task_id in ids)
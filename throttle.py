@@ -0,0 +1,95 @@
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from intents import REQUEST
+
+# === Защита от повторных нажатий ===
+# Внешний middleware на dp.message, срабатывает до хендлеров и до любых
+# вызовов Bot API:
+# - повторное нажатие, пока заявка клиента в ту же сторону ещё ждёт
+#   оператора, не создаёт новую заявку, а освежает старую;
+# - больше REQUEST_LIMIT нажатий за REQUEST_WINDOW секунд молча отбрасываются.
+# Запросом считается апдейт с намерением REQUEST в data["intent"]
+# (его кладёт middleware разбора текста, см. intents.py).
+
+REQUEST_WINDOW = 60   # сек
+REQUEST_LIMIT = 5     # нажатий в окне
+MAX_TRACKED_USERS = 10000
+
+
+class RequestThrottleMiddleware(BaseMiddleware):
+    def __init__(self, store, window: float = REQUEST_WINDOW,
+                 limit: int = REQUEST_LIMIT, on_coalesce=None):
+        self.store = store
+        self.window = window
+        self.limit = limit
+        self.on_coalesce = on_coalesce  # (task_id, task) — например, обновить табло
+        self.history: dict[int, deque] = {}
+
+        self.coalesced = 0
+        self.rejected = 0
+
+    def _allow(self, user_id: int, now: float) -> bool:
+        # Скользящее окно: храним время последних нажатий клиента
+        hits = self.history.get(user_id)
+        if hits is None:
+            if len(self.history) >= MAX_TRACKED_USERS:
+                self._prune(now)
+            hits = self.history[user_id] = deque()
+        while hits and now - hits[0] > self.window:
+            hits.popleft()
+        if len(hits) >= self.limit:
+            return False
+        hits.append(now)
+        return True
+
+    def _prune(self, now: float):
+        for user_id in [u for u, hits in self.history.items() if not hits or now - hits[-1] > self.window]:
+            del self.history[user_id]
+
+    def _pending_task(self, user_id: int, direction: str):
+        for task_id in self.store.user_tasks(user_id):
+            task = self.store.get(task_id)
+            if task["direction"] == direction and task["state"] == "pending":
+                return task_id, task
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        intent = data.get("intent")
+        if intent is None or intent.action != REQUEST or event.from_user is None:
+            return await handler(event, data)
+        direction = intent.arg
+
+        user_id = event.from_user.id
+        now = time.monotonic()
+        if not self._allow(user_id, now):
+            self.rejected += 1
+            return None
+
+        found = self._pending_task(user_id, direction)
+        if found:
+            task_id, task = found
+            # Место в очереди и таймеры заявки не меняются, только отметка о повторе
+            await self.store.update(task_id, repeats=task.get("repeats", 0) + 1, refreshed_at=time.time())
+            self.coalesced += 1
+            if self.on_coalesce:
+                self.on_coalesce(task_id, task)
+            return None
+        return await handler(event, data)
+
+
+def throttle_settings() -> dict:
+    return {
+        "window": float(os.getenv("REQUEST_WINDOW", str(REQUEST_WINDOW))),
+        "limit": int(os.getenv("REQUEST_LIMIT", str(REQUEST_LIMIT))),
+    }
@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import glob
+import json
+import os
+import random
+import time
+from collections import defaultdict, deque
+
+# === Трассировка заявок ===
+# У каждой заявки свой trace_id (хранится в заявке), и всё, что по ней
+# происходит, пишется спанами: хендлеры (запрос, «Сделано», «Спасибо»),
+# фоновые задания (с ожиданием в очереди), вызовы через outbox и каждая
+# попытка HTTP-запроса к Bot API, команды плате реле. По файлу потом видно,
+# где клиент ждал: в очереди, на медленном Telegram или у оператора.
+#
+# Текущий спан живёт в contextvar: дочерние спаны и задания, поставленные
+# из хендлера, попадают в тот же трейс сами. Спаны копятся в памяти и раз в
+# TRACE_FLUSH_INTERVAL пишутся в JSONL из отдельного потока; файл
+# ротируется по размеру. Поля — как у спанов OTLP/JSON (traceId, spanId,
+# parentSpanId, startTimeUnixNano, ...).
+#
+#   python tracing.py traces.jsonl* --top 10   # самые долгие заявки и разбивка по фазам
+
+TRACE_FILE = "traces.jsonl"
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 3
+TRACE_FLUSH_INTERVAL = 1.0   # сек
+MAX_BUFFER = 50000           # спанов в памяти; при переполнении старые теряются
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+
+
+def new_id(bits: int = 64) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent", "name", "start_ns", "started", "attrs")
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict):
+        self.trace_id = parent.trace_id if parent else new_id(128)
+        self.span_id = new_id()
+        self.parent = parent
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter_ns()
+        self.attrs = attrs
+
+
+class Tracer:
+    def __init__(self):
+        self.path: str | None = None  # None — трассировка выключена, спаны не пишутся
+        self.max_bytes = TRACE_MAX_BYTES
+        self.backups = TRACE_BACKUPS
+        self.flush_interval = TRACE_FLUSH_INTERVAL
+        self.buffer: deque = deque(maxlen=MAX_BUFFER)
+        self.flusher: asyncio.Task | None = None
+
+        self.written = 0
+        self.dropped = 0
+
+    def open(self, path: str, max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS,
+             flush_interval: float = TRACE_FLUSH_INTERVAL):
+        if not path:
+            return
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self._flush_loop())
+        print(f"[LOG] Трассировка заявок: {path}")
+
+    def emit(self, span: Span, end_ns: int, error: str | None = None):
+        if self.path is None:
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        # Кортеж, а не dict/JSON: сериализация — в потоке записи
+        self.buffer.append((span.trace_id, span.span_id, span.parent.span_id if span.parent else None,
+                            span.name, span.start_ns, end_ns, span.attrs, error))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer or self.path is None:
+            return
+        batch = list(self.buffer)
+        self.buffer.clear()
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except OSError as e:
+            self.dropped += len(batch)
+            print(f"[LOG] Не удалось записать трейсы в {self.path}: {e}")
+
+    def _write(self, batch: list):
+        lines = []
+        for trace_id, span_id, parent_id, name, start_ns, end_ns, attrs, error in batch:
+            record = {"traceId": trace_id, "spanId": span_id, "parentSpanId": parent_id, "name": name,
+                      "startTimeUnixNano": start_ns, "endTimeUnixNano": end_ns, "attributes": attrs}
+            if error:
+                record["status"] = {"code": "ERROR", "message": error}
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            size = f.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        # traces.jsonl -> traces.jsonl.1 -> ... -> traces.jsonl.N (старший удаляется)
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    async def close(self):
+        if self.flusher:
+            self.flusher.cancel()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+            self.flusher = None
+        await self.flush()
+
+
+tracer = Tracer()
+
+
+# === API для кода бота ===
+class SpanScope:
+    # Контекстный менеджер спана; классом, а не генератором — он на пути каждого вызова API
+    __slots__ = ("name", "attrs", "optional", "current", "token")
+
+    def __init__(self, name: str, attrs: dict, optional: bool):
+        self.name = name
+        self.attrs = attrs
+        self.optional = optional
+        self.current = None
+        self.token = None
+
+    def __enter__(self) -> Span | None:
+        parent = _current.get()
+        if tracer.path is None or (parent is None and self.optional):
+            return None
+        self.current = Span(self.name, parent, self.attrs)
+        self.token = _current.set(self.current)
+        return self.current
+
+    def __exit__(self, exc_type, exc, tb):
+        current = self.current
+        if current is None:
+            return
+        _current.reset(self.token)
+        tracer.emit(current, current.start_ns + time.perf_counter_ns() - current.started,
+                    exc_type.__name__ if exc_type else None)
+
+
+def span(name: str, **attrs) -> SpanScope:
+    return SpanScope(name, attrs, optional=False)
+
+
+def child(name: str, **attrs) -> SpanScope:
+    # Спан, только если уже идёт трейс: вызовы вне хендлеров и заданий
+    # (табло, getUpdates) не порождают одиночных трейсов
+    return SpanScope(name, attrs, optional=True)
+
+
+def traced(name: str | None = None):
+    # Декоратор корутины: весь вызов — один спан
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind(trace_id: str | None, **attrs) -> str | None:
+    # Привязывает текущий спан и его предков к трейсу заявки: хендлер узнаёт
+    # заявку уже после начала своего спана. Возвращает trace_id текущего трейса.
+    current = _current.get()
+    if current is None:
+        return trace_id
+    current.attrs.update(attrs)
+    if trace_id:
+        node = current
+        while node is not None:
+            node.trace_id = trace_id
+            node = node.parent
+    return current.trace_id
+
+
+# === Интеграция с aiogram ===
+class TraceMiddleware:
+    # Внутренний middleware dp.message/dp.callback_query: спан на хендлер
+    async def __call__(self, handler, event, data):
+        user = getattr(event, "from_user", None)
+        with span(data["handler"].callback.__name__, gate=data["gate"].name if "gate" in data else "",
+                  user_id=user.id if user else None):
+            return await handler(event, data)
+
+
+async def trace_session_middleware(make_request, bot, method):
+    # Каждая попытка HTTP-запроса — отдельный спан (повторы outbox видны как соседи)
+    with child(f"api {method.__api_method__}"):
+        return await make_request(bot, method)
+
+
+def setup_tracing(dp, session):
+    middleware = TraceMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    session.middleware(trace_session_middleware)
+
+
+def tracing_settings() -> dict:
+    path = os.getenv("TRACE_FILE", TRACE_FILE)
+    worker = os.getenv("CLUSTER_WORKER")
+    if path and worker is not None:
+        # В кластере у каждого процесса свой файл: ротация не конфликтует
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{worker}{ext}"
+    return {
+        "path": path,
+        "max_bytes": int(os.getenv("TRACE_MAX_BYTES", str(TRACE_MAX_BYTES))),
+        "backups": int(os.getenv("TRACE_BACKUPS", str(TRACE_BACKUPS))),
+        "flush_interval": float(os.getenv("TRACE_FLUSH_INTERVAL", str(TRACE_FLUSH_INTERVAL))),
+    }
+
+
+# === Отчёт по файлам трейсов ===
+# Фаза — промежуток от начала/конца одного спана до начала/конца другого
+PHASES = (
+    ("оповещение операторов", ("handle_request", "start"), ("announce_task", "end")),
+    ("ожидание оператора", ("announce_task", "end"), ("handle_operator_action", "start")),
+    ("открытие ворот", ("handle_operator_action", "start"), ("finish_done", "end")),
+    ("автооткрытие", ("handle_request", "start"), ("auto_open_task", "end")),
+    ("ожидание «Спасибо»", ("finish_done", "end"), ("handle_thank", "start")),
+    ("после «Спасибо»", ("handle_thank", "start"), ("finish_thanks", "end")),
+)
+TOTALS = ("Bot API", "лимиты и повторы", "очередь заданий")
+# Операторы и клиенты могут ответить текстом вместо кнопки
+ALIASES = {"handle_done_text": "handle_operator_action", "handle_thank_text": "handle_thank"}
+
+
+def load_traces(paths) -> dict:
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # недописанная строка при аварийной остановке
+                traces[record["traceId"]].append(record)
+    return traces
+
+
+def analyze(spans: list) -> dict:
+    # Первое вхождение каждого спана по имени: {имя: (начало, конец)}
+    marks = {}
+    for s in sorted(spans, key=lambda s: s["startTimeUnixNano"]):
+        marks.setdefault(ALIASES.get(s["name"], s["name"]), (s["startTimeUnixNano"], s["endTimeUnixNano"]))
+    phases = {}
+    for phase, (a_name, a_edge), (b_name, b_edge) in PHASES:
+        if a_name in marks and b_name in marks:
+            a = marks[a_name][0 if a_edge == "start" else 1]
+            b = marks[b_name][0 if b_edge == "start" else 1]
+            phases[phase] = max(0, b - a) / 1e9
+    # Итоги по видам работы внутри трейса
+    children = defaultdict(int)
+    for s in spans:
+        if s["name"].startswith("api "):
+            children[s["parentSpanId"]] += s["endTimeUnixNano"] - s["startTimeUnixNano"]
+    api = sum(s["endTimeUnixNano"] - s["startTimeUnixNano"] for s in spans if s["name"].startswith("api "))
+    limits = sum(s["endTimeUnixNano"] - s["startTimeUnixNano"] - children[s["spanId"]]
+                 for s in spans if s["name"].startswith("outbox "))
+    queued = sum(s["attributes"].get("wait_ms", 0) for s in spans if s["name"] == "job") / 1000
+    start = min(s["startTimeUnixNano"] for s in spans)
+    end = max(s["endTimeUnixNano"] for s in spans)
+    return {
+        "total": (end - start) / 1e9,
+        "start": start,
+        "phases": phases,
+        "Bot API": api / 1e9,
+        "лимиты и повторы": max(0, limits) / 1e9,
+        "очередь заданий": queued,
+        "api_calls": sum(1 for s in spans if s["name"].startswith("api ")),
+        "errors": [s["name"] for s in spans if s.get("status", {}).get("code") == "ERROR"],
+        "task": next((s["attributes"]["task_id"] for s in spans if "task_id" in s["attributes"]), None),
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def report(paths, top: int):
+    traces = load_traces(paths)
+    results = [analyze(spans) for spans in traces.values()]
+    results = [r for r in results if r["task"]]  # только трейсы заявок
+    if not results:
+        print("Трейсов заявок не найдено")
+        return
+    results.sort(key=lambda r: r["total"], reverse=True)
+    print(f"Заявок: {len(results)}. Самые долгие:\n")
+    for r in results[:top]:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["start"] / 1e9))
+        print(f"{r['total']:8.2f} с  заявка {r['task']}  {started}  вызовов API: {r['api_calls']}"
+              f"{'  ошибки: ' + ', '.join(r['errors']) if r['errors'] else ''}")
+        parts = [f"{name} {value:.2f}" for name, value in r["phases"].items()]
+        parts += [f"{key} {r[key]:.2f}" for key in TOTALS]
+        print("           " + ", ".join(parts))
+
+    print("\nРазбивка по фазам, с (Bot API, лимиты и очередь — сумма по вызовам заявки, параллельные складываются):")
+    print(f"  {'фаза':28}{'n':>6}{'p50':>9}{'p95':>9}{'max':>9}")
+    rows = [(phase, [r["phases"][phase] for r in results if phase in r["phases"]]) for phase, _, _ in PHASES]
+    rows += [(key, [r[key] for r in results]) for key in TOTALS]
+    for name, values in rows:
+        if values:
+            print(f"  {name:28}{len(values):>6}{percentile(values, 0.5):>9.2f}"
+                  f"{percentile(values, 0.95):>9.2f}{max(values):>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Самые долгие заявки и разбивка по фазам")
+    parser.add_argument("files", nargs="*", default=[TRACE_FILE], help="файлы трейсов (можно с ротацией)")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    files = [path for pattern in args.files for path in sorted(glob.glob(pattern))]
+    report(files, args.top)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import signal
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+# === Режим webhook ===
+# Telegram сам присылает обновления POST-запросом. Ответ 200 уходит сразу,
+# а обработка запускается фоном (handle_in_background) — Telegram не ждёт
+# наших запросов к Bot API. С background=False ответ уходит, когда
+# feed_update вернулся: так планировщик обновлений (scheduler.py) держит
+# ответ, пока его очередь полна, и Telegram придерживает следующие. Несколько экземпляров можно поставить за
+# балансировщиком: состояние при этом должно быть общим (TASK_STORE).
+#
+# Для локальной проверки достаточно не задавать WEBHOOK_URL и отправить
+# JSON объекта Update:
+#   curl -X POST localhost:8080/webhook \
+#        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \
+#        -H "Content-Type: application/json" -d @update.json
+
+SHUTDOWN_DRAIN_TIMEOUT = 10  # сек на обработку уже принятых обновлений
+
+
+def webhook_settings() -> dict:
+    return {
+        "url": os.getenv("WEBHOOK_URL", ""),  # внешний адрес, например https://gate.example.com
+        "path": os.getenv("WEBHOOK_PATH", "/webhook"),
+        "secret": os.getenv("WEBHOOK_SECRET") or None,
+        "host": os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        "port": int(os.getenv("WEBHOOK_PORT", "8080")),
+    }
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, path: str = "/webhook",
+                      secret: str | None = None, setup_app=None, background: bool = True) -> web.Application:
+    app = web.Application()
+    app["ready"] = False
+    handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=background)
+
+    async def healthz(request: web.Request) -> web.Response:
+        # Процесс жив и отвечает
+        return web.json_response({"status": "ok"})
+
+    async def readyz(request: web.Request) -> web.Response:
+        # Готов принимать обновления (хранилище поднято, webhook зарегистрирован)
+        if not request.app["ready"]:
+            return web.json_response({"status": "starting"}, status=503)
+        return web.json_response({"status": "ready"})
+
+    async def drain(app: web.Application):
+        # Перед закрытием сессии бота дорабатываем уже принятые обновления
+        app["ready"] = False
+        pending = set(handler._background_feed_update_tasks)
+        if pending:
+            print(f"[LOG] Дорабатываем обновлений: {len(pending)}")
+            await asyncio.wait(pending, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.on_shutdown.append(drain)
+    if setup_app:
+        setup_app(app)  # дополнительные маршруты, например /metrics
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def _wait_for_stop_signal():
+    # Работаем до SIGINT/SIGTERM (на Windows — до Ctrl+C)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await stop.wait()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, url: str = "", path: str = "/webhook",
+                      secret: str | None = None, host: str = "0.0.0.0", port: int = 8080,
+                      drop_pending_updates: bool = True, setup_app=None, background: bool = True):
+    app = build_webhook_app(dp, bot, path=path, secret=secret, setup_app=setup_app, background=background)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"[LOG] Webhook слушает {host}:{port}{path}")
+    try:
+        if url:
+            await bot.set_webhook(
+                url.rstrip("/") + path,
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=drop_pending_updates,
+            )
+            print(f"[LOG] Webhook зарегистрирован: {url.rstrip('/')}{path}")
+        app["ready"] = True
+        await _wait_for_stop_signal()
+    finally:
+        # Webhook не снимаем: остальные экземпляры за балансировщиком продолжают работу
+        await runner.cleanup()